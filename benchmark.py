@@ -1,18 +1,39 @@
 import argparse
 import gc
+import itertools
+import json
+import math
+import multiprocessing
+import platform
+import shutil
 import sqlite3
 import statistics
 import sys
+import tempfile
+import threading
 import time
 import timeit
 from collections.abc import Callable
+from collections.abc import Iterator
+from collections.abc import Sized
+from dataclasses import asdict
+from dataclasses import dataclass
+from datetime import UTC
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError
+from importlib.metadata import version
+from multiprocessing.synchronize import Barrier as BarrierType
 from pathlib import Path
 from queue import Queue
 from random import choice
 from string import ascii_lowercase
 from string import printable
+from typing import Any
 
+import litequeue
 from litequeue import LiteQueue
+from litequeue import MessageStatus
+from litequeue import ShardedLiteQueue
 
 
 def random_string(
@@ -100,6 +121,90 @@ def benchmark_completion(number: int, repeat: int) -> None:
     cleanup_database(database_path)
 
 
+def benchmark_startup(number: int, repeat: int) -> None:
+    database_path = Path("startup.sqlite3")
+    cleanup_database(database_path)
+    LiteQueue(filename=database_path).close()
+
+    def put_once() -> None:
+        queue = LiteQueue(filename=database_path)
+        queue.put(random_string(20))
+        queue.close()
+
+    def read_once() -> None:
+        queue = LiteQueue(filename=database_path)
+        queue.qsize()
+        queue.close()
+
+    benchmark("LiteQueue open, put and close", put_once, number, repeat)
+    benchmark("LiteQueue open, qsize and close", read_once, number, repeat)
+    cleanup_database(database_path)
+
+
+def benchmark_statement_cache(number: int, repeat: int) -> None:
+    database_path = Path("statement_cache.sqlite3")
+    cleanup_database(database_path)
+    writer = LiteQueue(filename=database_path)
+    message_id = writer.put(random_string(20)).message_id
+    writer.close()
+
+    cache_size = litequeue._READ_STATEMENT_CACHE_SIZE
+    for label, size in (("prepared once", cache_size), ("prepared per call", 0)):
+        # Pooled read connections read the cache size when they are opened.
+        litequeue._READ_STATEMENT_CACHE_SIZE = size
+        queue = LiteQueue(filename=database_path)
+        benchmark(
+            f"LiteQueue get ({label})",
+            lambda: queue.get(message_id),
+            number,
+            repeat,
+        )
+        benchmark(f"LiteQueue peek ({label})", queue.peek, number, repeat)
+        queue.close()
+
+    litequeue._READ_STATEMENT_CACHE_SIZE = cache_size
+    cleanup_database(database_path)
+
+
+def benchmark_list_failed(row_count: int) -> None:
+    database_path = Path("list_failed.sqlite3")
+    cleanup_database(database_path)
+    queue = LiteQueue(filename=database_path)
+    now = time.time_ns()
+    with queue.transaction():
+        queue.conn.executemany(
+            f"""
+            INSERT INTO {queue.table} (data, message_id, status, in_time, done_time)
+            VALUES (:data, :message_id, 3, :in_time, :done_time)
+            """,
+            (
+                {
+                    "data": random_string(20),
+                    "message_id": f"{index:032d}",
+                    "in_time": now,
+                    "done_time": now + index,
+                }
+                for index in range(row_count)
+            ),
+        )
+
+    listings: tuple[tuple[str, Callable[[], Sized]], ...] = (
+        ("list_failed() messages", lambda: list(queue.list_failed())),
+        ("list_failed(raw=True) rows", lambda: list(queue.list_failed(raw=True))),
+        ("message_batch(FAILED)", lambda: queue.message_batch(MessageStatus.FAILED)),
+    )
+    for label, list_failed in listings:
+        gc.collect()
+        start = time.perf_counter()
+        rows = list_failed()
+        duration = time.perf_counter() - start
+        print(f"LiteQueue {label}, {len(rows)} failed: {duration:.2f} s")
+        del rows
+
+    queue.close()
+    cleanup_database(database_path)
+
+
 def benchmark_pop_method(label: str, method_name: str, item_count: int) -> None:
     database_path = Path("pop_bench.sqlite3")
     cleanup_database(database_path)
@@ -127,6 +232,459 @@ def benchmark_pop_method(label: str, method_name: str, item_count: int) -> None:
     cleanup_database(database_path)
 
 
+def produce_sharded_puts(
+    filenames: list[Path],
+    producer_index: int,
+    item_count: int,
+    start_barrier: BarrierType,
+    results: "multiprocessing.Queue[tuple[float, float]]",
+) -> None:
+    queue = ShardedLiteQueue(filenames)
+    # Start each producer's round-robin on a different shard. Producers in
+    # lockstep would otherwise wait on the same write lock at every put.
+    queue._put_counter = itertools.count(producer_index)
+    payloads = [random_string(60) for _ in range(item_count)]
+    start_barrier.wait()
+    start = time.monotonic()
+    for payload in payloads:
+        queue.put(payload)
+    results.put((start, time.monotonic()))
+    queue.close()
+
+
+def benchmark_sharded_puts(shard_count: int, producers: int | None, item_count: int) -> None:
+    """Measure put throughput with producer processes writing to several shards."""
+    producer_count = producers or shard_count
+    directory = Path(tempfile.mkdtemp(prefix="sharded_bench"))
+    filenames = [directory / f"shard{index}.sqlite3" for index in range(shard_count)]
+    # Create the shards before timing so schema setup is not measured.
+    ShardedLiteQueue(filenames).close()
+
+    # Processes avoid the GIL, so SQLite's per-database write lock is the
+    # only shared resource, which is what sharding spreads out.
+    context = multiprocessing.get_context("spawn")
+    start_barrier = context.Barrier(producer_count)
+    results: multiprocessing.Queue[tuple[float, float]] = context.Queue()
+    items_per_producer = item_count // producer_count
+    processes = [
+        context.Process(
+            target=produce_sharded_puts,
+            args=(filenames, index, items_per_producer, start_barrier, results),
+        )
+        for index in range(producer_count)
+    ]
+    for process in processes:
+        process.start()
+    timings = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    duration = max(end for _, end in timings) - min(start for start, _ in timings)
+    total_items = items_per_producer * producer_count
+    print(
+        f"ShardedLiteQueue put ({shard_count} shards, {producer_count} producer "
+        f"processes): {duration:.3f} seconds for {total_items} messages, "
+        f"{total_items / duration:,.0f} operations/second"
+    )
+    shutil.rmtree(directory)
+
+
+# Operations each worker runs in a matrix scenario. "mixed" runs one producer
+# and one consumer per worker at the same time.
+MATRIX_SCENARIOS = {
+    "put": ("put",),
+    "pop_done": ("pop_done",),
+    "cycle": ("cycle",),
+    "mixed": ("put", "pop_done"),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class MatrixCase:
+    scenario: str
+    concurrency: str
+    workers: int
+    backlog: int
+    retained_done: int
+    payload_size: int
+    maxsize: bool
+
+    @property
+    def name(self) -> str:
+        return (
+            f"{self.scenario} {self.concurrency}={self.workers} "
+            f"backlog={self.backlog} done={self.retained_done} "
+            f"payload={self.payload_size} maxsize={'on' if self.maxsize else 'off'}"
+        )
+
+    @property
+    def roles(self) -> tuple[str, ...]:
+        return MATRIX_SCENARIOS[self.scenario] * self.workers
+
+
+def matrix_cases(args: argparse.Namespace) -> Iterator[MatrixCase]:
+    worker_counts = [("threads", count) for count in args.threads]
+    worker_counts += [("processes", count) for count in args.processes]
+    dimensions = itertools.product(
+        args.scenarios,
+        worker_counts,
+        args.backlogs,
+        args.retained_done,
+        args.payload_sizes,
+        [mode == "on" for mode in args.maxsize],
+    )
+    for scenario, (concurrency, workers), backlog, done, payload_size, maxsize in dimensions:
+        yield MatrixCase(
+            scenario=scenario,
+            concurrency=concurrency,
+            workers=workers,
+            backlog=backlog,
+            retained_done=done,
+            payload_size=payload_size,
+            maxsize=maxsize,
+        )
+
+
+def prefill_queue(queue: LiteQueue, ready: int, done: int, payload_size: int) -> None:
+    """Insert READY and DONE messages older than any message the case adds."""
+    now = time.time_ns()
+    data = random_string(payload_size)
+    rows = ((MessageStatus.DONE, done, 0, now), (MessageStatus.READY, ready, done, None))
+    with queue.transaction():
+        # The maxsize trigger counts the pending messages for every row it
+        # checks, which makes a large prefill quadratic.
+        if queue.maxsize is not None:
+            queue.conn.execute(f'DROP TRIGGER "maxsize_control_{queue.table_name}"')
+        for status, count, offset, done_time in rows:
+            if not count:
+                continue
+            queue.conn.execute(
+                f"""
+                WITH RECURSIVE sequence(value) AS (
+                  SELECT 0 UNION ALL SELECT value + 1 FROM sequence WHERE value + 1 < :count
+                )
+                INSERT INTO {queue.table} (data, message_id, status, in_time, done_time)
+                SELECT :data, printf('%032d', value + :offset), :status, :now, :done_time
+                FROM sequence
+                """,
+                {
+                    "count": count,
+                    "data": data,
+                    "offset": offset,
+                    "status": status.value,
+                    "now": now,
+                    "done_time": done_time,
+                },
+            )
+        if queue.maxsize is not None:
+            queue._install_maxsize_trigger(queue.maxsize)
+
+
+def run_matrix_operations(
+    queue: LiteQueue,
+    role: str,
+    payload: str,
+    count: int,
+) -> list[float]:
+    """Run `count` operations of `role` and return the latency of each."""
+    latencies = []
+    perf_counter = time.perf_counter
+    for _ in range(count):
+        start = perf_counter()
+        if role in {"put", "cycle"}:
+            queue.put(payload)
+        if role in {"pop_done", "cycle"}:
+            message = queue.pop()
+            assert message is not None
+            queue.done(message.message_id)
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def run_matrix_thread(
+    queue: LiteQueue,
+    role: str,
+    payload: str,
+    count: int,
+    start_barrier: threading.Barrier,
+    results: list[tuple[float, float, list[float]]],
+) -> None:
+    start_barrier.wait()
+    start = time.perf_counter()
+    latencies = run_matrix_operations(queue, role, payload, count)
+    results.append((start, time.perf_counter(), latencies))
+
+
+def run_matrix_process(
+    filename: Path,
+    role: str,
+    payload: str,
+    count: int,
+    start_barrier: BarrierType,
+    results: "multiprocessing.Queue[tuple[float, float, list[float]]]",
+) -> None:
+    queue = LiteQueue(filename=filename)
+    start_barrier.wait()
+    # perf_counter is system-wide on Linux and macOS, so the supervisor can
+    # compare the timestamps of several processes.
+    start = time.perf_counter()
+    latencies = run_matrix_operations(queue, role, payload, count)
+    results.put((start, time.perf_counter(), latencies))
+    queue.close()
+
+
+def run_matrix_case(case: MatrixCase, operations: int, directory: Path) -> dict[str, float]:
+    """Run one matrix case on a fresh database and summarize its latencies."""
+    filename = directory / "matrix.sqlite3"
+    cleanup_database(filename)
+    roles = case.roles
+    claims = operations * roles.count("pop_done")
+    # maxsize is set above the largest size the case reaches, so the trigger
+    # runs on every put without ever rejecting one.
+    maxsize = case.backlog + claims + operations * len(roles) + 1 if case.maxsize else None
+    queue = LiteQueue(filename=filename, maxsize=maxsize)
+    # Consumers claim from the backlog, which is topped up so that its depth
+    # does not fall below `backlog` while they run.
+    prefill_queue(queue, case.backlog + claims, case.retained_done, case.payload_size)
+    payload = random_string(case.payload_size)
+
+    timings: list[tuple[float, float, list[float]]] = []
+    gc.collect()
+    if case.concurrency == "threads":
+        thread_barrier = threading.Barrier(len(roles))
+        threads = [
+            threading.Thread(
+                target=run_matrix_thread,
+                args=(queue, role, payload, operations, thread_barrier, timings),
+            )
+            for role in roles
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        context = multiprocessing.get_context("spawn")
+        process_barrier = context.Barrier(len(roles))
+        results: multiprocessing.Queue[tuple[float, float, list[float]]] = context.Queue()
+        processes = [
+            context.Process(
+                target=run_matrix_process,
+                args=(filename, role, payload, operations, process_barrier, results),
+            )
+            for role in roles
+        ]
+        for process in processes:
+            process.start()
+        timings = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    queue.close()
+    cleanup_database(filename)
+
+    duration = max(end for _, end, _ in timings) - min(start for start, _, _ in timings)
+    latencies = [latency for _, _, worker_latencies in timings for latency in worker_latencies]
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "operations": len(latencies),
+        "seconds": duration,
+        "ops_per_second": len(latencies) / duration,
+        "p50_us": percentiles[49] * 1_000_000,
+        "p99_us": percentiles[98] * 1_000_000,
+    }
+
+
+def environment_metadata() -> dict[str, object]:
+    try:
+        litequeue_version = version("litequeue")
+    except PackageNotFoundError:
+        litequeue_version = None
+    return {
+        "litequeue": litequeue_version,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "created": datetime.now(UTC).isoformat(timespec="seconds"),
+    }
+
+
+def benchmark_matrix(args: argparse.Namespace) -> list[dict[str, object]]:
+    """Run every matrix case `case_repeat` times and print one line per case."""
+    directory = Path(tempfile.mkdtemp(prefix="matrix_bench"))
+    results: list[dict[str, object]] = []
+    try:
+        for case in matrix_cases(args):
+            runs = [
+                run_matrix_case(case, args.operations, directory)
+                for _ in range(args.case_repeat)
+            ]
+            throughputs = [run["ops_per_second"] for run in runs]
+            result = {
+                "name": case.name,
+                **asdict(case),
+                "operations": runs[0]["operations"],
+                "ops_per_second": statistics.mean(throughputs),
+                "ops_per_second_ci": confidence_interval(throughputs),
+                "p50_us": statistics.median(run["p50_us"] for run in runs),
+                "p99_us": statistics.median(run["p99_us"] for run in runs),
+                "runs": runs,
+            }
+            results.append(result)
+            print(
+                f"{case.name}: {result['ops_per_second']:,.0f} ± "
+                f"{result['ops_per_second_ci']:,.0f} operations/second, "
+                f"p50 {result['p50_us']:.1f} µs, p99 {result['p99_us']:.1f} µs"
+            )
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+# Matrix options stored in a JSON report. Comparing against the report runs
+# the same cases the same number of times.
+MATRIX_ARGUMENTS = (
+    "scenarios",
+    "threads",
+    "processes",
+    "backlogs",
+    "retained_done",
+    "payload_sizes",
+    "maxsize",
+    "operations",
+    "case_repeat",
+)
+
+# Two-sided 95% critical values of Student's t distribution for 1 to 30
+# degrees of freedom. More degrees of freedom use the normal distribution.
+T_CRITICAL_95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)  # fmt: skip
+
+
+def t_critical(degrees_of_freedom: float) -> float:
+    # Rounding down widens the interval rather than narrowing it.
+    index = int(degrees_of_freedom)
+    if index < 1:
+        return math.inf
+    if index > len(T_CRITICAL_95):
+        return 1.960
+    return T_CRITICAL_95[index - 1]
+
+
+def confidence_interval(values: list[float]) -> float:
+    """Return the half-width of the 95% confidence interval of the mean."""
+    if len(values) < 2:
+        return 0.0
+    return t_critical(len(values) - 1) * statistics.stdev(values) / math.sqrt(len(values))
+
+
+@dataclass(frozen=True, slots=True)
+class Comparison:
+    name: str
+    baseline: float
+    baseline_ci: float
+    current: float
+    current_ci: float
+    # Relative change of the mean throughput and the half-width of its 95%
+    # confidence interval.
+    change: float
+    change_ci: float
+    regressed: bool
+
+
+def compare_throughput(
+    name: str,
+    baseline: list[float],
+    current: list[float],
+    threshold: float,
+) -> Comparison:
+    """Compare two samples of throughputs with Welch's t interval."""
+    baseline_mean = statistics.mean(baseline)
+    current_mean = statistics.mean(current)
+    variances = [
+        statistics.variance(sample) / len(sample) if len(sample) > 1 else 0.0
+        for sample in (baseline, current)
+    ]
+    standard_error = math.sqrt(sum(variances))
+    if standard_error:
+        # Welch–Satterthwaite degrees of freedom.
+        degrees_of_freedom = sum(variances) ** 2 / sum(
+            variance**2 / (len(sample) - 1)
+            for variance, sample in zip(variances, (baseline, current), strict=True)
+            if variance
+        )
+        margin = t_critical(degrees_of_freedom) * standard_error
+    else:
+        margin = 0.0
+
+    change = (current_mean - baseline_mean) / baseline_mean
+    change_ci = margin / baseline_mean
+    return Comparison(
+        name=name,
+        baseline=baseline_mean,
+        baseline_ci=confidence_interval(baseline),
+        current=current_mean,
+        current_ci=confidence_interval(current),
+        change=change,
+        change_ci=change_ci,
+        # A slowdown counts when it exceeds the threshold and the interval
+        # rules out no change, so noisy cases do not fail the comparison.
+        regressed=change < -threshold and change + change_ci < 0,
+    )
+
+
+def compare_matrix(
+    baseline: list[dict[str, Any]],
+    current: list[dict[str, Any]],
+    threshold: float,
+) -> list[Comparison]:
+    baseline_runs = {
+        result["name"]: [run["ops_per_second"] for run in result["runs"]]
+        for result in baseline
+    }
+    return [
+        compare_throughput(
+            result["name"],
+            baseline_runs[result["name"]],
+            [run["ops_per_second"] for run in result["runs"]],
+            threshold,
+        )
+        for result in current
+        if result["name"] in baseline_runs
+    ]
+
+
+def display_comparisons(comparisons: list[Comparison], threshold: float) -> None:
+    width = max(len("benchmark"), *(len(comparison.name) for comparison in comparisons))
+    print(
+        f"{'benchmark':<{width}}  {'baseline ops/s':>20}  {'current ops/s':>20}  "
+        f"{'change':>16}"
+    )
+    for comparison in comparisons:
+        if comparison.regressed:
+            verdict = "REGRESSED"
+        elif comparison.change - comparison.change_ci > threshold:
+            verdict = "faster"
+        elif comparison.change + comparison.change_ci < 0:
+            verdict = "slower"
+        else:
+            verdict = ""
+        baseline = f"{comparison.baseline:,.0f} ± {comparison.baseline_ci:,.0f}"
+        current = f"{comparison.current:,.0f} ± {comparison.current_ci:,.0f}"
+        change = f"{comparison.change:+.1%} ± {comparison.change_ci:.1%}"
+        row = f"{comparison.name:<{width}}  {baseline:>20}  {current:>20}  {change:>16}  {verdict}"
+        print(row.rstrip())
+
+    regressions = sum(comparison.regressed for comparison in comparisons)
+    print(
+        f"{regressions} of {len(comparisons)} benchmarks regressed by more than "
+        f"{threshold:.0%} at 95% confidence"
+    )
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Benchmark litequeue against queue.Queue")
     parser.add_argument(
@@ -141,26 +699,178 @@ def parse_args() -> argparse.Namespace:
         default=7,
         help="Number of repeats. Default: %(default)s",
     )
+    parser.add_argument(
+        "--startup-number",
+        type=int,
+        default=500,
+        help="Queue opens per repeat in the startup benchmark. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--failed-rows",
+        type=int,
+        default=1_000_000,
+        help="Failed messages listed by the list_failed benchmark. Default: %(default)s",
+    )
     parser.add_argument(
         "--pop-items",
         type=int,
         default=8_000,
         help="Messages used for each pop implementation. Default: %(default)s",
     )
+    parser.add_argument(
+        "--producers",
+        type=int,
+        default=None,
+        help="Producer processes for the sharded put benchmark. Default: one per shard",
+    )
+    parser.add_argument(
+        "--shard-items",
+        type=int,
+        default=20_000,
+        help="Messages written in each sharded put benchmark. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Shard counts for the sharded put benchmark. Default: %(default)s",
+    )
+
+    matrix = parser.add_argument_group(
+        "matrix",
+        "Sweep concurrency, backlog depth, payload size and maxsize instead of "
+        "running the benchmarks above",
+    )
+    matrix.add_argument(
+        "--matrix",
+        action="store_true",
+        help="Run the benchmark matrix",
+    )
+    matrix.add_argument(
+        "--json",
+        type=Path,
+        default=None,
+        help="Write the matrix results to this JSON file",
+    )
+    matrix.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=list(MATRIX_SCENARIOS),
+        default=list(MATRIX_SCENARIOS),
+        help="Operations to measure. Default: %(default)s",
+    )
+    matrix.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=[1, 4],
+        help="Worker thread counts sharing one queue. Default: %(default)s",
+    )
+    matrix.add_argument(
+        "--processes",
+        type=int,
+        nargs="*",
+        default=[],
+        help="Worker process counts, each with its own queue. Default: none",
+    )
+    matrix.add_argument(
+        "--backlogs",
+        type=int,
+        nargs="+",
+        default=[1_000, 100_000],
+        help="Pending messages before each case, up to 10_000_000. Default: %(default)s",
+    )
+    matrix.add_argument(
+        "--retained-done",
+        type=int,
+        nargs="+",
+        default=[0, 100_000],
+        help="DONE messages kept in the table. Default: %(default)s",
+    )
+    matrix.add_argument(
+        "--payload-sizes",
+        type=int,
+        nargs="+",
+        default=[64, 4_096],
+        help="Message sizes in characters. Default: %(default)s",
+    )
+    matrix.add_argument(
+        "--maxsize",
+        nargs="+",
+        choices=["off", "on"],
+        default=["off", "on"],
+        help="Run without and with a maxsize limit. Default: %(default)s",
+    )
+    matrix.add_argument(
+        "--operations",
+        type=int,
+        default=1_000,
+        help="Operations run by each worker in a matrix case. Default: %(default)s",
+    )
+    matrix.add_argument(
+        "--case-repeat",
+        type=int,
+        default=5,
+        help="Runs of each matrix case. Default: %(default)s",
+    )
+    matrix.add_argument(
+        "--compare",
+        type=Path,
+        default=None,
+        metavar="BASELINE",
+        help=(
+            "Run the matrix of a JSON report written by --json and exit with "
+            "status 1 if a case is slower"
+        ),
+    )
+    matrix.add_argument(
+        "--threshold",
+        type=float,
+        default=10,
+        help="Throughput loss, in percent, that --compare reports. Default: %(default)s",
+    )
     return parser.parse_args()
 
 
 def main() -> int:
     args = parse_args()
     print(f"SQLite {sqlite3.sqlite_version}")
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())
+        for name, value in baseline["arguments"].items():
+            setattr(args, name, value)
+    if args.matrix or args.compare is not None:
+        results = benchmark_matrix(args)
+        if args.json is not None:
+            report = {
+                "environment": environment_metadata(),
+                "arguments": {name: getattr(args, name) for name in MATRIX_ARGUMENTS},
+                "results": results,
+            }
+            args.json.write_text(json.dumps(report, indent=2) + "\n")
+        if args.compare is None:
+            return 0
+
+        threshold = args.threshold / 100
+        comparisons = compare_matrix(baseline["results"], results, threshold)
+        print()
+        display_comparisons(comparisons, threshold)
+        return 1 if any(comparison.regressed for comparison in comparisons) else 0
+
     benchmark_puts(args.number, args.repeat)
     benchmark_completion(args.number, args.repeat)
+    benchmark_startup(args.startup_number, args.repeat)
+    benchmark_statement_cache(args.number, args.repeat)
+    benchmark_list_failed(args.failed_rows)
     benchmark_pop_method("LiteQueue pop with RETURNING", "_pop_returning", args.pop_items)
     benchmark_pop_method(
         "LiteQueue pop with transaction",
         "_pop_transaction",
         args.pop_items,
     )
+    for shard_count in args.shards:
+        benchmark_sharded_puts(shard_count, args.producers, args.shard_items)
     return 0
 
 
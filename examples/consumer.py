@@ -12,11 +12,13 @@ import time
 from pathlib import Path
 
 from litequeue import LiteQueue
+from litequeue import Message
 
 QUEUE_FILE = Path.cwd() / "tasks.sqlite3"
 IDLE_TIMEOUT_SECONDS = 3
 MAX_ATTEMPTS = 3
 FAILURE_RATE = 0.2
+WORKERS = 4
 
 
 def process_task(data: str) -> int:
@@ -31,42 +33,32 @@ def process_task(data: str) -> int:
     return task_number
 
 
+def handle(message: Message) -> None:
+    # consume() marks the message done when this returns and retries it when
+    # this raises. The queue moves it to FAILED after MAX_ATTEMPTS.
+    try:
+        task_number = process_task(message.data)
+    except Exception as error:
+        print(f"Attempt {message.attempts} of {message.message_id} failed: {error}")
+        raise
+
+    print(f"Completed task {task_number} on attempt {message.attempts}")
+
+
 def main() -> None:
-    queue = LiteQueue(filename=QUEUE_FILE)
-    attempts: dict[str, int] = {}
-    idle_since = time.monotonic()
+    queue = LiteQueue(filename=QUEUE_FILE, max_attempts=MAX_ATTEMPTS)
 
     try:
-        while time.monotonic() - idle_since < IDLE_TIMEOUT_SECONDS:
-            message = queue.pop()
-            if message is None:
-                time.sleep(0.1)
-                continue
-
-            idle_since = time.monotonic()
-            message_id = message.message_id
-            attempt = attempts.get(message_id, 0) + 1
-            attempts[message_id] = attempt
-
-            try:
-                task_number = process_task(message.data)
-            except Exception as error:
-                if attempt < MAX_ATTEMPTS:
-                    queue.retry(message_id)
-                    print(f"Retrying {message_id} after attempt {attempt}: {error}")
-                    continue
-
-                queue.mark_failed(message_id)
-                print(f"Failed {message_id} after {attempt} attempts: {error}")
-                continue
-
-            queue.done(message_id)
-            attempts.pop(message_id, None)
-            print(f"Completed task {task_number} on attempt {attempt}")
+        stats = queue.consume(
+            handle, workers=WORKERS, idle_timeout=IDLE_TIMEOUT_SECONDS
+        )
     finally:
         queue.close()
 
-    print("Queue stayed empty for 3 seconds; consumer stopped.")
+    print(
+        f"Queue stayed empty for {IDLE_TIMEOUT_SECONDS} seconds; consumer stopped "
+        f"after {stats.processed} tasks ({stats.messages_per_second:.1f}/s)."
+    )
 
 
 if __name__ == "__main__":
@@ -1,18 +1,38 @@
+import bisect
+import functools
+import itertools
+import math
 import os
 import pprint
 import re
 import sqlite3
 import threading
 import time
+import weakref
+import zlib
+from array import array
+from collections import deque
 from collections.abc import Callable
+from collections.abc import Collection
+from collections.abc import Iterable
 from collections.abc import Iterator
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from contextlib import contextmanager
 from dataclasses import dataclass
+from dataclasses import field
 from dataclasses import replace
 from enum import Enum
 from pathlib import Path
-from queue import Queue
 from typing import Any
+from typing import ClassVar
+from typing import Literal
+from typing import Protocol
+from typing import cast
+from typing import overload
 from uuid import UUID
 
 # Expose function used by uuid7() to get current time in nanoseconds
@@ -92,6 +112,7 @@ class MessageStatus(int, Enum):
     LOCKED = 1
     DONE = 2
     FAILED = 3
+    DELAYED = 4
 
 
 @dataclass(frozen=True, slots=True)
@@ -102,31 +123,287 @@ class Message:
     in_time: int
     lock_time: int | None
     done_time: int | None
+    available_at: int | None = None
+    attempts: int = 0
+    dedup_key: str | None = None
+    coalesce_key: str | None = None
+    partition_key: str | None = None
+    topic: str | None = None
 
 
-def _message_from_row(row: sqlite3.Row) -> Message:
-    """Convert a SQLite row into a typed message."""
+@dataclass(frozen=True, slots=True)
+class LogEntry:
+    offset: int
+    data: str
+    in_time: int
 
-    stored_status = row["status"]
-    try:
-        status = MessageStatus(stored_status)
-    except ValueError as error:
-        raise ValueError(f"Unknown message status: {stored_status!r}") from error
 
-    return Message(
-        data=row["data"],
-        message_id=row["message_id"],
-        status=status,
-        in_time=row["in_time"],
-        lock_time=row["lock_time"],
-        done_time=row["done_time"],
-    )
+@dataclass(slots=True)
+class _QueueStatements:
+    """SQL of the frequent operations of one queue table."""
+
+    insert: str
+    select_by_dedup_key: str
+    coalesce: str
+    select_pending_by_coalesce_key: str
+    promote_due_messages: str
+    lock_selected_message: str
+    release: str
+    peek: str
+    get: str
+    done: str
+    mark_failed: str
+    list_locked: str
+    list_failed: str
+    retry: str
+    next_due_time: str
+    qsize: str
+    empty: str
+    count_pending: str
+    batch: str
+    batch_by_status: str
+    stats_counts: str
+    stats_throughput: str
+    stats_percentiles: str
+    # Claim statements by number of topics, built on first use.
+    pop_returning: dict[int, str] = field(default_factory=dict)
+    pop_select: dict[int, str] = field(default_factory=dict)
+
+
+@dataclass(frozen=True, slots=True)
+class ConsumeStats:
+    processed: int
+    failed: int
+    released: int
+    elapsed_seconds: float
+
+    @property
+    def messages_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return (self.processed + self.failed) / self.elapsed_seconds
+
+
+@dataclass(frozen=True, slots=True)
+class QueueStats:
+    """
+    Timing of the messages that finished during a window of time.
+
+    Times are nanoseconds. `wait_time` runs from when a message became
+    available to its last claim, `processing_time` from that claim to
+    `done()`. Both map a percentile of `STATS_PERCENTILES` to its value and
+    are empty when no message finished. `throughput` counts the messages
+    done in each interval of the window, oldest first.
+    """
+
+    window_seconds: float
+    interval_seconds: float
+    done: int
+    failed: int
+    wait_time: dict[int, int]
+    processing_time: dict[int, int]
+    throughput: list[int]
+
+    @property
+    def failure_rate(self) -> float:
+        finished = self.done + self.failed
+        if not finished:
+            return 0.0
+        return self.failed / finished
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.done / self.window_seconds
+
+
+STATS_PERCENTILES = (50, 90, 95, 99)
+
+
+def _new_message_id() -> str:
+    return str(uuid7())
+
+
+# Message columns in the order of the Message fields. Queries select them
+# explicitly so rows can be unpacked by position, whatever the column order
+# of a table upgraded from an older version.
+_MESSAGE_COLUMNS = (
+    "data",
+    "message_id",
+    "status",
+    "in_time",
+    "lock_time",
+    "done_time",
+    "available_at",
+    "attempts",
+    "dedup_key",
+    "coalesce_key",
+    "partition_key",
+    "topic",
+)
+_MESSAGE_COLUMN_SQL = ", ".join(_MESSAGE_COLUMNS)
+# A message as returned by bulk reads with `raw=True`: the values of the
+# Message fields in order, with the status as its integer value.
+MessageRow = tuple[Any, ...]
+_MESSAGE_ID_INDEX = _MESSAGE_COLUMNS.index("message_id")
+_PARTITION_KEY_INDEX = _MESSAGE_COLUMNS.index("partition_key")
+_TOPIC_INDEX = _MESSAGE_COLUMNS.index("topic")
+_STATUS_BY_VALUE = {status.value: status for status in MessageStatus}
+
+
+def _message_from_row(row: Sequence[Any]) -> Message:
+    """Convert a row of `_MESSAGE_COLUMNS` into a typed message."""
+
+    status = _STATUS_BY_VALUE.get(row[2])
+    if status is None:
+        raise ValueError(f"Unknown message status: {row[2]!r}")
+
+    return Message(row[0], row[1], status, *row[3:])
+
+
+def _execute_tuples(
+    connection: sqlite3.Connection,
+    sql: str,
+    parameters: dict[str, Any] | None = None,
+) -> sqlite3.Cursor:
+    """Execute `sql` on a cursor that returns plain tuples."""
+    cursor = connection.cursor()
+    # Tuples avoid building a sqlite3.Row for every message row.
+    cursor.row_factory = None
+    return cursor.execute(sql, parameters or {})
+
+
+# Time columns of a MessageBatch, accepted by MessageBatch.durations().
+_BATCH_TIME_COLUMNS = ("in_time", "lock_time", "done_time", "available_at")
+_BATCH_FETCH_SIZE = 10_000
+
+
+@dataclass(frozen=True, slots=True)
+class MessageBatch:
+    """
+    Columns of many messages, for statistics over large listings.
+
+    Statuses, times, and attempts are `array('q')` columns, so millions of
+    messages take a few bytes per value instead of one `Message` object each.
+    Times that are not set are stored as `MessageBatch.MISSING`.
+    """
+
+    MISSING: ClassVar[int] = -1
+
+    data: list[str] = field(default_factory=list)
+    message_ids: list[str] = field(default_factory=list)
+    status: array[int] = field(default_factory=lambda: array("q"))
+    in_time: array[int] = field(default_factory=lambda: array("q"))
+    lock_time: array[int] = field(default_factory=lambda: array("q"))
+    done_time: array[int] = field(default_factory=lambda: array("q"))
+    available_at: array[int] = field(default_factory=lambda: array("q"))
+    attempts: array[int] = field(default_factory=lambda: array("q"))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[MessageRow]) -> "MessageBatch":
+        """Build a batch from `MessageRow` tuples, e.g. `list_failed(raw=True)`."""
+        batch = cls()
+        missing = cls.MISSING
+        rows = iter(rows)
+        while chunk := list(itertools.islice(rows, _BATCH_FETCH_SIZE)):
+            batch._extend(
+                [
+                    (
+                        *row[:4],
+                        *(missing if value is None else value for value in row[4:7]),
+                        row[7],
+                    )
+                    for row in chunk
+                ]
+            )
+        return batch
+
+    def _extend(self, rows: Sequence[Sequence[Any]]) -> None:
+        """Append rows of data, message ID, status, times, and attempts."""
+        if not rows:
+            return
+
+        data, message_ids, *numbers = zip(*rows)
+        self.data.extend(data)
+        self.message_ids.extend(message_ids)
+        columns = (
+            self.status,
+            self.in_time,
+            self.lock_time,
+            self.done_time,
+            self.available_at,
+            self.attempts,
+        )
+        for column, values in zip(columns, numbers):
+            column.extend(values)
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    def durations(self, start: str = "in_time", end: str = "done_time") -> array[int]:
+        """
+        Return `end - start` in nanoseconds for messages with both times set.
+
+        `start` and `end` name time columns: "in_time", "lock_time",
+        "done_time", or "available_at". The defaults give the time from
+        insertion to completion of finished messages.
+        """
+        for name in (start, end):
+            if name not in _BATCH_TIME_COLUMNS:
+                raise ValueError(
+                    f"unknown time column {name!r}; expected one of "
+                    f"{', '.join(_BATCH_TIME_COLUMNS)}"
+                )
+
+        missing = self.MISSING
+        return array(
+            "q",
+            (
+                end_time - start_time
+                for start_time, end_time in zip(
+                    getattr(self, start), getattr(self, end)
+                )
+                if start_time != missing and end_time != missing
+            ),
+        )
 
 
-type PopFunction = Callable[[], Message | None]
+class PopFunction(Protocol):
+    def __call__(self, topics: Collection[str] | None = None) -> Message | None: ...
+
 
 _QUEUE_TABLE_NAME = "Queue"
+# Columns added after the original six-column schema. Databases created by
+# older versions receive them through ALTER TABLE when they are reopened.
+_ADDED_COLUMNS = (
+    ("available_at", "INTEGER"),
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("dedup_key", "TEXT"),
+    ("coalesce_key", "TEXT"),
+    ("partition_key", "TEXT"),
+    ("topic", "TEXT"),
+)
+_PENDING_STATUS_VALUES = f"{MessageStatus.READY.value}, {MessageStatus.DELAYED.value}"
+# Immutable queue settings that do not need a trigger are stored here.
+_SETTINGS_TABLE_NAME = "QueueSettings"
+# Stamped into the database header once LiteQueue owns the database.
+# "LQue" in ASCII, so tools such as `file` can recognize queue databases.
+_APPLICATION_ID = 0x4C517565
+# Bump whenever queue tables, indexes, or triggers change, so that existing
+# queues take the full setup path once and pick up the change.
+_SCHEMA_VERSION = 4
 _READ_CONNECTION_POOL_SIZE = 10
+# Pooled read connections unused for this long are closed when another
+# connection is returned to the pool.
+_READ_CONNECTION_IDLE_SECONDS = 60.0
+# Prepared statements kept by each pooled read connection.
+_READ_STATEMENT_CACHE_SIZE = 128
+_QUEUE_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+_LOG_TABLE_NAME = "Log"
+# Committed offsets of every consumer group of every log in the database.
+_LOG_OFFSETS_TABLE_NAME = "LogOffsets"
+# Connections inherited through os.fork(). They are kept alive and never
+# closed in the child, because closing them could disturb the parent.
+_INHERITED_CONNECTIONS: list[sqlite3.Connection] = []
 _MANAGED_CONNECTION_OPTIONS = {
     "autocommit",
     "cached_statements",
@@ -150,11 +427,593 @@ def validate_maxsize(maxsize: int | None) -> int | None:
     return maxsize
 
 
+def validate_max_attempts(max_attempts: int | None) -> int | None:
+    """Validate and return the number of times a message may be popped."""
+
+    max_attempts_is_integer = isinstance(max_attempts, int)
+    max_attempts_is_boolean = isinstance(max_attempts, bool)
+    if max_attempts is not None and (
+        not max_attempts_is_integer or max_attempts_is_boolean
+    ):
+        raise TypeError("max_attempts must be an integer or None")
+
+    if max_attempts is not None and max_attempts < 1:
+        raise ValueError("max_attempts must be a positive integer")
+
+    return max_attempts
+
+
+def validate_delay_seconds(delay_seconds: float) -> int:
+    """Validate a delivery delay and return it in nanoseconds."""
+
+    delay_is_number = isinstance(delay_seconds, (int, float))
+    delay_is_boolean = isinstance(delay_seconds, bool)
+    if not delay_is_number or delay_is_boolean:
+        raise TypeError("delay_seconds must be a number")
+
+    if not math.isfinite(delay_seconds) or delay_seconds < 0:
+        raise ValueError("delay_seconds must be zero or a positive finite number")
+
+    return int(delay_seconds * 1_000_000_000)
+
+
+def validate_limit(limit: int, name: str = "limit") -> int:
+    if isinstance(limit, bool) or not isinstance(limit, int):
+        raise TypeError(f"{name} must be an integer")
+
+    if limit <= 0:
+        raise ValueError(f"{name} must be a positive integer")
+
+    return limit
+
+
+def validate_group(group: str) -> str:
+    if not isinstance(group, str):
+        raise TypeError("group must be a string")
+
+    if not group:
+        raise ValueError("group must not be empty")
+
+    return group
+
+
+def validate_seconds(name: str, seconds: float) -> float:
+    if isinstance(seconds, bool) or not isinstance(seconds, (int, float)):
+        raise TypeError(f"{name} must be a number")
+
+    if not math.isfinite(seconds) or seconds < 0:
+        raise ValueError(f"{name} must be a finite, non-negative number")
+
+    return seconds
+
+
+def _topic_parameters(topics: Collection[str] | None) -> dict[str, str]:
+    """Validate a topic filter and return its named query parameters."""
+
+    if topics is None:
+        return {}
+
+    if isinstance(topics, str):
+        raise TypeError("topics must be a collection of strings, not a string")
+
+    unique_topics = list(dict.fromkeys(topics))
+    if not unique_topics:
+        raise ValueError("topics must not be empty")
+
+    return {f"topic_{index}": topic for index, topic in enumerate(unique_topics)}
+
+
+class QueueMetrics:
+    """
+    Call counts and latency histograms of queue operations.
+
+    Pass an instance as `LiteQueue(..., metrics=QueueMetrics())`. Every timed
+    operation is recorded under a name: the queue method names, plus
+    "write_lock_wait" and "read_connection_wait" for the time spent waiting
+    for the write lock and for a pooled read connection, and "transaction"
+    and "rollback" for explicit transactions that committed or rolled back.
+
+    `callback(name, seconds)`, when given, is called after each recording in
+    the thread that ran the operation. Keep it fast: it adds to the latency
+    of every call. Instances are thread safe and can be shared by queues.
+    """
+
+    # Upper bounds in seconds of the histogram buckets. A last bucket counts
+    # everything slower.
+    HISTOGRAM_BOUNDS: ClassVar[tuple[float, ...]] = (
+        0.00001,
+        0.00002,
+        0.00005,
+        0.0001,
+        0.0002,
+        0.0005,
+        0.001,
+        0.002,
+        0.005,
+        0.01,
+        0.02,
+        0.05,
+        0.1,
+        0.2,
+        0.5,
+        1.0,
+        2.0,
+        5.0,
+    )
+
+    def __init__(self, callback: Callable[[str, float], object] | None = None) -> None:
+        self.callback = callback
+        self._lock = threading.Lock()
+        # name -> [count, total seconds, max seconds, histogram]
+        self._timings: dict[str, list[Any]] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add one timing of the operation `name`."""
+        bucket = bisect.bisect_left(self.HISTOGRAM_BOUNDS, seconds)
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                histogram = [0] * (len(self.HISTOGRAM_BOUNDS) + 1)
+                timing = self._timings[name] = [0, 0.0, 0.0, histogram]
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            timing[3][bucket] += 1
+
+        if self.callback is not None:
+            self.callback(name, seconds)
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """
+        Return a copy of the timings recorded so far, by operation name.
+
+        Each entry has "count", "total_seconds", "max_seconds", and
+        "histogram", the counts per bucket of `HISTOGRAM_BOUNDS`.
+        """
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "total_seconds": total,
+                    "max_seconds": maximum,
+                    "histogram": list(histogram),
+                }
+                for name, (count, total, maximum, histogram) in self._timings.items()
+            }
+
+    def reset(self) -> None:
+        """Forget every timing recorded so far."""
+        with self._lock:
+            self._timings.clear()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(callback={self.callback!r})"
+
+
+class _TimedLock:
+    """The write lock of a database with metrics, timing every acquisition."""
+
+    def __init__(self, metrics: QueueMetrics) -> None:
+        self._lock = threading.RLock()
+        self._metrics = metrics
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        self._metrics.record("write_lock_wait", time.perf_counter() - start)
+        return acquired
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release()
+
+
+# Literals of expanded SQL. Quoted identifiers are matched first and kept, so
+# digits in queue names survive normalization.
+_SQL_LITERAL_PATTERN = re.compile(
+    r"""("(?:[^"]|"")*")"""
+    r"""|'(?:[^']|'')*'"""
+    r"""|[xX]'[0-9a-fA-F]*'"""
+    r"""|-?\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"""
+)
+
+
+def _normalize_sql(sql: str) -> str:
+    """Replace the literals of an expanded statement with `?`."""
+    normalized = _SQL_LITERAL_PATTERN.sub(lambda match: match[1] or "?", sql)
+    return " ".join(normalized.split())
+
+
+@dataclass(eq=False, slots=True, weakref_slot=True)
+class _StatementClock:
+    """The statement that last ran on one profiled connection."""
+
+    sql: str | None = None
+    normalized: str = ""
+    start: float = 0.0
+    last_tick: float = 0.0
+    is_slow: bool = False
+
+
+class SQLProfiler:
+    """
+    Execution counts and times of the SQL statements a queue runs.
+
+    Pass an instance as `LiteQueue(..., profiler=SQLProfiler())`. The profiler
+    installs a trace callback and a progress handler on the write connection
+    and on every pooled read connection. Statements are aggregated after
+    replacing their literals with `?`, so calls with different parameters
+    share one entry.
+
+    The progress handler runs every `progress_steps` SQLite VM instructions.
+    It timestamps the running statement, so times have that resolution and
+    very short statements may count as zero. A statement that runs longer
+    than `slow_threshold` seconds is added to `slow_statements` and passed to
+    `on_slow(sql, seconds)` while it is still running, from the thread that
+    runs it. SQLite reports a statement again for each trigger it fires, so
+    inserts into queues with `maxsize` count the trigger runs too.
+    """
+
+    def __init__(
+        self,
+        slow_threshold: float = 0.1,
+        on_slow: Callable[[str, float], object] | None = None,
+        progress_steps: int = 100,
+    ) -> None:
+        self.slow_threshold = validate_seconds("slow_threshold", slow_threshold)
+        self.on_slow = on_slow
+        self.progress_steps = validate_limit(progress_steps, "progress_steps")
+        # The expanded SQL and running time of the latest slow statements.
+        self.slow_statements: deque[tuple[str, float]] = deque(maxlen=100)
+        self._lock = threading.Lock()
+        # Normalized SQL -> [count, total seconds, max seconds, slow count]
+        self._statements: dict[str, list[Any]] = {}
+        self._clocks: weakref.WeakSet[_StatementClock] = weakref.WeakSet()
+
+    def install(self, connection: sqlite3.Connection) -> None:
+        """Profile the statements of `connection`, replacing its callbacks."""
+        clock = _StatementClock()
+        with self._lock:
+            self._clocks.add(clock)
+
+        def trace(sql: str) -> None:
+            # Trigger programs are reported as comments. Their instructions
+            # count towards the statement that fired them.
+            if sql.startswith("--"):
+                return
+
+            normalized = _normalize_sql(sql)
+            now = time.perf_counter()
+            with self._lock:
+                self._finish(clock)
+                entry = self._statements.get(normalized)
+                if entry is None:
+                    entry = self._statements[normalized] = [0, 0.0, 0.0, 0]
+                entry[0] += 1
+                clock.sql = sql
+                clock.normalized = normalized
+                clock.start = clock.last_tick = now
+                clock.is_slow = False
+
+        def progress() -> int:
+            now = time.perf_counter()
+            clock.last_tick = now
+            sql = clock.sql
+            running_seconds = now - clock.start
+            if (
+                sql is not None
+                and not clock.is_slow
+                and running_seconds >= self.slow_threshold
+            ):
+                clock.is_slow = True
+                self.slow_statements.append((sql, running_seconds))
+                if self.on_slow is not None:
+                    self.on_slow(sql, running_seconds)
+            return 0
+
+        connection.set_trace_callback(trace)
+        connection.set_progress_handler(progress, self.progress_steps)
+
+    def _finish(self, clock: _StatementClock) -> None:
+        """Add the time of the clock's statement while holding the lock."""
+        if clock.sql is None:
+            return
+
+        seconds = clock.last_tick - clock.start
+        entry = self._statements[clock.normalized]
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+        entry[3] += clock.is_slow
+        clock.sql = None
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """
+        Return the statistics of every statement seen so far.
+
+        Entries are keyed by normalized SQL and have "count",
+        "total_seconds", "max_seconds", and "slow_count". Statements still
+        running are included with their time so far.
+        """
+        with self._lock:
+            snapshot = {
+                sql: {
+                    "count": count,
+                    "total_seconds": total,
+                    "max_seconds": maximum,
+                    "slow_count": slow_count,
+                }
+                for sql, (count, total, maximum, slow_count) in self._statements.items()
+            }
+            for clock in self._clocks:
+                if clock.sql is None:
+                    continue
+                seconds = clock.last_tick - clock.start
+                entry = snapshot[clock.normalized]
+                entry["total_seconds"] += seconds
+                entry["max_seconds"] = max(entry["max_seconds"], seconds)
+                entry["slow_count"] += clock.is_slow
+
+        return snapshot
+
+    def report(self, limit: int | None = 20) -> str:
+        """Format the statements with the most total time as a table."""
+        statements = sorted(
+            self.snapshot().items(),
+            key=lambda item: item[1]["total_seconds"],
+            reverse=True,
+        )
+        lines = [
+            f"{'count':>8} {'total ms':>10} {'mean us':>10} {'max ms':>10} "
+            f"{'slow':>6}  statement"
+        ]
+        for sql, entry in statements[:limit]:
+            mean_seconds = (
+                entry["total_seconds"] / entry["count"] if entry["count"] else 0
+            )
+            lines.append(
+                f"{entry['count']:>8} {entry['total_seconds'] * 1e3:>10.3f} "
+                f"{mean_seconds * 1e6:>10.1f} {entry['max_seconds'] * 1e3:>10.3f} "
+                f"{entry['slow_count']:>6}  {sql}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """Forget every statement seen so far, including running ones."""
+        with self._lock:
+            self._statements.clear()
+            for clock in self._clocks:
+                clock.sql = None
+            self.slow_statements.clear()
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(slow_threshold={self.slow_threshold!r}, "
+            f"on_slow={self.on_slow!r}, progress_steps={self.progress_steps!r})"
+        )
+
+
+def _timed[F: Callable[..., Any]](operation: str) -> Callable[[F], F]:
+    """Record the duration of a queue method when its database has metrics."""
+
+    def decorate(method: F) -> F:
+        @functools.wraps(method)
+        def timed_method(queue: "LiteQueue", *args: Any, **kwargs: Any) -> Any:
+            metrics = queue._shared_connections.metrics
+            if metrics is None:
+                return method(queue, *args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return method(queue, *args, **kwargs)
+            finally:
+                metrics.record(operation, time.perf_counter() - start)
+
+        return cast(F, timed_method)
+
+    return decorate
+
+
+class _SharedConnections:
+    """SQLite connections and locks shared by every queue in one database."""
+
+    def __init__(
+        self,
+        database: str,
+        connection_options: dict[str, Any],
+        read_pool_size: int = _READ_CONNECTION_POOL_SIZE,
+        read_only: bool = False,
+        metrics: QueueMetrics | None = None,
+        profiler: SQLProfiler | None = None,
+    ) -> None:
+        self.database = database
+        self.connection_options = connection_options
+        self.read_pool_size = read_pool_size
+        self.read_only = read_only
+        self.metrics = metrics
+        self.profiler = profiler
+        self.is_closed = False
+        self._open_process_state()
+
+    def _open_process_state(self) -> None:
+        """Create the locks and connections owned by the current process."""
+        self.pid = os.getpid()
+        # Without metrics the plain lock keeps writes free of timing calls.
+        self.write_lock: threading.RLock | _TimedLock = (
+            threading.RLock() if self.metrics is None else _TimedLock(self.metrics)
+        )
+        self.transaction_owner: int | None = None
+        # Guards is_closed and the read pool. Readers wait on it for a free
+        # connection and close() waits on it for checked-out connections.
+        self.close_state_lock = threading.Condition()
+        self.write_connection: sqlite3.Connection | None = None
+        if not self.read_only:
+            self.write_connection = self.connect()
+            self.write_connection.execute("PRAGMA temp_store = MEMORY;")
+            self.write_connection.execute("PRAGMA synchronous = NORMAL;")
+        # Idle read connections with the monotonic time they were returned.
+        # The most recently used connection is at the end.
+        self.idle_read_connections: list[tuple[sqlite3.Connection, float]] = []
+        self.open_read_count = 0
+
+    def ensure_current_process(self) -> None:
+        """Reopen the connections in a child process after `os.fork()`."""
+        if self.pid == os.getpid():
+            return
+
+        # SQLite connections must not be used across fork. Closing them would
+        # be unsafe too: the close could checkpoint or delete the WAL that the
+        # parent still uses. Keep them referenced so they are never closed.
+        if self.write_connection is not None:
+            _INHERITED_CONNECTIONS.append(self.write_connection)
+        _INHERITED_CONNECTIONS.extend(
+            connection for connection, _ in self.idle_read_connections
+        )
+
+        if self.is_closed:
+            self.pid = os.getpid()
+            self.write_lock = threading.RLock()
+            self.transaction_owner = None
+            self.close_state_lock = threading.Condition()
+            self.idle_read_connections = []
+            self.open_read_count = 0
+            return
+
+        self._open_process_state()
+
+    def connect(self, cached_statements: int = 0) -> sqlite3.Connection:
+        """Open a connection with the options LiteQueue depends on."""
+        connection = sqlite3.connect(
+            database=self.database,
+            isolation_level=None,
+            check_same_thread=False,
+            # Cached statements are disabled by default due to a bug in
+            # CPython >= 3.12 with connections shared between threads.
+            # https://github.com/python/cpython/issues/118172
+            cached_statements=cached_statements,
+            **self.connection_options,
+        )
+        connection.row_factory = sqlite3.Row
+        if self.profiler is not None:
+            self.profiler.install(connection)
+        return connection
+
+    def connect_reader(self) -> sqlite3.Connection:
+        """Open a read connection for the pool."""
+        # A pooled connection is checked out by one thread at a time, which
+        # keeps its statement cache clear of the bug above. Queue SQL is
+        # built once per table, so repeated reads reuse prepared statements.
+        read_connection = self.connect(cached_statements=_READ_STATEMENT_CACHE_SIZE)
+        # This is a second line of defense against accidentally routing
+        # a mutation through the pool in a future code change.
+        read_connection.execute("PRAGMA query_only = ON;")
+        return read_connection
+
+    def checkout_read_connection(self) -> sqlite3.Connection:
+        """Take an idle read connection, opening one if the pool has room."""
+        if self.metrics is None:
+            return self._checkout_read_connection()
+
+        start = time.perf_counter()
+        read_connection = self._checkout_read_connection()
+        self.metrics.record("read_connection_wait", time.perf_counter() - start)
+        return read_connection
+
+    def _checkout_read_connection(self) -> sqlite3.Connection:
+        # Separate read connections prevent reads in one thread from joining
+        # another thread's write transaction and observing data that may still
+        # be rolled back. The pool is bounded so unrelated reads can run
+        # concurrently without creating an unbounded number of file handles.
+        # Connections open on first demand: a process that only writes never
+        # pays for the file opens and WAL-index mappings of the readers.
+        with self.close_state_lock:
+            while True:
+                if self.is_closed:
+                    raise sqlite3.ProgrammingError(
+                        "Cannot operate on a closed database."
+                    )
+                if self.idle_read_connections:
+                    read_connection, _ = self.idle_read_connections.pop()
+                    return read_connection
+                if self.open_read_count < self.read_pool_size:
+                    self.open_read_count += 1
+                    break
+                self.close_state_lock.wait()
+
+        try:
+            return self.connect_reader()
+        except BaseException:
+            with self.close_state_lock:
+                self.open_read_count -= 1
+                self.close_state_lock.notify()
+            raise
+
+    def return_read_connection(self, read_connection: sqlite3.Connection) -> None:
+        """Put a read connection back and close connections idle for too long."""
+        now = time.monotonic()
+        with self.close_state_lock:
+            idle_connections = self.idle_read_connections
+            # The oldest idle connections are at the start of the list. The
+            # returned connection is never reaped, so a busy pool stays warm.
+            expired_count = 0
+            for _, returned_at in idle_connections:
+                if now - returned_at <= _READ_CONNECTION_IDLE_SECONDS:
+                    break
+                expired_count += 1
+            expired = idle_connections[:expired_count]
+            del idle_connections[:expired_count]
+            self.open_read_count -= expired_count
+            idle_connections.append((read_connection, now))
+            self.close_state_lock.notify_all()
+
+        for expired_connection, _ in expired:
+            expired_connection.close()
+
+    def close(self) -> None:
+        if self.pid != os.getpid():
+            # Inherited connections belong to the parent. Forget them instead
+            # of opening new connections only to close them.
+            self.is_closed = True
+            self.ensure_current_process()
+            return
+
+        with self.write_lock:
+            with self.close_state_lock:
+                if self.is_closed:
+                    return
+                self.is_closed = True
+
+                # Waiting until every open reader is idle waits for
+                # checked-out readers to finish. Once is_closed is set, new
+                # readers fail before checkout, so they cannot race shutdown
+                # or use a closed connection.
+                self.close_state_lock.wait_for(
+                    lambda: len(self.idle_read_connections) == self.open_read_count
+                )
+                connections_to_close = self.idle_read_connections
+                self.idle_read_connections = []
+                self.open_read_count = 0
+
+            for read_connection, _ in connections_to_close:
+                read_connection.close()
+
+            if self.write_connection is not None:
+                self.write_connection.close()
+
+
 class LiteQueue:
     def __init__(
         self,
         filename: str | Path,
         maxsize: int | None = None,
+        max_attempts: int | None = None,
+        read_pool_size: int = _READ_CONNECTION_POOL_SIZE,
+        metrics: QueueMetrics | None = None,
+        profiler: SQLProfiler | None = None,
         **kwargs: Any,
     ) -> None:
         """
@@ -167,13 +1026,26 @@ class LiteQueue:
           queue, omit it to use the stored setting or pass the same value.
           Conflicting values raise ValueError. Zero creates a queue that
           cannot accept messages (default: None, unlimited on first creation).
+        - max_attempts: Number of times a message may be popped. `retry()`
+          moves a locked message that used all its attempts to `FAILED`. The
+          value is an immutable queue setting with the same reopen rules as
+          `maxsize` (default: None, unlimited on first creation).
+        - read_pool_size: Maximum number of read-only connections. They are
+          opened on first use and closed after a minute without use, so a
+          process that only writes opens a single connection (default: 10).
+        - metrics: A `QueueMetrics` that records the latency of every
+          operation, shared with named queues and logs of this database. It
+          stays in this process when the queue is pickled (default: None).
+        - profiler: A `SQLProfiler` that traces the statements of every
+          connection, with the same sharing rules as `metrics` (default: None).
         - kwargs: Additional options forwarded to every `sqlite3.connect()`
           call, including `timeout`, `detect_types`, `factory`, and `uri`.
           LiteQueue manages `database`, `isolation_level`, `check_same_thread`,
           `cached_statements`, and `autocommit`; passing one raises ValueError.
 
-        Each database can contain only one LiteQueue queue, stored in the fixed
-        "Queue" table. Other tables are not supported.
+        The default queue is stored in the fixed "Queue" table. Use
+        `named_queue()` to store more queues in the same database. Other
+        tables are not supported.
 
         One LiteQueue instance can be shared between threads when SQLite was
         compiled in serialized mode, as in standard CPython builds. LiteQueue
@@ -181,43 +1053,216 @@ class LiteQueue:
         serves committed data to other threads.
 
         """
-        filename_is_supported = isinstance(filename, (str, Path))
-        if not filename_is_supported:
-            raise TypeError("filename must be a string or pathlib.Path")
+        _validate_open_arguments(filename, metrics, profiler, kwargs)
+        validated_maxsize = validate_maxsize(maxsize)
+        validated_max_attempts = validate_max_attempts(max_attempts)
+        validated_read_pool_size = validate_limit(read_pool_size, "read_pool_size")
+
+        # Selecting the pop implementation checks the SQLite version before
+        # any connection creates the database file.
+        self._select_pop_func()
+        self._attach(
+            _SharedConnections(
+                str(filename),
+                kwargs,
+                validated_read_pool_size,
+                metrics=metrics,
+                profiler=profiler,
+            ),
+            name=None,
+        )
+        self._open_table(validated_maxsize, validated_max_attempts)
+
+    @classmethod
+    def open_readonly(
+        cls,
+        filename: str | Path,
+        read_pool_size: int = _READ_CONNECTION_POOL_SIZE,
+        metrics: QueueMetrics | None = None,
+        profiler: SQLProfiler | None = None,
+        **kwargs: Any,
+    ) -> "LiteQueue":
+        """
+        Open an existing queue for reading only, e.g. for monitoring.
+
+        The queue opens its connections with a `mode=ro` URI and has no write
+        connection. It never creates tables, changes the journal mode, or
+        takes a write lock, so dashboards and health checks that call
+        `qsize()`, `peek()`, or `list_failed()` do not slow down producers and
+        consumers. Methods that write raise `sqlite3.OperationalError`.
+
+        The database must already contain the queue; otherwise ValueError is
+        raised. `read_pool_size`, `metrics`, `profiler`, and `kwargs` are the
+        same as for the constructor. With `uri=True`, `filename` may be a `file:` URI.
+        """
+        _validate_open_arguments(filename, metrics, profiler, kwargs)
+        validated_read_pool_size = validate_limit(read_pool_size, "read_pool_size")
+
+        database = str(filename)
+        if kwargs.get("uri") and database.startswith("file:"):
+            separator = "&" if "?" in database else "?"
+            database = f"{database}{separator}mode=ro"
+        else:
+            database = f"{Path(filename).absolute().as_uri()}?mode=ro"
+
+        # Read-only connections open lazily, so nothing touches the file
+        # until the settings are loaded.
+        connections = _SharedConnections(
+            database,
+            {**kwargs, "uri": True},
+            validated_read_pool_size,
+            read_only=True,
+            metrics=metrics,
+            profiler=profiler,
+        )
+        return _open_readonly_queue(cls, connections, name=None)
+
+    @property
+    def _connections(self) -> _SharedConnections:
+        connections = self._shared_connections
+        connections.ensure_current_process()
+        return connections
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Connections cannot be pickled. Another process reopens the queue
+        # from its file and options instead.
+        connections = self._shared_connections
+        return (
+            _reopen_queue,
+            (
+                connections.database,
+                connections.connection_options,
+                self.name,
+                connections.read_pool_size,
+                connections.read_only,
+            ),
+        )
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The write connection shared by every queue in the database."""
+        connection = self._connections.write_connection
+        if connection is None:
+            # Match the error SQLite raises for writes through a read-only
+            # connection, which is what a write here would otherwise reach.
+            raise sqlite3.OperationalError("attempt to write a readonly database")
+        return connection
+
+    @property
+    def _write_connection_lock(self) -> "threading.RLock | _TimedLock":
+        return self._connections.write_lock
+
+    def named_queue(
+        self,
+        name: str,
+        maxsize: int | None = None,
+        max_attempts: int | None = None,
+    ) -> "LiteQueue":
+        """
+        Return a queue stored in its own table of this database.
 
-        if filename == "":
-            raise ValueError("filename must not be empty")
+        The returned queue shares this instance's connections, locks, WAL, and
+        checkpoints, so opening many named queues costs no extra file handles.
+        `maxsize` and `max_attempts` are immutable settings of the named queue
+        and follow the same reopen rules as the constructor arguments.
+        Closing any queue of the database closes them all.
+        """
+        if not isinstance(name, str):
+            raise TypeError("name must be a string")
 
-        managed_options = _MANAGED_CONNECTION_OPTIONS.intersection(kwargs)
-        if managed_options:
-            option_list = ", ".join(sorted(managed_options))
+        if _QUEUE_NAME_PATTERN.fullmatch(name) is None:
             raise ValueError(
-                f"LiteQueue manages SQLite connection options: {option_list}"
+                "name must contain only letters, digits, underscores, and hyphens"
             )
 
         validated_maxsize = validate_maxsize(maxsize)
+        validated_max_attempts = validate_max_attempts(max_attempts)
+
+        connections = self._connections
+        if connections.read_only:
+            if validated_maxsize is not None or validated_max_attempts is not None:
+                raise ValueError(
+                    "maxsize and max_attempts cannot be set on a read-only queue"
+                )
+            return _open_readonly_queue(type(self), connections, name=name)
 
-        self._write_connection_lock = threading.RLock()
-        self._transaction_owner: int | None = None
-        self._close_state_lock = threading.Lock()
-        self._is_closed = False
+        queue = object.__new__(type(self))
+        queue._attach(connections, name=name)
+        queue._open_table(validated_maxsize, validated_max_attempts)
+        return queue
 
+    def _attach(self, connections: _SharedConnections, name: str | None) -> None:
+        """Set up the state of the default queue or of a named queue view."""
         self.pop: PopFunction = self._select_pop_func()
-
-        database_filename = str(filename)
-        self.conn = sqlite3.connect(
-            database=database_filename,
-            isolation_level=None,
-            check_same_thread=False,
-            # Disable cached statements due to a bug in CPython >= 3.12.
-            # https://github.com/python/cpython/issues/118172
-            cached_statements=0,
-            **kwargs,
+        self._new_message_id: Callable[[], str] = _new_message_id
+        self._shared_connections = connections
+        self.name = name
+        self.table_name = (
+            _QUEUE_TABLE_NAME if name is None else f"{_QUEUE_TABLE_NAME}:{name}"
         )
+        self.table = f'"{self.table_name}"'
+        self._sql = self._build_statements()
+
+    def queue_names(self) -> list[str]:
+        """Return the names of the named queues stored in this database."""
+
+        with self._read_connection() as connection:
+            rows = connection.execute(
+                """
+                SELECT name
+                FROM sqlite_schema
+                WHERE type = 'table' AND name GLOB :pattern
+                ORDER BY name
+                """,
+                {"pattern": f"{_QUEUE_TABLE_NAME}:*"},
+            ).fetchall()
+
+        prefix_length = len(_QUEUE_TABLE_NAME) + 1
+        return [row["name"][prefix_length:] for row in rows]
 
-        self.conn.row_factory = sqlite3.Row
+    def log(self, name: str) -> "LiteLog":
+        """
+        Return an append-only log stored in its own table of this database.
+
+        The log shares this queue's connections and locks. See `LiteLog`.
+        """
+        if not isinstance(name, str):
+            raise TypeError("name must be a string")
+
+        if _QUEUE_NAME_PATTERN.fullmatch(name) is None:
+            raise ValueError(
+                "name must contain only letters, digits, underscores, and hyphens"
+            )
+
+        return LiteLog(self, name)
+
+    def log_names(self) -> list[str]:
+        """Return the names of the logs stored in this database."""
+
+        with self._read_connection() as connection:
+            rows = connection.execute(
+                """
+                SELECT name
+                FROM sqlite_schema
+                WHERE type = 'table' AND name GLOB :pattern
+                ORDER BY name
+                """,
+                {"pattern": f"{_LOG_TABLE_NAME}:*"},
+            ).fetchall()
 
-        self.table = f'"{_QUEUE_TABLE_NAME}"'
+        prefix_length = len(_LOG_TABLE_NAME) + 1
+        return [row["name"][prefix_length:] for row in rows]
+
+    def _open_table(
+        self,
+        validated_maxsize: int | None,
+        validated_max_attempts: int | None,
+    ) -> None:
+        """Create or upgrade this queue's table and load its settings."""
+        if self._open_initialized_table(validated_maxsize, validated_max_attempts):
+            return
+
+        table_name = self.table_name
 
         with self.transaction(mode="IMMEDIATE"):
             table_rows = self.conn.execute(
@@ -229,23 +1274,34 @@ class LiteQueue:
                 """
             ).fetchall()
             table_names = [row["name"] for row in table_rows]
+            supported_tables = {
+                _QUEUE_TABLE_NAME,
+                _SETTINGS_TABLE_NAME,
+                _LOG_OFFSETS_TABLE_NAME,
+            }
             unsupported_tables = [
-                name for name in table_names if name != _QUEUE_TABLE_NAME
+                name
+                for name in table_names
+                if name not in supported_tables
+                and not name.startswith(f"{_QUEUE_TABLE_NAME}:")
+                and not name.startswith(f"{_LOG_TABLE_NAME}:")
             ]
             if unsupported_tables:
                 table_label = "table" if len(unsupported_tables) == 1 else "tables"
                 table_list = ", ".join(unsupported_tables)
                 raise ValueError(
-                    "LiteQueue versions later than 0.9 require a database with a "
-                    "single `Queue` table. These versions do not allow multiple "
-                    "queues or database sharing with other applications. "
+                    "LiteQueue versions later than 0.9 only support their own "
+                    "tables in a database: `Queue`, named queue tables "
+                    "`Queue:<name>`, log tables `Log:<name>`, and their settings "
+                    "tables. Custom queue tables and database sharing with other "
+                    "applications are not supported. "
                     f"Found unsupported {table_label}: {table_list}. "
                     "See the migration guide: "
                     "https://github.com/litements/litequeue/blob/main/docs/"
                     "migrate_single_queue.md"
                 )
 
-            table_exists = bool(table_names)
+            table_exists = table_name in table_names
 
             # int == bool in SQLite
             # will have rowid as primary key by default
@@ -258,20 +1314,98 @@ class LiteQueue:
                   , in_time    INTEGER NOT NULL
                   , lock_time  INTEGER
                   , done_time  INTEGER
+                  , available_at INTEGER
+                  , attempts   INTEGER NOT NULL DEFAULT 0
+                  , dedup_key  TEXT
+                  , coalesce_key TEXT
+                  , partition_key TEXT
+                  , topic      TEXT
                 )
                 """
             )
 
             self.conn.execute(
-                f'CREATE UNIQUE INDEX IF NOT EXISTS "Queue_message_id_unique_idx" '
+                f"""CREATE TABLE IF NOT EXISTS "{_SETTINGS_TABLE_NAME}"
+                (
+                  queue_table TEXT NOT NULL
+                  , name      TEXT NOT NULL
+                  , value     INTEGER
+                  , PRIMARY KEY (queue_table, name)
+                ) WITHOUT ROWID
+                """
+            )
+
+            if table_exists:
+                self._add_missing_columns()
+
+            self.conn.execute(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_message_id_unique_idx" '
                 f"ON {self.table}(message_id)"
             )
 
             self.conn.execute(
-                f'CREATE INDEX IF NOT EXISTS "Queue_status_message_id_idx" '
+                f'CREATE INDEX IF NOT EXISTS "{table_name}_status_message_id_idx" '
                 f"ON {self.table}(status, message_id)"
             )
 
+            # Producers deduplicate with one INSERT ... ON CONFLICT DO NOTHING.
+            # The partial index keeps messages without a key out of it.
+            self.conn.execute(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_dedup_key_unique_idx" '
+                f"ON {self.table}(dedup_key) WHERE dedup_key IS NOT NULL"
+            )
+
+            # At most one pending message per coalesce key. Locked and finished
+            # messages leave the index, so a put after a pop enqueues new work.
+            self.conn.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS "
+                f'"{table_name}_coalesce_key_unique_idx" '
+                f"ON {self.table}(coalesce_key) WHERE coalesce_key IS NOT NULL "
+                f"AND status IN ({_PENDING_STATUS_VALUES})"
+            )
+
+            # Lets the claim query check whether a partition already has a
+            # locked message with one index seek per candidate.
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS "
+                f'"{table_name}_partition_key_status_message_id_idx" '
+                f"ON {self.table}(partition_key, status, message_id) "
+                f"WHERE partition_key IS NOT NULL"
+            )
+
+            # Workers that pop selected topics read the FIFO head of each topic
+            # instead of scanning messages they cannot handle.
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS "
+                f'"{table_name}_topic_status_message_id_idx" '
+                f"ON {self.table}(topic, status, message_id) "
+                f"WHERE topic IS NOT NULL"
+            )
+
+            # Lets pop() promote due delayed messages and next_due_time() find
+            # the earliest one without scanning messages scheduled later.
+            self.conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table_name}_status_available_at_idx" '
+                f"ON {self.table}(status, available_at)"
+            )
+
+            # Lets list_locked() and reclaim_locked() find stale claims by lock
+            # time. Only locked messages are in it, so it stays small.
+            self.conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table_name}_status_lock_time_idx" '
+                f"ON {self.table}(status, lock_time) "
+                f"WHERE status = {MessageStatus.LOCKED.value}"
+            )
+
+            # Lets stats() read only the messages finished inside its window.
+            # Leading with done_time keeps the planner from choosing it for
+            # status lookups that need message_id order, and unfinished
+            # messages stay out of it.
+            self.conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table_name}_done_time_status_idx" '
+                f"ON {self.table}(done_time, status) WHERE done_time IS NOT NULL"
+            )
+
             stored_maxsize = self._get_stored_maxsize()
             if table_exists:
                 maxsize_conflicts = validated_maxsize is not None and (
@@ -280,7 +1414,7 @@ class LiteQueue:
                 if maxsize_conflicts:
                     raise ValueError(
                         f"maxsize {validated_maxsize} conflicts with stored maxsize "
-                        f"{stored_maxsize} for queue '{_QUEUE_TABLE_NAME}'"
+                        f"{stored_maxsize} for queue '{table_name}'"
                     )
 
                 effective_maxsize = stored_maxsize
@@ -288,18 +1422,59 @@ class LiteQueue:
                 effective_maxsize = validated_maxsize
 
             if effective_maxsize is not None:
+                self._install_maxsize_trigger(effective_maxsize)
+
+            stored_max_attempts = self._get_stored_setting("max_attempts")
+            if stored_max_attempts is None:
+                # Queues created without a limit, including those of older
+                # versions, adopt the first max_attempts passed on reopen.
+                effective_max_attempts = validated_max_attempts
+            else:
+                max_attempts_conflicts = validated_max_attempts is not None and (
+                    validated_max_attempts != stored_max_attempts
+                )
+                if max_attempts_conflicts:
+                    raise ValueError(
+                        f"max_attempts {validated_max_attempts} conflicts with "
+                        f"stored max_attempts {stored_max_attempts} for queue "
+                        f"'{table_name}'"
+                    )
+
+                effective_max_attempts = stored_max_attempts
+
+            if effective_max_attempts is not None:
                 self.conn.execute(
                     f"""
-CREATE TRIGGER IF NOT EXISTS "maxsize_control_Queue"
-   BEFORE INSERT
-   ON {self.table}
-   WHEN (SELECT COUNT(*) FROM {self.table} WHERE status = {MessageStatus.READY.value}) >= {effective_maxsize}
-BEGIN
-    SELECT RAISE (ABORT,'Max queue length reached: {effective_maxsize}');
-END;"""
+                    INSERT OR IGNORE INTO "{_SETTINGS_TABLE_NAME}"
+                      (queue_table, name, value)
+                    VALUES (:queue_table, 'max_attempts', :value)
+                    """.strip(),
+                    {"queue_table": table_name, "value": effective_max_attempts},
                 )
 
-        self.maxsize = effective_maxsize
+            # The trigger stays the source of truth for maxsize. The mirrored
+            # row and the schema version let later opens skip this setup.
+            self.conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO "{_SETTINGS_TABLE_NAME}"
+                  (queue_table, name, value)
+                VALUES (:queue_table, :name, :value)
+                """.strip(),
+                (
+                    {
+                        "queue_table": table_name,
+                        "name": "maxsize",
+                        "value": effective_maxsize,
+                    },
+                    {
+                        "queue_table": table_name,
+                        "name": "schema_version",
+                        "value": _SCHEMA_VERSION,
+                    },
+                ),
+            )
+            self.conn.execute(f"PRAGMA application_id = {_APPLICATION_ID};")
+            self.conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION};")
 
         journal_mode_row = self.conn.execute("PRAGMA journal_mode;").fetchone()
         current_journal_mode = journal_mode_row[0].lower()
@@ -307,55 +1482,221 @@ END;"""
             # Changing journal mode takes a database lock. Avoid that lock when
             # reopening the queue after WAL has already been configured.
             self.conn.execute("PRAGMA journal_mode = WAL;")
-        self.conn.execute("PRAGMA temp_store = MEMORY;")
-        self.conn.execute("PRAGMA synchronous = NORMAL;")
 
-        # Separate read connections prevent reads in one thread from joining
-        # another thread's write transaction and observing data that may still
-        # be rolled back. A small fixed pool also allows unrelated reads to run
-        # concurrently without creating an unbounded number of file handles.
-        read_connections: Queue[sqlite3.Connection] = Queue(
-            maxsize=_READ_CONNECTION_POOL_SIZE
-        )
-        for _ in range(_READ_CONNECTION_POOL_SIZE):
-            read_connection = sqlite3.connect(
-                database=database_filename,
-                isolation_level=None,
-                check_same_thread=False,
-                # Disable cached statements due to a bug in CPython >= 3.12.
-                # https://github.com/python/cpython/issues/118172
-                cached_statements=0,
-                **kwargs,
-            )
-            read_connection.row_factory = sqlite3.Row
-            # This is a second line of defense against accidentally routing
-            # a mutation through the pool in a future code change.
-            read_connection.execute("PRAGMA query_only = ON;")
-            read_connections.put(read_connection)
-        self._read_connections = read_connections
+        self.maxsize = effective_maxsize
+        self.max_attempts = effective_max_attempts
 
-    def _get_stored_maxsize(self) -> int | None:
-        """Read the immutable capacity from the queue's trigger."""
+    def _open_initialized_table(
+        self,
+        validated_maxsize: int | None,
+        validated_max_attempts: int | None,
+    ) -> bool:
+        """
+        Load the settings of a queue set up by this version without locking.
 
-        trigger = self.conn.execute(
+        Returns False when the full setup must run: the database or the queue
+        is new, was set up by another version, is not in WAL mode, or the
+        requested settings differ from the stored ones. The full setup then
+        upgrades the schema or reports the conflict.
+        """
+        try:
+            with self._write_connection_lock:
+                rows = self.conn.execute(
+                    f"""
+                    SELECT
+                      application.application_id
+                      , version.user_version
+                      , journal.journal_mode
+                      , (
+                          SELECT COUNT(*) FROM sqlite_schema
+                          WHERE type = 'table'
+                            AND name NOT GLOB 'sqlite_*'
+                            AND name NOT IN (
+                              '{_QUEUE_TABLE_NAME}'
+                              , '{_SETTINGS_TABLE_NAME}'
+                              , '{_LOG_OFFSETS_TABLE_NAME}'
+                            )
+                            AND name NOT GLOB '{_QUEUE_TABLE_NAME}:*'
+                            AND name NOT GLOB '{_LOG_TABLE_NAME}:*'
+                        ) AS unsupported_table_count
+                      , (
+                          SELECT sql FROM sqlite_schema
+                          WHERE type = 'trigger' AND name = :trigger_name
+                        ) AS trigger_sql
+                      , setting.name
+                      , setting.value
+                    FROM pragma_application_id AS application
+                      , pragma_user_version AS version
+                      , pragma_journal_mode AS journal
+                    LEFT JOIN "{_SETTINGS_TABLE_NAME}" AS setting
+                      ON setting.queue_table = :queue_table
+                    """,
+                    {
+                        "queue_table": self.table_name,
+                        "trigger_name": f"maxsize_control_{self.table_name}",
+                    },
+                ).fetchall()
+        except sqlite3.OperationalError:
+            # A database without the settings table has never been set up.
+            return False
+
+        database = rows[0]
+        database_is_current = (
+            database["application_id"] == _APPLICATION_ID
+            and database["user_version"] == _SCHEMA_VERSION
+            and database["journal_mode"].lower() == "wal"
+            and database["unsupported_table_count"] == 0
+        )
+        settings = {row["name"]: row["value"] for row in rows if row["name"]}
+        table_is_current = settings.get("schema_version") == _SCHEMA_VERSION
+        if not (database_is_current and table_is_current):
+            return False
+
+        stored_maxsize = settings["maxsize"]
+        stored_max_attempts = settings.get("max_attempts")
+        expected_trigger_sql = (
+            None
+            if stored_maxsize is None
+            else self._maxsize_trigger_sql(stored_maxsize)
+        )
+        settings_match = (
+            database["trigger_sql"] == expected_trigger_sql
+            and validated_maxsize in (None, stored_maxsize)
+            and validated_max_attempts in (None, stored_max_attempts)
+        )
+        if not settings_match:
+            return False
+
+        self.maxsize = stored_maxsize
+        self.max_attempts = stored_max_attempts
+        return True
+
+    def _maxsize_trigger_sql(self, maxsize: int) -> str:
+        # Delayed messages count against maxsize too. Otherwise they would
+        # bypass the limit and exceed it once they become ready.
+        # BEFORE INSERT triggers run before ON CONFLICT is resolved, so a
+        # duplicate put or a coalescing put that updates its pending message
+        # in place, which add no row, are exempt from the check.
+        # SQLite stores the statement without its terminating semicolon, so
+        # leaving it out lets reopens compare this text with sqlite_schema.
+        return f"""
+CREATE TRIGGER "maxsize_control_{self.table_name}"
+   BEFORE INSERT
+   ON {self.table}
+   WHEN (SELECT COUNT(*) FROM {self.table} WHERE status IN ({_PENDING_STATUS_VALUES})) >= {maxsize}
+     AND NOT (
+       NEW.dedup_key IS NOT NULL
+       AND EXISTS (SELECT 1 FROM {self.table} WHERE dedup_key = NEW.dedup_key)
+     )
+     AND NOT (
+       NEW.coalesce_key IS NOT NULL
+       AND EXISTS (
+         SELECT 1 FROM {self.table}
+         WHERE coalesce_key = NEW.coalesce_key
+           AND status IN ({_PENDING_STATUS_VALUES})
+       )
+     )
+BEGIN
+    SELECT RAISE (ABORT,'Max queue length reached: {maxsize}');
+END""".strip()
+
+    def _install_maxsize_trigger(self, maxsize: int) -> None:
+        """Create the maxsize trigger, replacing one written by older versions."""
+        trigger_name = f"maxsize_control_{self.table_name}"
+        trigger_sql = self._maxsize_trigger_sql(maxsize)
+        stored_trigger = self.conn.execute(
             """
-            SELECT sql
-            FROM sqlite_master
-            WHERE type = 'trigger' AND name = :trigger_name COLLATE NOCASE
+            SELECT sql FROM sqlite_schema
+            WHERE type = 'trigger' AND name = :trigger_name
             """,
-            {"trigger_name": "maxsize_control_Queue"},
+            {"trigger_name": trigger_name},
         ).fetchone()
+        if stored_trigger is not None and stored_trigger["sql"] == trigger_sql:
+            return
+
+        self.conn.execute(f'DROP TRIGGER IF EXISTS "{trigger_name}"')
+        self.conn.execute(trigger_sql)
+
+    def _add_missing_columns(self) -> None:
+        """Upgrade a queue table created by an older LiteQueue version."""
+
+        column_rows = self.conn.execute(f"PRAGMA table_info({self.table})").fetchall()
+        column_names = {row["name"] for row in column_rows}
+        for column_name, column_type in _ADDED_COLUMNS:
+            if column_name not in column_names:
+                self.conn.execute(
+                    f"ALTER TABLE {self.table} ADD COLUMN {column_name} {column_type}"
+                )
+
+    def _get_stored_setting(self, name: str) -> int | None:
+        """Read an immutable queue setting from the settings table."""
+
+        with self._read_connection() as connection:
+            setting = connection.execute(
+                f"""
+                SELECT value
+                FROM "{_SETTINGS_TABLE_NAME}"
+                WHERE queue_table = :queue_table AND name = :name
+                """,
+                {"queue_table": self.table_name, "name": name},
+            ).fetchone()
+        if setting is None:
+            return None
+
+        return setting["value"]
+
+    def _get_stored_maxsize(self) -> int | None:
+        """Read the immutable capacity from the queue's trigger."""
+
+        with self._read_connection() as connection:
+            trigger = connection.execute(
+                """
+                SELECT sql
+                FROM sqlite_master
+                WHERE type = 'trigger' AND name = :trigger_name COLLATE NOCASE
+                """,
+                {"trigger_name": f"maxsize_control_{self.table_name}"},
+            ).fetchone()
         if trigger is None:
             return None
 
         trigger_sql = trigger["sql"]
         match = re.search(r"Max queue length reached: (-?\d+)", trigger_sql)
         if match is None:
-            raise ValueError("Stored maxsize trigger for queue 'Queue' is invalid")
+            raise ValueError(
+                f"Stored maxsize trigger for queue '{self.table_name}' is invalid"
+            )
 
         stored_maxsize = int(match.group(1))
         return validate_maxsize(stored_maxsize)
 
+    def _load_settings(self) -> None:
+        """Read the settings of an existing queue without changing anything."""
+
+        with self._read_connection() as connection:
+            table_rows = connection.execute(
+                """
+                SELECT name
+                FROM sqlite_schema
+                WHERE type = 'table' AND name IN (:queue_table, :settings_table)
+                """,
+                {
+                    "queue_table": self.table_name,
+                    "settings_table": _SETTINGS_TABLE_NAME,
+                },
+            ).fetchall()
+        table_names = {row["name"] for row in table_rows}
+        if self.table_name not in table_names:
+            raise ValueError(
+                f"queue '{self.table_name}' does not exist in "
+                f"{self._connections.database}"
+            )
+
+        self.maxsize = self._get_stored_maxsize()
+        self.max_attempts = None
+        if _SETTINGS_TABLE_NAME in table_names:
+            self.max_attempts = self._get_stored_setting("max_attempts")
+
     def get_sqlite_version(self) -> tuple[int, int, int]:
         """Return the SQLite version or reject unsupported major versions."""
         sqlite_version_info = sqlite3.sqlite_version_info
@@ -381,48 +1722,492 @@ END;"""
 
         return self._pop_transaction
 
-    def put(self, data: str) -> Message:
+    @_timed("put")
+    def put(
+        self,
+        data: str,
+        delay_seconds: float = 0,
+        dedup_key: str | None = None,
+        coalesce_key: str | None = None,
+        partition_key: str | None = None,
+        topic: str | None = None,
+    ) -> Message:
         """
         Insert a new message
+
+        With `delay_seconds`, the message is stored as `DELAYED` and cannot be
+        popped or peeked until the delay has passed.
+
+        With `dedup_key`, a message with the same key that is still stored, in
+        any status, is returned instead of inserting a duplicate.
+
+        With `coalesce_key`, a `READY` or `DELAYED` message with the same key
+        is updated in place with the new data and keeps its position in the
+        queue. Locked and finished messages are never changed.
+
+        Messages with the same `partition_key` are delivered in order, one at a
+        time: `pop()` skips a partition while one of its messages is locked.
+        Messages in different partitions are processed in parallel.
+
+        `topic` routes the message to workers that call `pop(topics=[...])`.
         """
-        # timeout: int = None
-        message_id = str(uuid7())
-        now = time_ns()
+        delay_nanoseconds = validate_delay_seconds(delay_seconds)
+        if dedup_key is not None and coalesce_key is not None:
+            raise ValueError("dedup_key and coalesce_key cannot be used together")
+
+        if coalesce_key is not None:
+            with self._write_transaction():
+                return self._coalesce(
+                    data, delay_nanoseconds, coalesce_key, partition_key, topic
+                )
 
         with self._write_connection_lock:
-            self.conn.execute(
-                f"""
-                INSERT INTO
-                  {self.table}
-                       (  data,  message_id, status,                      in_time, lock_time, done_time )
-                VALUES ( :data, :message_id, {MessageStatus.READY.value}, :now   , NULL     , NULL      )
-                """.strip(),
-                {"data": data, "message_id": message_id, "now": now},
+            return self._insert(
+                data, delay_nanoseconds, dedup_key, partition_key, topic
             )
 
-        return Message(
-            data=data,
-            message_id=message_id,
-            status=MessageStatus.READY,
-            in_time=now,
-            lock_time=None,
-            done_time=None,
+    @_timed("put_many")
+    def put_many(
+        self,
+        data: Iterable[str],
+        delay_seconds: float = 0,
+        dedup_keys: Iterable[str | None] | None = None,
+    ) -> list[Message]:
+        """
+        Insert several messages in one transaction.
+
+        `dedup_keys`, when given, must contain one key or `None` per message.
+        Messages are returned in input order. Duplicates, including repeated
+        keys within the same call, return the stored message as `put()` does.
+        """
+        delay_nanoseconds = validate_delay_seconds(delay_seconds)
+        items = list(data)
+        keys = [None] * len(items) if dedup_keys is None else list(dedup_keys)
+        if len(keys) != len(items):
+            raise ValueError("dedup_keys must contain one key per message")
+
+        with self._write_transaction():
+            return [
+                self._insert(item, delay_nanoseconds, dedup_key, None, None)
+                for item, dedup_key in zip(items, keys)
+            ]
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[None]:
+        """Join the caller's transaction or run an IMMEDIATE one."""
+        with self._write_connection_lock:
+            if self._connections.transaction_owner == threading.get_ident():
+                yield
+                return
+
+            with self.transaction(mode="IMMEDIATE"):
+                yield
+
+    def _insert(
+        self,
+        data: str,
+        delay_nanoseconds: int,
+        dedup_key: str | None,
+        partition_key: str | None,
+        topic: str | None,
+    ) -> Message:
+        """Insert one message while the caller holds the write lock."""
+        status = MessageStatus.DELAYED if delay_nanoseconds else MessageStatus.READY
+
+        while True:
+            message_id = self._new_message_id()
+            now = time_ns()
+            available_at = now + delay_nanoseconds
+            cursor = self.conn.execute(
+                self._sql.insert,
+                {
+                    "data": data,
+                    "message_id": message_id,
+                    "status": status.value,
+                    "now": now,
+                    "available_at": available_at,
+                    "dedup_key": dedup_key,
+                    "partition_key": partition_key,
+                    "topic": topic,
+                },
+            )
+            if cursor.rowcount > 0:
+                return Message(
+                    data=data,
+                    message_id=message_id,
+                    status=status,
+                    in_time=now,
+                    lock_time=None,
+                    done_time=None,
+                    available_at=available_at,
+                    dedup_key=dedup_key,
+                    partition_key=partition_key,
+                    topic=topic,
+                )
+
+            existing = _execute_tuples(
+                self.conn,
+                self._sql.select_by_dedup_key,
+                {"dedup_key": dedup_key},
+            ).fetchone()
+            # Another connection may prune the duplicate between the two
+            # statements. The key is free again, so insert the message.
+            if existing is not None:
+                return _message_from_row(existing)
+
+    def _coalesce(
+        self,
+        data: str,
+        delay_nanoseconds: int,
+        coalesce_key: str,
+        partition_key: str | None,
+        topic: str | None,
+    ) -> Message:
+        """
+        Insert or replace the pending message with the same coalesce key.
+
+        Raises `ValueError` when the pending message has a different topic or
+        partition key, because moving it would reorder its partition.
+        """
+        status = MessageStatus.DELAYED if delay_nanoseconds else MessageStatus.READY
+        now = time_ns()
+        # READY sorts before DELAYED, so MIN() keeps the earliest delivery.
+        cursor = self.conn.execute(
+            self._sql.coalesce,
+            {
+                "data": data,
+                "message_id": self._new_message_id(),
+                "status": status.value,
+                "now": now,
+                "available_at": now + delay_nanoseconds,
+                "coalesce_key": coalesce_key,
+                "partition_key": partition_key,
+                "topic": topic,
+            },
         )
+        message = _execute_tuples(
+            self.conn,
+            self._sql.select_pending_by_coalesce_key,
+            {"coalesce_key": coalesce_key},
+        ).fetchone()
+        if cursor.rowcount == 0:
+            raise ValueError(
+                f"coalesce_key {coalesce_key!r} belongs to a pending message with "
+                f"topic {message[_TOPIC_INDEX]!r} and partition_key "
+                f"{message[_PARTITION_KEY_INDEX]!r}"
+            )
 
-    def _pop_returning(self) -> Message | None:
-        with self.transaction(mode="IMMEDIATE"):
-            message = self.conn.execute(
-                f"""
-                 UPDATE {self.table}
-                 SET status = {MessageStatus.LOCKED.value}, lock_time = :now
-                 WHERE rowid = (SELECT rowid
-                                FROM {self.table}
-                                WHERE status = {MessageStatus.READY.value}
-                                ORDER BY message_id
-                                LIMIT 1)
-                 RETURNING *
-                 """,
-                {"now": time_ns()},
+        return _message_from_row(message)
+
+    def _promote_due_messages(self, now: int) -> None:
+        """Make delayed messages whose delay has passed ready to pop."""
+        self.conn.execute(
+            self._sql.promote_due_messages,
+            {"now": now},
+        )
+
+    def _unblocked_partition_condition(self, alias: str) -> str:
+        """
+        Return SQL that keeps a message only when it heads its partition.
+
+        A partition is blocked while one of its messages is locked, and a
+        message waits for every older ready or delayed sibling, including
+        delayed retries and siblings of other topics.
+        """
+        return f"""(
+          {alias}.partition_key IS NULL
+          OR (
+            NOT EXISTS (
+              SELECT 1 FROM {self.table} AS sibling
+              WHERE sibling.partition_key = {alias}.partition_key
+                AND sibling.status = {MessageStatus.LOCKED.value}
+            )
+            AND NOT EXISTS (
+              SELECT 1 FROM {self.table} AS sibling
+              WHERE sibling.partition_key = {alias}.partition_key
+                AND sibling.status IN ({_PENDING_STATUS_VALUES})
+                AND sibling.message_id < {alias}.message_id
+            )
+          )
+        )"""
+
+    def _peek_sql(self) -> str:
+        # pop() promotes due delayed messages before it claims, so the next
+        # message is the older of the ready head and the due delayed head.
+        # An OR of both statuses would sort every ready message instead.
+        head_sql = f"""
+            SELECT {_MESSAGE_COLUMN_SQL}
+            FROM {self.table} AS candidate
+            WHERE {{status_condition}}
+              AND {self._unblocked_partition_condition("candidate")}
+            ORDER BY message_id
+            LIMIT 1
+        """
+        heads = " UNION ALL ".join(
+            f"SELECT * FROM ({head_sql.format(status_condition=status_condition)})"
+            for status_condition in (
+                f"status = {MessageStatus.READY.value}",
+                f"status = {MessageStatus.DELAYED.value} AND available_at <= :now",
+            )
+        )
+        return f"SELECT * FROM ({heads}) ORDER BY message_id LIMIT 1"
+
+    def _claim_candidate_sql(self, topic_count: int) -> str:
+        """Return a query for the rowid of the next message to claim."""
+        head_sql = f"""
+            SELECT rowid, message_id
+            FROM {self.table} AS candidate
+            WHERE status = {MessageStatus.READY.value}
+              AND {self._unblocked_partition_condition("candidate")}
+              {{topic_condition}}
+            ORDER BY message_id
+            LIMIT 1
+        """
+        if topic_count == 0:
+            return head_sql.format(topic_condition="")
+
+        # An IN list over topics would sort every ready message of those
+        # topics. The head of each topic is one index seek, and only those
+        # heads are compared.
+        topic_heads = " UNION ALL ".join(
+            "SELECT * FROM ({head})".format(
+                head=head_sql.format(topic_condition=f"AND topic = :topic_{index}")
+            )
+            for index in range(topic_count)
+        )
+        return f"SELECT rowid FROM ({topic_heads}) ORDER BY message_id LIMIT 1"
+
+    def _build_statements(self) -> _QueueStatements:
+        """Build the SQL of frequent operations once for this queue's table."""
+        missing = MessageBatch.MISSING
+        batch_sql = (
+            "SELECT data, message_id, status, in_time"
+            f", COALESCE(lock_time, {missing}), COALESCE(done_time, {missing})"
+            f", COALESCE(available_at, {missing}), attempts "
+            f"FROM {self.table}"
+        )
+        return _QueueStatements(
+            insert=f"""
+                INSERT INTO
+                  {self.table}
+                       (  data,  message_id,  status, in_time, lock_time, done_time,  available_at,  dedup_key,  partition_key,  topic )
+                VALUES ( :data, :message_id, :status, :now   , NULL     , NULL     , :available_at, :dedup_key, :partition_key, :topic )
+                ON CONFLICT (dedup_key) WHERE dedup_key IS NOT NULL DO NOTHING
+            """.strip(),
+            select_by_dedup_key=(
+                f"SELECT {_MESSAGE_COLUMN_SQL} FROM {self.table} "
+                "WHERE dedup_key = :dedup_key"
+            ),
+            coalesce=f"""
+                INSERT INTO
+                  {self.table}
+                       (  data,  message_id,  status, in_time, lock_time, done_time,  available_at,  coalesce_key,  partition_key,  topic )
+                VALUES ( :data, :message_id, :status, :now   , NULL     , NULL     , :available_at, :coalesce_key, :partition_key, :topic )
+                ON CONFLICT (coalesce_key)
+                  WHERE coalesce_key IS NOT NULL AND status IN ({_PENDING_STATUS_VALUES})
+                DO UPDATE SET
+                  data = excluded.data
+                  , status = MIN(status, excluded.status)
+                  , available_at = MIN(available_at, excluded.available_at)
+                WHERE topic IS excluded.topic
+                  AND partition_key IS excluded.partition_key
+            """.strip(),
+            select_pending_by_coalesce_key=f"""
+                SELECT {_MESSAGE_COLUMN_SQL} FROM {self.table}
+                WHERE coalesce_key = :coalesce_key
+                  AND status IN ({_PENDING_STATUS_VALUES})
+            """.strip(),
+            promote_due_messages=f"""
+                UPDATE {self.table} SET status = {MessageStatus.READY.value}
+                WHERE status = {MessageStatus.DELAYED.value}
+                  AND available_at <= :now
+            """.strip(),
+            lock_selected_message=f"""
+                UPDATE {self.table} SET
+                  status = {MessageStatus.LOCKED.value}
+                  , lock_time = :lock_time
+                  , attempts = attempts + 1
+                WHERE message_id = :message_id
+                  AND status = {MessageStatus.READY.value}
+            """.strip(),
+            release=f"""
+                UPDATE {self.table} SET
+                  status = {MessageStatus.READY.value}
+                  , lock_time = NULL
+                  , attempts = MAX(attempts - 1, 0)
+                  , coalesce_key = CASE
+                    WHEN EXISTS (
+                      SELECT 1 FROM {self.table} AS pending
+                      WHERE pending.coalesce_key = {self.table}.coalesce_key
+                        AND pending.status IN ({_PENDING_STATUS_VALUES})
+                        AND pending.message_id != {self.table}.message_id
+                    )
+                    THEN NULL
+                    ELSE coalesce_key
+                  END
+                WHERE message_id = :message_id
+                  AND status = {MessageStatus.LOCKED.value}
+            """.strip(),
+            peek=self._peek_sql(),
+            get=(
+                f"SELECT {_MESSAGE_COLUMN_SQL} FROM {self.table} "
+                "WHERE message_id = :message_id"
+            ),
+            done=f"""
+                UPDATE {self.table} SET
+                  status = {MessageStatus.DONE.value}
+                  , done_time = :now
+                WHERE message_id = :message_id
+            """.strip(),
+            mark_failed=f"""
+                UPDATE {self.table} SET
+                  status = {MessageStatus.FAILED.value}
+                  , done_time = :now
+                WHERE message_id = :message_id
+            """.strip(),
+            list_locked=f"""
+                SELECT {_MESSAGE_COLUMN_SQL} FROM {self.table}
+                WHERE
+                  status = {MessageStatus.LOCKED.value}
+                  AND  lock_time < :time_value
+            """.strip(),
+            list_failed=f"""
+                SELECT {_MESSAGE_COLUMN_SQL} FROM {self.table}
+                WHERE
+                  status = {MessageStatus.FAILED.value}
+            """.strip(),
+            retry=f"""
+                UPDATE {self.table} SET
+                  status = CASE
+                    WHEN status = {MessageStatus.LOCKED.value}
+                      AND attempts >= :max_attempts
+                    THEN {MessageStatus.FAILED.value}
+                    ELSE :status
+                  END
+                  , done_time = CASE
+                    WHEN status = {MessageStatus.LOCKED.value}
+                      AND attempts >= :max_attempts
+                    THEN :now
+                    ELSE NULL
+                  END
+                  , available_at = :available_at
+                  , attempts = CASE
+                    WHEN status = {MessageStatus.FAILED.value} THEN 0
+                    ELSE attempts
+                  END
+                  , coalesce_key = CASE
+                    WHEN EXISTS (
+                      SELECT 1 FROM {self.table} AS pending
+                      WHERE pending.coalesce_key = {self.table}.coalesce_key
+                        AND pending.status IN ({_PENDING_STATUS_VALUES})
+                        AND pending.message_id != {self.table}.message_id
+                    )
+                    THEN NULL
+                    ELSE coalesce_key
+                  END
+                WHERE message_id = :message_id
+            """.strip(),
+            next_due_time=f"""
+                SELECT MIN(available_at) FROM {self.table}
+                WHERE status = {MessageStatus.DELAYED.value}
+            """.strip(),
+            # Naming the unfinished statuses lets the count seek them in the
+            # status index instead of scanning past every finished message.
+            qsize=f"""
+                SELECT COUNT(*) FROM {self.table}
+                WHERE status IN ({MessageStatus.READY.value}, {MessageStatus.LOCKED.value}, {MessageStatus.DELAYED.value})
+            """.strip(),
+            empty=f"""
+                SELECT COUNT(*) as cnt FROM {self.table}
+                WHERE status = {MessageStatus.READY.value}
+                  OR (status = {MessageStatus.DELAYED.value} AND available_at <= :now)
+            """.strip(),
+            batch=batch_sql,
+            batch_by_status=f"{batch_sql} WHERE status = :status",
+            # Unary + stops the planner from looking finished messages up by
+            # status, which would visit all of them instead of the window.
+            stats_counts=f"""
+                SELECT status, COUNT(*) FROM {self.table}
+                WHERE done_time BETWEEN :since AND :now
+                  AND +status IN ({MessageStatus.DONE.value}, {MessageStatus.FAILED.value})
+                GROUP BY status
+            """.strip(),
+            stats_throughput=f"""
+                SELECT (done_time - :since) / :interval AS bucket, COUNT(*)
+                FROM {self.table}
+                WHERE done_time BETWEEN :since AND :now
+                  AND +status = {MessageStatus.DONE.value}
+                GROUP BY bucket
+            """.strip(),
+            stats_percentiles=self._stats_percentiles_sql(),
+            count_pending=(
+                f"SELECT COUNT(*) as cnt FROM {self.table} "
+                f"WHERE status IN ({_PENDING_STATUS_VALUES})"
+            ),
+        )
+
+    def _stats_percentiles_sql(self) -> str:
+        # CUME_DIST() is the fraction of rows up to and including a value, so
+        # the smallest value reaching p / 100 is the nearest-rank percentile.
+        # Both orderings are computed in the same pass over the window.
+        columns = ", ".join(
+            f"MIN(CASE WHEN {name}_fraction >= {percentile / 100} THEN {name} END)"
+            for name in ("wait_time", "processing_time")
+            for percentile in STATS_PERCENTILES
+        )
+        return f"""
+            SELECT {columns} FROM (
+              SELECT
+                wait_time
+                , CUME_DIST() OVER (ORDER BY wait_time) AS wait_time_fraction
+                , processing_time
+                , CUME_DIST() OVER (ORDER BY processing_time) AS processing_time_fraction
+              FROM (
+                SELECT
+                  lock_time - COALESCE(available_at, in_time) AS wait_time
+                  , done_time - lock_time AS processing_time
+                FROM {self.table}
+                WHERE done_time BETWEEN :since AND :now
+                  AND +status = {MessageStatus.DONE.value}
+                  AND lock_time IS NOT NULL
+              )
+            )
+        """.strip()
+
+    def _pop_statement(self, returning: bool, topic_count: int) -> str:
+        """Return the claim statement for `topic_count` topics, built once."""
+        statements = self._sql.pop_returning if returning else self._sql.pop_select
+        statement = statements.get(topic_count)
+        if statement is not None:
+            return statement
+
+        candidate_sql = self._claim_candidate_sql(topic_count)
+        if returning:
+            statement = f"""
+                UPDATE {self.table}
+                SET status = {MessageStatus.LOCKED.value}, lock_time = :now
+                  , attempts = attempts + 1
+                WHERE rowid = (SELECT rowid FROM ({candidate_sql}))
+                RETURNING {_MESSAGE_COLUMN_SQL}
+            """.strip()
+        else:
+            statement = f"""
+                SELECT {_MESSAGE_COLUMN_SQL} FROM {self.table}
+                WHERE rowid = (SELECT rowid FROM ({candidate_sql}))
+            """.strip()
+        statements[topic_count] = statement
+        return statement
+
+    @_timed("pop")
+    def _pop_returning(self, topics: Collection[str] | None = None) -> Message | None:
+        topic_parameters = _topic_parameters(topics)
+        with self._write_transaction():
+            now = time_ns()
+            self._promote_due_messages(now)
+            message = _execute_tuples(
+                self.conn,
+                self._pop_statement(True, len(topic_parameters)),
+                {"now": now, **topic_parameters},
             ).fetchone()
 
             if not message:
@@ -430,16 +2215,19 @@ END;"""
 
             return _message_from_row(message)
 
-    def _pop_transaction(self) -> Message | None:
+    @_timed("pop")
+    def _pop_transaction(
+        self,
+        topics: Collection[str] | None = None,
+    ) -> Message | None:
         """Claim one message on SQLite versions without RETURNING support."""
-        with self.transaction(mode="IMMEDIATE"):
-            message = self.conn.execute(
-                f"""
-                SELECT * FROM {self.table}
-                WHERE status = {MessageStatus.READY.value}
-                ORDER BY message_id
-                LIMIT 1
-                """.strip()
+        topic_parameters = _topic_parameters(topics)
+        with self._write_transaction():
+            self._promote_due_messages(time_ns())
+            message = _execute_tuples(
+                self.conn,
+                self._pop_statement(False, len(topic_parameters)),
+                topic_parameters,
             ).fetchone()
 
             if message is None:
@@ -447,16 +2235,10 @@ END;"""
 
             lock_time = time_ns()
             self.conn.execute(
-                f"""
-                UPDATE {self.table} SET
-                  status = {MessageStatus.LOCKED.value}
-                  , lock_time = :lock_time
-                WHERE message_id = :message_id
-                  AND status = {MessageStatus.READY.value}
-                """.strip(),
+                self._sql.lock_selected_message,
                 {
                     "lock_time": lock_time,
-                    "message_id": message["message_id"],
+                    "message_id": message[_MESSAGE_ID_INDEX],
                 },
             )
 
@@ -465,13 +2247,205 @@ END;"""
                 selected_message,
                 status=MessageStatus.LOCKED,
                 lock_time=lock_time,
+                attempts=selected_message.attempts + 1,
             )
 
+    @_timed("pop_many")
+    def pop_many(
+        self,
+        limit: int,
+        topics: Collection[str] | None = None,
+    ) -> list[Message]:
+        """
+        Claim up to `limit` messages in one write transaction.
+
+        Each message is claimed exactly as `pop()` would claim it, in FIFO
+        order, but the write lock and transaction are taken once for the
+        whole batch. Returns an empty list when no message is ready.
+        """
+        limit = validate_limit(limit)
+        messages: list[Message] = []
+        with self._write_transaction():
+            while len(messages) < limit:
+                message = self.pop(topics=topics)
+                if message is None:
+                    break
+                messages.append(message)
+
+        return messages
+
+    @_timed("release")
+    def release(self, message_id: str) -> bool:
+        """
+        Return a locked message that was never processed to `READY`.
+
+        Unlike `retry()`, the claim does not count as an attempt. Use it for
+        messages a consumer claimed ahead of time and did not start.
+
+        Return `True` when a locked message was released, otherwise `False`.
+        """
+
+        with self._write_connection_lock:
+            cursor = self.conn.execute(
+                self._sql.release,
+                {"message_id": message_id},
+            )
+
+        return cursor.rowcount > 0
+
+    def consume(
+        self,
+        handler: Callable[[Message], object],
+        workers: int = 1,
+        batch_size: int | None = None,
+        topics: Collection[str] | None = None,
+        stop: threading.Event | None = None,
+        idle_timeout: float | None = None,
+        max_messages: int | None = None,
+        retry_delay_seconds: float = 0,
+        max_idle_sleep: float = 1.0,
+    ) -> ConsumeStats:
+        """
+        Run `handler` for each message on a pool of `workers` threads.
+
+        One claim loop feeds the pool: it claims up to `batch_size` messages
+        at a time with `pop_many()` and never holds more than
+        `workers + batch_size` messages. Messages whose handler returns are
+        marked done, and messages whose handler raises are retried after
+        `retry_delay_seconds`. Acknowledgements of messages that finished
+        together are written in one transaction. Do not acknowledge messages
+        inside the handler.
+
+        When nothing is ready, the loop sleeps with exponential backoff up to
+        `max_idle_sleep` seconds, and never past the next delayed message.
+
+        The loop stops when `stop` is set, after `max_messages` claims, or
+        after `idle_timeout` seconds without messages. `idle_timeout=0` stops
+        as soon as the queue is drained. On stop, including
+        `KeyboardInterrupt`, queued messages that no worker started are
+        released, running handlers finish and are acknowledged, and the
+        interrupt is raised again.
+
+        Returns throughput statistics for the run.
+        """
+        workers = validate_limit(workers, "workers")
+        if batch_size is None:
+            batch_size = workers
+        batch_size = validate_limit(batch_size, "batch_size")
+        if max_messages is not None:
+            max_messages = validate_limit(max_messages, "max_messages")
+        if idle_timeout is not None:
+            idle_timeout = validate_seconds("idle_timeout", idle_timeout)
+        validate_delay_seconds(retry_delay_seconds)
+        max_idle_sleep = validate_seconds("max_idle_sleep", max_idle_sleep)
+        _topic_parameters(topics)
+
+        def run(message: Message) -> BaseException | None:
+            try:
+                handler(message)
+            except Exception as error:
+                return error
+            return None
+
+        processed = failed = released = claimed = 0
+        in_flight: dict[Future[BaseException | None], Message] = {}
+
+        def acknowledge(finished: Iterable[Future[BaseException | None]]) -> None:
+            nonlocal processed, failed
+            results = [(in_flight.pop(future), future.result()) for future in finished]
+            if not results:
+                return
+
+            with self._write_transaction():
+                for message, error in results:
+                    if error is None:
+                        self.done(message.message_id)
+                        processed += 1
+                    else:
+                        self.retry(
+                            message.message_id, delay_seconds=retry_delay_seconds
+                        )
+                        failed += 1
+
+        start = time.monotonic()
+        idle_since = start
+        idle_sleep = min(0.001, max_idle_sleep)
+        executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="litequeue-consume"
+        )
+        try:
+            while stop is None or not stop.is_set():
+                free_slots = workers + batch_size - len(in_flight)
+                if max_messages is not None:
+                    free_slots = min(free_slots, max_messages - claimed)
+                    if free_slots <= 0 and not in_flight:
+                        break
+
+                messages = (
+                    self.pop_many(min(free_slots, batch_size), topics=topics)
+                    if free_slots > 0
+                    else []
+                )
+                for message in messages:
+                    in_flight[executor.submit(run, message)] = message
+                claimed += len(messages)
+
+                now = time.monotonic()
+                finished: Iterable[Future[BaseException | None]]
+                if messages:
+                    idle_since = now
+                    idle_sleep = min(0.001, max_idle_sleep)
+                    finished = [future for future in in_flight if future.done()]
+                elif free_slots <= 0:
+                    idle_since = now
+                    finished, _ = wait(
+                        in_flight, timeout=max_idle_sleep, return_when=FIRST_COMPLETED
+                    )
+                elif in_flight:
+                    idle_since = now
+                    finished, _ = wait(
+                        in_flight, timeout=idle_sleep, return_when=FIRST_COMPLETED
+                    )
+                    idle_sleep = min(idle_sleep * 2, max_idle_sleep)
+                else:
+                    if idle_timeout is not None and now - idle_since >= idle_timeout:
+                        break
+                    sleep_seconds = idle_sleep
+                    next_due_time = self.next_due_time()
+                    if next_due_time is not None:
+                        sleep_seconds = min(
+                            sleep_seconds, max(0, next_due_time - time_ns()) / 1e9
+                        )
+                    if stop is not None:
+                        stop.wait(sleep_seconds)
+                    else:
+                        time.sleep(sleep_seconds)
+                    idle_sleep = min(idle_sleep * 2, max_idle_sleep)
+                    continue
+
+                acknowledge(finished)
+        finally:
+            for future, message in list(in_flight.items()):
+                if future.cancel():
+                    del in_flight[future]
+                    self.release(message.message_id)
+                    released += 1
+            acknowledge(wait(in_flight).done)
+            executor.shutdown()
+
+        return ConsumeStats(
+            processed=processed,
+            failed=failed,
+            released=released,
+            elapsed_seconds=time.monotonic() - start,
+        )
+
     @contextmanager
     def _read_connection(self) -> Iterator[sqlite3.Connection]:
         """Check out a read connection with correct transaction visibility."""
         current_thread = threading.get_ident()
-        transaction_is_owned = self._transaction_owner == current_thread
+        connections = self._connections
+        transaction_is_owned = connections.transaction_owner == current_thread
         if transaction_is_owned:
             # The transaction owner must read through the write connection to
             # see its own uncommitted changes. RLock makes this reacquisition
@@ -480,44 +2454,41 @@ END;"""
                 yield self.conn
             return
 
-        read_connections = self._read_connections
-        with self._close_state_lock:
-            if self._is_closed:
-                raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
-            # Checkout happens while holding the close-state lock so close()
-            # cannot drain the pool between the closed check and Queue.get().
-            # Returning a connection never needs this lock, so waiting here
-            # cannot prevent an active reader from releasing a pool slot.
-            read_connection = read_connections.get()
-
+        read_connection = connections.checkout_read_connection()
         try:
             yield read_connection
         finally:
             # Always return the connection, including when row conversion or a
             # SQLite call fails, so one error cannot slowly exhaust the pool.
-            read_connections.put(read_connection)
+            connections.return_read_connection(read_connection)
 
+    @_timed("peek")
     def peek(self) -> Message | None:
         "Show next message to be popped, if any."
 
         with self._read_connection() as connection:
-            value = connection.execute(
-                f"SELECT * FROM {self.table} WHERE status = {MessageStatus.READY.value} ORDER BY message_id LIMIT 1",
+            value = _execute_tuples(
+                connection,
+                self._sql.peek,
+                {"now": time_ns()},
             ).fetchone()
 
         return _message_from_row(value) if value is not None else None
 
+    @_timed("get")
     def get(self, message_id: str) -> Message | None:
         "Get a message by its `message_id`"
 
         with self._read_connection() as connection:
-            value = connection.execute(
-                f"SELECT * FROM {self.table} WHERE message_id = :message_id",
+            value = _execute_tuples(
+                connection,
+                self._sql.get,
                 {"message_id": message_id},
             ).fetchone()
 
         return _message_from_row(value) if value is not None else None
 
+    @_timed("done")
     def done(self, message_id: str) -> bool:
         """
         Mark message as done.
@@ -531,17 +2502,13 @@ END;"""
 
         with self._write_connection_lock:
             cursor = self.conn.execute(
-                f"""
-                UPDATE {self.table} SET
-                  status = {MessageStatus.DONE.value}
-                  , done_time = :now
-                WHERE message_id = :message_id
-                """.strip(),
+                self._sql.done,
                 {"now": now, "message_id": message_id},
             )
 
         return cursor.rowcount > 0
 
+    @_timed("mark_failed")
     def mark_failed(self, message_id: str) -> bool:
         """
         Mark a message as failed.
@@ -551,103 +2518,246 @@ END;"""
 
         with self._write_connection_lock:
             cursor = self.conn.execute(
-                f"""
-                UPDATE {self.table} SET
-                  status = {MessageStatus.FAILED.value}
-                  , done_time = :now
-                WHERE message_id = :message_id
-                """.strip(),
+                self._sql.mark_failed,
                 {"now": time_ns(), "message_id": message_id},
             )
 
         return cursor.rowcount > 0
 
-    def list_locked(self, threshold_seconds: int) -> Iterator[Message]:
+    @overload
+    def list_locked(
+        self, threshold_seconds: float, raw: Literal[False] = False
+    ) -> Iterator[Message]: ...
+
+    @overload
+    def list_locked(
+        self, threshold_seconds: float, raw: Literal[True]
+    ) -> Iterator[MessageRow]: ...
+
+    @_timed("list_locked")
+    def list_locked(
+        self, threshold_seconds: float, raw: bool = False
+    ) -> Iterator[Message] | Iterator[MessageRow]:
         """
         Return all the tasks that have been in the `LOCKED` state for more than
         `threshold_seconds` seconds.
+
+        With `raw=True`, return `MessageRow` tuples instead of messages.
         """
 
         threshold_nanoseconds = threshold_seconds * 1e9
 
         with self._read_connection() as connection:
-            rows = connection.execute(
-                f"""
-                SELECT * FROM {self.table}
-                WHERE
-                  status = {MessageStatus.LOCKED.value}
-                  AND  lock_time < :time_value
-                """.strip(),
+            rows = _execute_tuples(
+                connection,
+                self._sql.list_locked,
                 {"time_value": time_ns() - threshold_nanoseconds},
             ).fetchall()
 
-        for result in rows:
-            yield _message_from_row(result)
+        return iter(rows) if raw else map(_message_from_row, rows)
+
+    @_timed("reclaim_locked")
+    def reclaim_locked(self, threshold_seconds: float) -> int:
+        """
+        Retry messages locked for more than `threshold_seconds` seconds.
+
+        Use it to recover messages claimed by workers that crashed before
+        acknowledging them. Each reclaimed message is retried as `retry()`
+        would retry it, so the lost claim counts as an attempt. Returns the
+        number of reclaimed messages.
+        """
+        threshold_seconds = validate_seconds("threshold_seconds", threshold_seconds)
+        with self._write_transaction():
+            stale_ids = [
+                message.message_id for message in self.list_locked(threshold_seconds)
+            ]
+            for message_id in stale_ids:
+                self.retry(message_id)
+
+        return len(stale_ids)
 
-    def list_failed(self) -> Iterator[Message]:
+    @overload
+    def list_failed(self, raw: Literal[False] = False) -> Iterator[Message]: ...
+
+    @overload
+    def list_failed(self, raw: Literal[True]) -> Iterator[MessageRow]: ...
+
+    @_timed("list_failed")
+    def list_failed(
+        self, raw: bool = False
+    ) -> Iterator[Message] | Iterator[MessageRow]:
         """
         Return all the tasks in `FAILED` state.
+
+        With `raw=True`, return `MessageRow` tuples instead of messages. They
+        skip building a `Message` per row, which dominates large listings.
         """
 
         with self._read_connection() as connection:
-            rows = connection.execute(
-                f"""
-                SELECT * FROM {self.table}
-                WHERE
-                  status = {MessageStatus.FAILED.value}
-                """.strip()
-            ).fetchall()
+            rows = _execute_tuples(connection, self._sql.list_failed).fetchall()
+
+        return iter(rows) if raw else map(_message_from_row, rows)
+
+    @_timed("message_batch")
+    def message_batch(self, status: MessageStatus | None = None) -> MessageBatch:
+        """
+        Return the messages with `status`, or all messages, as columns.
 
-        for result in rows:
-            yield _message_from_row(result)
+        Rows are read in chunks straight into the arrays of a `MessageBatch`,
+        so no `Message` or row list is built for the whole listing.
+        """
+        batch = MessageBatch()
+        self._extend_batch(batch, status)
+        return batch
+
+    def _extend_batch(self, batch: MessageBatch, status: MessageStatus | None) -> None:
+        if status is None:
+            sql, parameters = self._sql.batch, {}
+        else:
+            sql = self._sql.batch_by_status
+            parameters = {"status": MessageStatus(status).value}
+
+        with self._read_connection() as connection:
+            cursor = _execute_tuples(connection, sql, parameters)
+            while rows := cursor.fetchmany(_BATCH_FETCH_SIZE):
+                batch._extend(rows)
+
+    @_timed("stats")
+    def stats(self, window: float = 3600, interval: float = 60) -> QueueStats:
+        """
+        Return timing statistics of the messages finished in the last
+        `window` seconds, with throughput counted per `interval` seconds.
 
-    def retry(self, message_id: str) -> bool:
+        The aggregates run in SQLite on a read connection, over an index on
+        `done_time`, so they only touch the messages in the window and do not
+        block writers.
+        """
+        for name, seconds in (("window", window), ("interval", interval)):
+            validate_seconds(name, seconds)
+            if not seconds:
+                raise ValueError(f"{name} must be positive")
+
+        now = time_ns()
+        interval_nanoseconds = max(round(interval * 1e9), 1)
+        parameters = {
+            "since": now - round(window * 1e9),
+            "now": now,
+            "interval": interval_nanoseconds,
+        }
+        throughput = [0] * math.ceil(window / interval)
+
+        with self._read_connection() as connection:
+            counts = dict(
+                _execute_tuples(connection, self._sql.stats_counts, parameters)
+            )
+            for bucket, count in _execute_tuples(
+                connection, self._sql.stats_throughput, parameters
+            ):
+                # The newest message can land one past the last interval.
+                throughput[min(bucket, len(throughput) - 1)] += count
+            percentiles = _execute_tuples(
+                connection, self._sql.stats_percentiles, parameters
+            ).fetchone()
+
+        wait_time, processing_time = (
+            {
+                percentile: value
+                for percentile, value in zip(STATS_PERCENTILES, values)
+                if value is not None
+            }
+            for values in (
+                percentiles[: len(STATS_PERCENTILES)],
+                percentiles[len(STATS_PERCENTILES) :],
+            )
+        )
+        return QueueStats(
+            window_seconds=window,
+            interval_seconds=interval,
+            done=counts.get(MessageStatus.DONE.value, 0),
+            failed=counts.get(MessageStatus.FAILED.value, 0),
+            wait_time=wait_time,
+            processing_time=processing_time,
+            throughput=throughput,
+        )
+
+    @_timed("retry")
+    def retry(self, message_id: str, delay_seconds: float = 0) -> bool:
         """
         Mark a locked message as free again.
 
+        With `delay_seconds`, the message stays `DELAYED` until the delay has
+        passed, which allows retries with backoff that survive restarts.
+
+        When the queue has `max_attempts`, a locked message that used all its
+        attempts moves to `FAILED` in the same statement instead. Retrying a
+        `FAILED` message resets its attempt counter.
+
+        If a newer pending message took over the coalesce key while this one
+        was locked, the retried message keeps running but loses its key.
+
         Return `True` when the message exists, otherwise `False`.
         """
 
+        delay_nanoseconds = validate_delay_seconds(delay_seconds)
+        status = MessageStatus.DELAYED if delay_nanoseconds else MessageStatus.READY
+        now = time_ns()
+
         with self._write_connection_lock:
             cursor = self.conn.execute(
-                f"""
-                UPDATE {self.table} SET
-                  status = {MessageStatus.READY.value}
-                  , done_time = NULL
-                WHERE message_id = :message_id
-                """.strip(),
-                {"message_id": message_id},
+                self._sql.retry,
+                {
+                    "status": status.value,
+                    "max_attempts": self.max_attempts,
+                    "now": now,
+                    "available_at": now + delay_nanoseconds,
+                    "message_id": message_id,
+                },
             )
 
         return cursor.rowcount > 0
 
+    @_timed("next_due_time")
+    def next_due_time(self) -> int | None:
+        """
+        Return when the earliest `DELAYED` message becomes available.
+
+        The value uses the same nanosecond clock as `in_time`. Return `None`
+        when no message is delayed.
+        """
+
+        with self._read_connection() as connection:
+            value = connection.execute(self._sql.next_due_time).fetchone()
+
+        return value[0]
+
+    @_timed("qsize")
     def qsize(self) -> int:
         """
         Get current size of the queue.
         """
 
         with self._read_connection() as connection:
-            cursor = connection.execute(
-                f"""
-            SELECT COUNT(*) FROM {self.table}
-            WHERE status NOT IN ({MessageStatus.DONE.value}, {MessageStatus.FAILED.value})
-            """.strip()
-            )
+            cursor = connection.execute(self._sql.qsize)
             size = next(cursor)[0]
 
         return size
 
+    @_timed("empty")
     def empty(self) -> bool:
         """
         Return True if the queue is empty.
+
+        Delayed messages that are not due yet do not count.
         """
 
         with self._read_connection() as connection:
             value = connection.execute(
-                f"SELECT COUNT(*) as cnt FROM {self.table} WHERE status = {MessageStatus.READY.value}"
+                self._sql.empty,
+                {"now": time_ns()},
             ).fetchone()
         return not bool(value["cnt"])
 
+    @_timed("full")
     def full(self) -> bool:
         """
         Return True if the queue is full.
@@ -659,15 +2769,14 @@ END;"""
             return False
 
         with self._read_connection() as connection:
-            value = connection.execute(
-                f"SELECT COUNT(*) as cnt FROM {self.table} WHERE status = {MessageStatus.READY.value}"
-            ).fetchone()
+            value = connection.execute(self._sql.count_pending).fetchone()
 
         if value["cnt"] >= self.maxsize:
             return True
         else:
             return False
 
+    @_timed("prune")
     def prune(self, include_failed: bool = True) -> None:
         """
         Delete `DONE` messages.
@@ -684,6 +2793,7 @@ END;"""
                     f"DELETE FROM {self.table} WHERE status IN ({MessageStatus.DONE.value})"
                 )
 
+    @_timed("vacuum")
     def vacuum(self) -> None:
         """
         Vacuum the database.
@@ -702,47 +2812,678 @@ END;"""
         if mode not in {"DEFERRED", "IMMEDIATE", "EXCLUSIVE"}:
             raise ValueError(f"Transaction mode '{mode}' is not valid")
         with self._write_connection_lock:
+            metrics = self._connections.metrics
+            start = time.perf_counter()
             # We must issue a "BEGIN" explicitly when running in auto-commit mode.
             self.conn.execute(f"BEGIN {mode}")
-            self._transaction_owner = threading.get_ident()
+            self._connections.transaction_owner = threading.get_ident()
             try:
                 # Yield control back to the caller.
                 yield
             except BaseException:
                 self.conn.rollback()  # Roll back all changes if an exception occurs.
+                if metrics is not None:
+                    metrics.record("rollback", time.perf_counter() - start)
                 raise
             else:
                 self.conn.commit()
+                if metrics is not None:
+                    metrics.record("transaction", time.perf_counter() - start)
             finally:
-                self._transaction_owner = None
+                self._connections.transaction_owner = None
 
     def __repr__(self) -> str:
         with self._read_connection() as connection:
-            rows = connection.execute(f"SELECT * FROM {self.table} LIMIT 3").fetchall()
+            rows = _execute_tuples(
+                connection,
+                f"SELECT {_MESSAGE_COLUMN_SQL} FROM {self.table} LIMIT 3",
+            ).fetchall()
             display_items = [_message_from_row(row) for row in rows]
-            connection_repr = repr(self.conn)
+            connection_repr = repr(connection)
 
         items = pprint.pformat(display_items)
         return f"{type(self).__name__}(Connection={connection_repr}, items={items})"
 
     def close(self) -> None:
-        with self._write_connection_lock:
-            with self._close_state_lock:
-                if self._is_closed:
+        self._shared_connections.close()
+
+
+def _validate_open_arguments(
+    filename: str | Path,
+    metrics: QueueMetrics | None,
+    profiler: SQLProfiler | None,
+    kwargs: dict[str, Any],
+) -> None:
+    filename_is_supported = isinstance(filename, (str, Path))
+    if not filename_is_supported:
+        raise TypeError("filename must be a string or pathlib.Path")
+
+    if metrics is not None and not isinstance(metrics, QueueMetrics):
+        raise TypeError("metrics must be a QueueMetrics instance")
+
+    if profiler is not None and not isinstance(profiler, SQLProfiler):
+        raise TypeError("profiler must be a SQLProfiler instance")
+
+    if filename == "":
+        raise ValueError("filename must not be empty")
+
+    managed_options = _MANAGED_CONNECTION_OPTIONS.intersection(kwargs)
+    if managed_options:
+        option_list = ", ".join(sorted(managed_options))
+        raise ValueError(f"LiteQueue manages SQLite connection options: {option_list}")
+
+
+def _open_readonly_queue(
+    queue_class: type[LiteQueue],
+    connections: _SharedConnections,
+    name: str | None,
+) -> LiteQueue:
+    queue = object.__new__(queue_class)
+    queue._attach(connections, name=name)
+    queue._load_settings()
+    return queue
+
+
+def _reopen_queue(
+    filename: str,
+    connection_options: dict[str, Any],
+    name: str | None,
+    read_pool_size: int = _READ_CONNECTION_POOL_SIZE,
+    read_only: bool = False,
+) -> LiteQueue:
+    if read_only:
+        # The filename is already the read-only URI built by open_readonly().
+        connections = _SharedConnections(
+            filename, connection_options, read_pool_size, read_only=True
+        )
+        return _open_readonly_queue(LiteQueue, connections, name)
+
+    queue = LiteQueue(filename, read_pool_size=read_pool_size, **connection_options)
+    return queue if name is None else queue.named_queue(name)
+
+
+class LiteLog:
+    def __init__(self, queue: LiteQueue, name: str) -> None:
+        """
+        Append-only message log with one committed offset per consumer group.
+
+        Create logs with `LiteQueue.log(name)`. Each entry is written once, no
+        matter how many consumer groups read it. Reading is a range scan after
+        the group's committed offset and never updates the entries, so fan-out
+        to many groups costs one row per message instead of one queue per
+        subscriber.
+
+        A consumer group reads its entries in order. Commit the offset of the
+        last processed entry to move the group forward. Entries are
+        redelivered until their offset is committed. A group has one reader at
+        a time. Use a `LiteQueue` when several workers share the same work.
+        """
+        self._queue = queue
+        self.name = name
+        self.table_name = f"{_LOG_TABLE_NAME}:{name}"
+        self.table = f'"{self.table_name}"'
+
+        with queue._write_transaction():
+            # AUTOINCREMENT keeps offsets increasing after retention deletes
+            # the newest entries, so a committed offset is never reused.
+            queue.conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.table}
+                (
+                  log_offset INTEGER PRIMARY KEY AUTOINCREMENT
+                  , data     TEXT NOT NULL
+                  , in_time  INTEGER NOT NULL
+                )
+                """
+            )
+            queue.conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS "{_LOG_OFFSETS_TABLE_NAME}"
+                (
+                  log_table          TEXT NOT NULL
+                  , group_name       TEXT NOT NULL
+                  , committed_offset INTEGER NOT NULL
+                  , PRIMARY KEY (log_table, group_name)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def append(self, data: str) -> LogEntry:
+        """Append one entry and return it with its offset."""
+        with self._queue._write_transaction():
+            return self._append(data)
+
+    def append_many(self, data: Iterable[str]) -> list[LogEntry]:
+        """Append several entries in one transaction, in input order."""
+        with self._queue._write_transaction():
+            return [self._append(item) for item in data]
+
+    def _append(self, data: str) -> LogEntry:
+        now = time_ns()
+        cursor = self._queue.conn.execute(
+            f"INSERT INTO {self.table} (data, in_time) VALUES (:data, :in_time)",
+            {"data": data, "in_time": now},
+        )
+        assert cursor.lastrowid is not None
+        return LogEntry(offset=cursor.lastrowid, data=data, in_time=now)
+
+    def read(self, group: str, limit: int = 100) -> list[LogEntry]:
+        """
+        Return up to `limit` entries after the group's committed offset.
+
+        A group without a committed offset reads from the oldest retained
+        entry. Reading does not move the group forward. Call `commit()`.
+        """
+        group = validate_group(group)
+        limit = validate_limit(limit)
+
+        with self._queue._read_connection() as connection:
+            rows = connection.execute(
+                f"""
+                SELECT log_offset, data, in_time FROM {self.table}
+                WHERE log_offset > COALESCE(
+                    (
+                      SELECT committed_offset FROM "{_LOG_OFFSETS_TABLE_NAME}"
+                      WHERE log_table = :log_table AND group_name = :group
+                    ),
+                    0
+                )
+                ORDER BY log_offset
+                LIMIT :limit
+                """.strip(),
+                {"log_table": self.table_name, "group": group, "limit": limit},
+            ).fetchall()
+
+        return [
+            LogEntry(offset=row["log_offset"], data=row["data"], in_time=row["in_time"])
+            for row in rows
+        ]
+
+    def commit(self, group: str, offset: int) -> None:
+        """
+        Record that the group processed every entry up to `offset`.
+
+        Committing registers the group, so retention keeps its unread entries.
+        Commit `0` to register a group before it reads. Offsets never move
+        backwards; committing an older offset keeps the newer one.
+        """
+        group = validate_group(group)
+        if isinstance(offset, bool) or not isinstance(offset, int):
+            raise TypeError("offset must be an integer")
+
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+
+        with self._queue._write_transaction():
+            last_offset = self._last_offset(self._queue.conn)
+            if offset > last_offset:
+                raise ValueError(
+                    f"offset {offset} is after the last appended offset {last_offset}"
+                )
+
+            self._queue.conn.execute(
+                f"""
+                INSERT INTO "{_LOG_OFFSETS_TABLE_NAME}"
+                    (log_table, group_name, committed_offset)
+                VALUES (:log_table, :group, :offset)
+                ON CONFLICT (log_table, group_name) DO UPDATE
+                SET committed_offset = MAX(committed_offset, excluded.committed_offset)
+                """.strip(),
+                {"log_table": self.table_name, "group": group, "offset": offset},
+            )
+
+    def _last_offset(self, connection: sqlite3.Connection) -> int:
+        row = connection.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = :log_table",
+            {"log_table": self.table_name},
+        ).fetchone()
+        return 0 if row is None else row["seq"]
+
+    def last_offset(self) -> int:
+        """Return the offset of the newest entry ever appended, or 0."""
+        with self._queue._read_connection() as connection:
+            return self._last_offset(connection)
+
+    def groups(self) -> dict[str, int]:
+        """Return the committed offset of every registered group."""
+        with self._queue._read_connection() as connection:
+            rows = connection.execute(
+                f"""
+                SELECT group_name, committed_offset FROM "{_LOG_OFFSETS_TABLE_NAME}"
+                WHERE log_table = :log_table
+                ORDER BY group_name
+                """.strip(),
+                {"log_table": self.table_name},
+            ).fetchall()
+
+        return {row["group_name"]: row["committed_offset"] for row in rows}
+
+    def remove_group(self, group: str) -> bool:
+        """Forget a group so it no longer holds back retention."""
+        group = validate_group(group)
+        with self._queue._write_transaction():
+            cursor = self._queue.conn.execute(
+                f"""
+                DELETE FROM "{_LOG_OFFSETS_TABLE_NAME}"
+                WHERE log_table = :log_table AND group_name = :group
+                """.strip(),
+                {"log_table": self.table_name, "group": group},
+            )
+        return cursor.rowcount > 0
+
+    def retain(self) -> int:
+        """
+        Delete the entries every registered group has committed.
+
+        Returns the number of deleted entries. Nothing is deleted while the log
+        has no registered groups.
+        """
+        with self._queue._write_transaction():
+            # A range delete on the integer primary key; entries newer than the
+            # slowest group's offset are never visited.
+            cursor = self._queue.conn.execute(
+                f"""
+                DELETE FROM {self.table}
+                WHERE log_offset <= (
+                    SELECT MIN(committed_offset) FROM "{_LOG_OFFSETS_TABLE_NAME}"
+                    WHERE log_table = :log_table
+                )
+                """.strip(),
+                {"log_table": self.table_name},
+            )
+        return cursor.rowcount
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (type(self), (self._queue, self.name))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(name={self.name!r}, groups={self.groups()!r})"
+
+
+_SHARD_INDEX_MASK = 0xFFFF
+
+
+def _sharded_message_id_factory(shard_index: int) -> Callable[[], str]:
+    """Return a UUIDv7 generator that stores the shard in the random bits."""
+
+    def new_message_id() -> str:
+        # Only random tail bits change, so IDs stay valid, time-ordered UUIDv7.
+        value = uuid7().int
+        return str(UUID(int=(value & ~_SHARD_INDEX_MASK) | shard_index))
+
+    return new_message_id
+
+
+class ShardedLiteQueue:
+    def __init__(
+        self,
+        filenames: Sequence[str | Path],
+        maxsize: int | None = None,
+        max_attempts: int | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        Spread one logical queue over several SQLite databases.
+
+        SQLite allows one writer per database. Each shard is a `LiteQueue` with
+        its own file and write lock, so producers and consumers that hit
+        different shards do not wait for each other.
+
+        Args:
+        - filenames: One database location per shard. Reopen the queue with
+          the same files in the same order.
+        - maxsize, max_attempts: Settings applied to every shard. `maxsize`
+          limits the ready messages of each shard.
+        - kwargs: Options forwarded to every shard's `LiteQueue`.
+
+        `put()` spreads messages round-robin. Messages with a `partition_key`,
+        `coalesce_key`, or `dedup_key` always go to the shard chosen by a
+        stable hash of the first key set in that order, so those features keep
+        working. Use a dedup or coalesce key with one partition key only. `pop()` visits
+        the shards in rotation and preserves FIFO order within each shard.
+        Message IDs record their shard, so `get()`, `done()`, `mark_failed()`,
+        and `retry()` touch only one database.
+        """
+        if isinstance(filenames, (str, Path)):
+            raise TypeError("filenames must be a sequence of database locations")
+
+        if not filenames:
+            raise ValueError("filenames must not be empty")
+
+        if len(filenames) > _SHARD_INDEX_MASK + 1:
+            raise ValueError(
+                f"ShardedLiteQueue supports at most {_SHARD_INDEX_MASK + 1} shards"
+            )
+
+        shards: list[LiteQueue] = []
+        try:
+            for shard_index, filename in enumerate(filenames):
+                shard = LiteQueue(
+                    filename=filename,
+                    maxsize=maxsize,
+                    max_attempts=max_attempts,
+                    **kwargs,
+                )
+                shard._new_message_id = _sharded_message_id_factory(shard_index)
+                shards.append(shard)
+        except BaseException:
+            for shard in shards:
+                shard.close()
+            raise
+
+        self.shards = shards
+        self._filenames = list(filenames)
+        self._options = {"maxsize": maxsize, "max_attempts": max_attempts, **kwargs}
+        # Metrics and profilers stay in this process, like those of a pickled
+        # LiteQueue.
+        self._options.pop("metrics", None)
+        self._options.pop("profiler", None)
+        self._put_counter = itertools.count()
+        self._pop_counter = itertools.count()
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (_reopen_sharded_queue, (self._filenames, self._options))
+
+    def _shard_for_key(self, key: str) -> LiteQueue:
+        shard_index = zlib.crc32(key.encode()) % len(self.shards)
+        return self.shards[shard_index]
+
+    def _shard_for_message(self, message_id: str) -> LiteQueue | None:
+        try:
+            shard_index = UUID(message_id).int & _SHARD_INDEX_MASK
+        except ValueError:
+            return None
+
+        if shard_index >= len(self.shards):
+            return None
+
+        return self.shards[shard_index]
+
+    def put(
+        self,
+        data: str,
+        delay_seconds: float = 0,
+        dedup_key: str | None = None,
+        coalesce_key: str | None = None,
+        partition_key: str | None = None,
+        topic: str | None = None,
+    ) -> Message:
+        """
+        Insert a message into one shard. See `LiteQueue.put()`.
+
+        The partition key chooses the shard when it is set, so a partition
+        never spans shards. Otherwise the coalesce or dedup key does.
+        """
+        if partition_key is not None:
+            routing_key: str | None = partition_key
+        elif coalesce_key is not None:
+            routing_key = coalesce_key
+        else:
+            routing_key = dedup_key
+
+        if routing_key is None:
+            shard = self.shards[next(self._put_counter) % len(self.shards)]
+        else:
+            shard = self._shard_for_key(routing_key)
+
+        return shard.put(
+            data,
+            delay_seconds=delay_seconds,
+            dedup_key=dedup_key,
+            coalesce_key=coalesce_key,
+            partition_key=partition_key,
+            topic=topic,
+        )
+
+    def pop(self, topics: Collection[str] | None = None) -> Message | None:
+        """Claim a message from the next shard in rotation that has one."""
+        shard_count = len(self.shards)
+        start = next(self._pop_counter)
+        for offset in range(shard_count):
+            shard = self.shards[(start + offset) % shard_count]
+            message = shard.pop(topics=topics)
+            if message is not None:
+                return message
+
+        return None
+
+    def pop_many(
+        self,
+        limit: int,
+        topics: Collection[str] | None = None,
+    ) -> list[Message]:
+        """Claim up to `limit` messages, visiting the shards in rotation."""
+        limit = validate_limit(limit)
+        shard_count = len(self.shards)
+        start = next(self._pop_counter)
+        messages: list[Message] = []
+        for offset in range(shard_count):
+            shard = self.shards[(start + offset) % shard_count]
+            messages.extend(shard.pop_many(limit - len(messages), topics=topics))
+            if len(messages) == limit:
+                break
+
+        return messages
+
+    def release(self, message_id: str) -> bool:
+        shard = self._shard_for_message(message_id)
+        return shard.release(message_id) if shard is not None else False
+
+    def get(self, message_id: str) -> Message | None:
+        shard = self._shard_for_message(message_id)
+        return shard.get(message_id) if shard is not None else None
+
+    def done(self, message_id: str) -> bool:
+        shard = self._shard_for_message(message_id)
+        return shard.done(message_id) if shard is not None else False
+
+    def mark_failed(self, message_id: str) -> bool:
+        shard = self._shard_for_message(message_id)
+        return shard.mark_failed(message_id) if shard is not None else False
+
+    def retry(self, message_id: str, delay_seconds: float = 0) -> bool:
+        shard = self._shard_for_message(message_id)
+        if shard is None:
+            return False
+
+        return shard.retry(message_id, delay_seconds=delay_seconds)
+
+    @overload
+    def list_locked(
+        self, threshold_seconds: float, raw: Literal[False] = False
+    ) -> Iterator[Message]: ...
+
+    @overload
+    def list_locked(
+        self, threshold_seconds: float, raw: Literal[True]
+    ) -> Iterator[MessageRow]: ...
+
+    def list_locked(
+        self, threshold_seconds: float, raw: bool = False
+    ) -> Iterator[Message] | Iterator[MessageRow]:
+        if raw:
+            return itertools.chain.from_iterable(
+                shard.list_locked(threshold_seconds, raw=True) for shard in self.shards
+            )
+        return itertools.chain.from_iterable(
+            shard.list_locked(threshold_seconds) for shard in self.shards
+        )
+
+    def reclaim_locked(self, threshold_seconds: float) -> int:
+        return sum(shard.reclaim_locked(threshold_seconds) for shard in self.shards)
+
+    @overload
+    def list_failed(self, raw: Literal[False] = False) -> Iterator[Message]: ...
+
+    @overload
+    def list_failed(self, raw: Literal[True]) -> Iterator[MessageRow]: ...
+
+    def list_failed(
+        self, raw: bool = False
+    ) -> Iterator[Message] | Iterator[MessageRow]:
+        if raw:
+            return itertools.chain.from_iterable(
+                shard.list_failed(raw=True) for shard in self.shards
+            )
+        return itertools.chain.from_iterable(
+            shard.list_failed() for shard in self.shards
+        )
+
+    def message_batch(self, status: MessageStatus | None = None) -> MessageBatch:
+        """Return the matching messages of every shard as one `MessageBatch`."""
+        batch = MessageBatch()
+        for shard in self.shards:
+            shard._extend_batch(batch, status)
+        return batch
+
+    def next_due_time(self) -> int | None:
+        due_times = [shard.next_due_time() for shard in self.shards]
+        return min(
+            (due_time for due_time in due_times if due_time is not None), default=None
+        )
+
+    def qsize(self) -> int:
+        """Return the combined size of all shards."""
+        return sum(shard.qsize() for shard in self.shards)
+
+    def empty(self) -> bool:
+        return all(shard.empty() for shard in self.shards)
+
+    def prune(self, include_failed: bool = True) -> None:
+        for shard in self.shards:
+            shard.prune(include_failed=include_failed)
+
+    def vacuum(self) -> None:
+        for shard in self.shards:
+            shard.vacuum()
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+
+
+def _reopen_sharded_queue(
+    filenames: list[str | Path], options: dict[str, Any]
+) -> ShardedLiteQueue:
+    return ShardedLiteQueue(filenames, **options)
+
+
+class PrefetchingConsumer:
+    def __init__(
+        self,
+        queue: LiteQueue | ShardedLiteQueue,
+        window: int = 100,
+        low_water: int | None = None,
+        topics: Collection[str] | None = None,
+        poll_interval: float = 0.05,
+    ) -> None:
+        """
+        Hand out messages claimed ahead of time by a background thread.
+
+        The thread claims up to `window` messages with `pop_many()` and claims
+        again when fewer than `low_water` remain, so `get()` usually returns
+        without touching SQLite or waiting for the write lock. When nothing is
+        ready, the thread polls every `poll_interval` seconds.
+
+        Prefetched messages are `LOCKED` from the moment they are claimed.
+        Keep `window` small enough that a message is processed well before
+        your stale-lock threshold. `close()` releases the messages that were
+        never handed out back to `READY` without counting an attempt.
+
+        Acknowledge messages through the queue as usual with `done()`,
+        `retry()`, or `mark_failed()`.
+        """
+        window = validate_limit(window, "window")
+        if low_water is None:
+            low_water = max(1, window // 4)
+        elif isinstance(low_water, bool) or not isinstance(low_water, int):
+            raise TypeError("low_water must be an integer")
+        elif not 0 < low_water <= window:
+            raise ValueError("low_water must be between 1 and window")
+
+        self.queue = queue
+        self.window = window
+        self.low_water = low_water
+        _topic_parameters(topics)
+        self.topics = None if topics is None else list(topics)
+        self.poll_interval = validate_seconds("poll_interval", poll_interval)
+        if self.poll_interval == 0:
+            raise ValueError("poll_interval must be positive")
+
+        self._buffer: deque[Message] = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(
+            target=self._refill, name="litequeue-prefetch", daemon=True
+        )
+        self._thread.start()
+
+    def _refill(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or len(self._buffer) < self.low_water
+                )
+                if self._closed:
                     return
-                self._is_closed = True
-
-            read_connections = self._read_connections
-            # Draining all ten slots waits for checked-out readers to finish.
-            # Once _is_closed is set, new readers fail before checkout, so they
-            # cannot race shutdown or use a closed connection.
-            connections_to_close = [
-                read_connections.get() for _ in range(_READ_CONNECTION_POOL_SIZE)
-            ]
-            for read_connection in connections_to_close:
-                read_connection.close()
+                missing = self.window - len(self._buffer)
+
+            try:
+                messages = self.queue.pop_many(missing, topics=self.topics)
+            except BaseException as error:
+                with self._condition:
+                    self._error = error
+                    self._closed = True
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                self._buffer.extend(messages)
+                if messages:
+                    self._condition.notify_all()
+                elif not self._closed:
+                    self._condition.wait(self.poll_interval)
+
+    def get(self, timeout: float | None = None) -> Message | None:
+        """
+        Return the next prefetched message.
+
+        Waits up to `timeout` seconds, or forever when it is `None`. Returns
+        `None` when the timeout expires or the consumer is closed.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._buffer or self._closed, timeout=timeout
+            )
+            if self._error is not None:
+                raise self._error
+            if not self._buffer or self._closed:
+                return None
+
+            message = self._buffer.popleft()
+            if len(self._buffer) < self.low_water:
+                self._condition.notify_all()
+            return message
+
+    def close(self) -> None:
+        """Stop prefetching and release the messages never handed out."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        self._thread.join()
+
+        with self._condition:
+            unprocessed = list(self._buffer)
+            self._buffer.clear()
+
+        for message in unprocessed:
+            self.queue.release(message.message_id)
+
+    def __enter__(self) -> "PrefetchingConsumer":
+        return self
 
-            self.conn.close()
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
 
 
 # Kept for backwards compatibility
@@ -0,0 +1,234 @@
+"""
+Command line entry point.
+
+Run a pool of worker processes that consume a queue:
+
+    python -m litequeue worker tasks.sqlite3 myapp.tasks:handle --processes 4
+
+Each process opens its own `LiteQueue` on the database and runs
+`LiteQueue.consume()` with the imported handler. The supervisor restarts
+processes that crash and reclaims messages they left locked.
+"""
+
+import argparse
+import importlib
+import math
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from collections.abc import Callable
+from collections.abc import Sequence
+from multiprocessing.process import BaseProcess
+from types import FrameType
+
+from litequeue import LiteQueue
+from litequeue import Message
+
+
+def load_handler(path: str) -> Callable[[Message], object]:
+    """Import the handler named by `module:function`."""
+    module_name, separator, attribute_path = path.partition(":")
+    if not separator or not module_name or not attribute_path:
+        raise ValueError(f"handler must look like 'module:function', got {path!r}")
+
+    handler: object = importlib.import_module(module_name)
+    for attribute in attribute_path.split("."):
+        handler = getattr(handler, attribute)
+
+    if not callable(handler):
+        raise TypeError(f"handler {path!r} is not callable")
+
+    return handler
+
+
+def run_worker(
+    filename: str,
+    handler_path: str,
+    threads: int,
+    batch_size: int | None,
+    idle_timeout: float | None,
+    retry_delay_seconds: float,
+) -> None:
+    """Consume the queue in this process until it is idle or interrupted."""
+    handler = load_handler(handler_path)
+    queue = LiteQueue(filename=filename)
+    try:
+        queue.consume(
+            handler,
+            workers=threads,
+            batch_size=batch_size,
+            idle_timeout=idle_timeout,
+            retry_delay_seconds=retry_delay_seconds,
+        )
+    except KeyboardInterrupt:
+        # consume() already released unstarted messages and acknowledged the
+        # running ones, so the interrupt is a clean shutdown.
+        pass
+    finally:
+        queue.close()
+
+
+def reclaim_stale_messages(filename: str, threshold_seconds: float) -> None:
+    queue = LiteQueue(filename=filename)
+    try:
+        reclaimed = queue.reclaim_locked(threshold_seconds)
+    finally:
+        queue.close()
+
+    if reclaimed:
+        print(f"Reclaimed {reclaimed} stale locked messages", file=sys.stderr)
+
+
+def run_workers(args: argparse.Namespace) -> int:
+    # Validate the handler in the supervisor so a typo fails once instead of
+    # in every restarted process.
+    load_handler(args.handler)
+    reclaim_stale_messages(args.filename, args.reclaim_after)
+
+    # Spawned processes open their own connections. Forked ones would inherit
+    # the supervisor's SQLite state, which SQLite does not allow.
+    context = multiprocessing.get_context("spawn")
+
+    def start_worker() -> BaseProcess:
+        process = context.Process(
+            target=run_worker,
+            args=(
+                args.filename,
+                args.handler,
+                args.threads,
+                args.batch_size,
+                args.idle_timeout,
+                args.retry_delay,
+            ),
+        )
+        process.start()
+        return process
+
+    def stop(signum: int, frame: FrameType | None) -> None:
+        raise KeyboardInterrupt
+
+    previous_handler = signal.signal(signal.SIGTERM, stop)
+    processes = [start_worker() for _ in range(args.processes)]
+    try:
+        while processes:
+            time.sleep(0.1)
+            running = []
+            for process in processes:
+                if process.is_alive():
+                    running.append(process)
+                    continue
+
+                process.join()
+                if process.exitcode == 0:
+                    continue
+
+                print(
+                    f"Worker {process.pid} exited with code {process.exitcode}; "
+                    "restarting",
+                    file=sys.stderr,
+                )
+                time.sleep(args.restart_delay)
+                reclaim_stale_messages(args.filename, args.reclaim_after)
+                running.append(start_worker())
+            processes = running
+    except KeyboardInterrupt:
+        for process in processes:
+            if process.is_alive() and process.pid is not None:
+                # Workers drain on SIGINT: unstarted messages are released
+                # and running handlers finish before they exit.
+                os.kill(process.pid, signal.SIGINT)
+        for process in processes:
+            process.join()
+        return 130
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+
+    return 0
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("must be a positive integer")
+    return number
+
+
+def non_negative_float(value: str) -> float:
+    number = float(value)
+    if not math.isfinite(number) or number < 0:
+        raise argparse.ArgumentTypeError("must be a finite, non-negative number")
+    return number
+
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m litequeue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser(
+        "worker",
+        help="Consume a queue with a pool of worker processes",
+        description=(
+            "Run a handler for every message of a queue in several processes. "
+            "The handler receives a litequeue.Message. Returning marks the "
+            "message done and raising retries it."
+        ),
+    )
+    worker.add_argument("filename", help="Queue database file")
+    worker.add_argument("handler", help="Handler to import, as module:function")
+    worker.add_argument(
+        "--processes",
+        type=positive_int,
+        default=multiprocessing.cpu_count(),
+        help="Worker processes. Default: number of CPUs",
+    )
+    worker.add_argument(
+        "--threads",
+        type=positive_int,
+        default=1,
+        help="Handler threads in each process. Default: %(default)s",
+    )
+    worker.add_argument(
+        "--batch-size",
+        type=positive_int,
+        default=None,
+        help="Messages claimed per transaction. Default: the thread count",
+    )
+    worker.add_argument(
+        "--idle-timeout",
+        type=non_negative_float,
+        default=None,
+        help="Stop a worker after this many idle seconds. Default: never",
+    )
+    worker.add_argument(
+        "--retry-delay",
+        type=non_negative_float,
+        default=0,
+        help="Seconds before a failed message is retried. Default: %(default)s",
+    )
+    worker.add_argument(
+        "--reclaim-after",
+        type=non_negative_float,
+        default=300,
+        help=(
+            "Retry messages locked for longer than this many seconds on "
+            "startup and after a crash. Default: %(default)s"
+        ),
+    )
+    worker.add_argument(
+        "--restart-delay",
+        type=non_negative_float,
+        default=1,
+        help="Seconds to wait before restarting a crashed worker. Default: %(default)s",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = parse_args(argv)
+    return run_workers(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
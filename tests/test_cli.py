@@ -0,0 +1,119 @@
+import sqlite3
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from litequeue import LiteQueue
+from litequeue import MessageStatus
+from litequeue.__main__ import load_handler
+from litequeue.__main__ import main
+
+
+@pytest.fixture
+def handler_module(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """A handler module that records messages and can crash its process."""
+    (tmp_path / "cli_handlers.py").write_text(
+        textwrap.dedent(
+            """
+            import os
+            from pathlib import Path
+
+            OUTPUT = Path(__file__).with_name("handled.txt")
+
+
+            def handle(message):
+                if message.data == "crash" and message.attempts == 1:
+                    os._exit(3)
+                with OUTPUT.open("a") as output:
+                    output.write(message.data + "\\n")
+            """
+        )
+    )
+    # Spawned worker processes receive the parent's sys.path.
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return tmp_path
+
+
+def test_worker_command_processes_queue_in_several_processes(
+    handler_module: Path,
+) -> None:
+    database_path = handler_module / "queue.sqlite3"
+    queue = LiteQueue(filename=database_path)
+    queue.put_many(str(index) for index in range(20))
+    queue.close()
+
+    exit_code = main(
+        [
+            "worker",
+            str(database_path),
+            "cli_handlers:handle",
+            "--processes",
+            "2",
+            "--idle-timeout",
+            "0.2",
+        ]
+    )
+
+    handled = (handler_module / "handled.txt").read_text().split()
+    assert exit_code == 0
+    assert sorted(handled, key=int) == [str(index) for index in range(20)]
+    connection = sqlite3.connect(database_path)
+    statuses = connection.execute('SELECT DISTINCT status FROM "Queue"').fetchall()
+    connection.close()
+    assert statuses == [(MessageStatus.DONE.value,)]
+
+
+def test_worker_command_restarts_crashed_workers(handler_module: Path) -> None:
+    database_path = handler_module / "queue.sqlite3"
+    queue = LiteQueue(filename=database_path)
+    crash = queue.put("crash")
+    queue.close()
+
+    exit_code = main(
+        [
+            "worker",
+            str(database_path),
+            "cli_handlers:handle",
+            "--processes",
+            "1",
+            "--idle-timeout",
+            "0.2",
+            "--reclaim-after",
+            "0",
+            "--restart-delay",
+            "0",
+        ]
+    )
+
+    queue = LiteQueue(filename=database_path)
+    finished = queue.get(crash.message_id)
+    queue.close()
+    assert exit_code == 0
+    assert finished is not None
+    assert (finished.status, finished.attempts) == (MessageStatus.DONE, 2)
+    assert (handler_module / "handled.txt").read_text() == "crash\n"
+
+
+@pytest.mark.parametrize(
+    ("path", "error_type"),
+    (
+        ("cli_handlers", ValueError),
+        ("cli_handlers:missing", AttributeError),
+        ("cli_handlers:OUTPUT", TypeError),
+    ),
+)
+def test_invalid_handlers_are_rejected(
+    handler_module: Path, path: str, error_type: type[Exception]
+) -> None:
+    with pytest.raises(error_type):
+        load_handler(path)
+
+
+def test_worker_command_requires_positive_process_count(
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    with pytest.raises(SystemExit):
+        main(["worker", "queue.sqlite3", "module:handle", "--processes", "0"])
+
+    assert "must be a positive integer" in capsys.readouterr().err
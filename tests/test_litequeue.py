@@ -1,20 +1,45 @@
+import math
+import pickle
 import sqlite3
 import threading
 import time
+import uuid
 from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple
 from pathlib import Path
+from typing import Any
 
 import pytest
 
 import litequeue
 from litequeue import LiteQueue
 from litequeue import Message
+from litequeue import MessageBatch
 from litequeue import MessageStatus
+from litequeue import PrefetchingConsumer
+from litequeue import QueueMetrics
+from litequeue import ShardedLiteQueue
+from litequeue import SQLProfiler
 
 print(sqlite3.sqlite_version)
 
 # https://docs.pytest.org/en/7.1.x/how-to/fixtures.html#parametrizing-fixtures
 
+EXPECTED_QUEUE_INDEXES = {
+    "Queue_topic_status_message_id_idx": (False, ["topic", "status", "message_id"]),
+    "Queue_partition_key_status_message_id_idx": (
+        False,
+        ["partition_key", "status", "message_id"],
+    ),
+    "Queue_coalesce_key_unique_idx": (True, ["coalesce_key"]),
+    "Queue_dedup_key_unique_idx": (True, ["dedup_key"]),
+    "Queue_message_id_unique_idx": (True, ["message_id"]),
+    "Queue_status_message_id_idx": (False, ["status", "message_id"]),
+    "Queue_status_available_at_idx": (False, ["status", "available_at"]),
+    "Queue_done_time_status_idx": (False, ["done_time", "status"]),
+    "Queue_status_lock_time_idx": (False, ["status", "lock_time"]),
+}
+
 
 def test_uuid7_matches_rfc_9562_test_vector(monkeypatch) -> None:
     timestamp_ns = 1_645_557_742_000_000_000
@@ -216,9 +241,10 @@ def test_connection_kwargs_are_forwarded_to_all_connections(
     monkeypatch.setattr(litequeue.sqlite3, "connect", recording_connect)
 
     queue = LiteQueue(filename=tmp_path / "queue.sqlite3", timeout=12.5)
+    queue.qsize()
     queue.close()
 
-    assert len(received_options) == 11
+    assert len(received_options) == 2
     assert all(options["timeout"] == 12.5 for options in received_options)
 
 
@@ -251,6 +277,10 @@ def test_existing_wal_database_skips_journal_mode_change(
     """Reopening WAL avoids the locking journal-mode assignment."""
     database_path = tmp_path / "queue.sqlite3"
     LiteQueue(filename=database_path).close()
+    # Clear the schema stamp so the reopen runs the full setup.
+    connection = sqlite3.connect(database_path)
+    connection.execute("PRAGMA user_version = 0")
+    connection.close()
     connect = sqlite3.connect
     statements: list[str] = []
 
@@ -268,6 +298,61 @@ def test_existing_wal_database_skips_journal_mode_change(
     assert "pragma journal_mode = wal;" not in normalized_statements
 
 
+def test_initialized_queue_reopens_without_write_lock(
+    tmp_path: Path,
+    monkeypatch,
+) -> None:
+    """A queue set up by this version reopens with one read statement."""
+    database_path = tmp_path / "queue.sqlite3"
+    LiteQueue(filename=database_path, maxsize=5, max_attempts=3).close()
+    LiteQueue(filename=database_path).named_queue("emails", maxsize=2)
+    connect = sqlite3.connect
+    statements: list[str] = []
+
+    def tracing_connect(*args, **kwargs):
+        connection = connect(*args, **kwargs)
+        connection.set_trace_callback(statements.append)
+        return connection
+
+    monkeypatch.setattr(litequeue.sqlite3, "connect", tracing_connect)
+
+    queue = LiteQueue(filename=database_path, maxsize=5)
+    emails = queue.named_queue("emails")
+    # Connection-local pragmas take no database lock, and the "--" entries
+    # trace the pragma functions read by the reopen statement.
+    setup_statements = [
+        statement
+        for statement in statements
+        if not statement.startswith("--")
+        and statement
+        not in ("PRAGMA temp_store = MEMORY;", "PRAGMA synchronous = NORMAL;")
+    ]
+
+    assert (queue.maxsize, queue.max_attempts) == (5, 3)
+    assert (emails.maxsize, emails.max_attempts) == (2, None)
+    assert len(setup_statements) == 2
+    assert all(
+        statement.strip().upper().startswith("SELECT") for statement in setup_statements
+    )
+    queue.close()
+
+
+def test_reopen_with_new_settings_runs_full_setup(tmp_path: Path) -> None:
+    """Conflicts and adopted settings still go through the locking setup."""
+    database_path = tmp_path / "queue.sqlite3"
+    LiteQueue(filename=database_path, maxsize=5).close()
+
+    with pytest.raises(ValueError, match="conflicts with stored maxsize 5"):
+        LiteQueue(filename=database_path, maxsize=6)
+
+    assert LiteQueue(filename=database_path, max_attempts=2).max_attempts == 2
+    queue = LiteQueue(filename=database_path)
+    assert (queue.maxsize, queue.max_attempts) == (5, 2)
+    application_id = queue.conn.execute("PRAGMA application_id").fetchone()[0]
+    assert application_id == litequeue._APPLICATION_ID
+    queue.close()
+
+
 @pytest.mark.parametrize(
     "managed_option",
     (
@@ -283,11 +368,9 @@ def test_managed_connection_kwargs_are_rejected(
     managed_option: str,
 ) -> None:
     """Callers cannot override connection behavior required by LiteQueue."""
+    options: dict[str, Any] = {managed_option: None}
     with pytest.raises(ValueError, match="LiteQueue manages SQLite connection options"):
-        LiteQueue(
-            filename=tmp_path / "queue.sqlite3",
-            **{managed_option: None},
-        )
+        LiteQueue(filename=tmp_path / "queue.sqlite3", **options)
 
 
 def test_filename_creates_database_at_exact_path(tmp_path: Path) -> None:
@@ -346,11 +429,8 @@ def test_database_paths_identify_queues(tmp_path: Path) -> None:
             """
         ).fetchall()
 
-        assert [row["name"] for row in table_rows] == ["Queue"]
-        assert get_queue_indexes(reopened_queue, "Queue") == {
-            "Queue_message_id_unique_idx": (True, ["message_id"]),
-            "Queue_status_message_id_idx": (False, ["status", "message_id"]),
-        }
+        assert [row["name"] for row in table_rows] == ["Queue", "QueueSettings"]
+        assert get_queue_indexes(reopened_queue, "Queue") == EXPECTED_QUEUE_INDEXES
         assert reopened_queue.get(message_id) is not None
         assert reopened_queue.qsize() == 1
         reopened_queue.close()
@@ -391,8 +471,21 @@ def test_queue_creates_fixed_schema(tmp_path: Path) -> None:
     assert table is not None
     assert 'CREATE TABLE "Queue"' in table[0]
     assert index_sql == [
+        'CREATE UNIQUE INDEX "Queue_coalesce_key_unique_idx" ON "Queue"(coalesce_key) '
+        "WHERE coalesce_key IS NOT NULL AND status IN (0, 4)",
+        'CREATE UNIQUE INDEX "Queue_dedup_key_unique_idx" ON "Queue"(dedup_key) '
+        "WHERE dedup_key IS NOT NULL",
+        'CREATE INDEX "Queue_done_time_status_idx" ON "Queue"(done_time, status) '
+        "WHERE done_time IS NOT NULL",
         'CREATE UNIQUE INDEX "Queue_message_id_unique_idx" ON "Queue"(message_id)',
+        'CREATE INDEX "Queue_partition_key_status_message_id_idx" '
+        'ON "Queue"(partition_key, status, message_id) WHERE partition_key IS NOT NULL',
+        'CREATE INDEX "Queue_status_available_at_idx" ON "Queue"(status, available_at)',
+        'CREATE INDEX "Queue_status_lock_time_idx" ON "Queue"(status, lock_time) '
+        "WHERE status = 1",
         'CREATE INDEX "Queue_status_message_id_idx" ON "Queue"(status, message_id)',
+        'CREATE INDEX "Queue_topic_status_message_id_idx" '
+        'ON "Queue"(topic, status, message_id) WHERE topic IS NOT NULL',
     ]
     assert trigger is not None
     assert 'CREATE TRIGGER "maxsize_control_Queue"' in trigger[0]
@@ -417,9 +510,11 @@ def test_database_with_custom_queue_table_is_rejected_without_changes(
     connection.close()
 
     expected_message = (
-        "LiteQueue versions later than 0.9 require a database with a single "
-        "`Queue` table. These versions do not allow multiple queues or database "
-        "sharing with other applications. Found unsupported table: CustomQueue. "
+        "LiteQueue versions later than 0.9 only support their own tables in a "
+        "database: `Queue`, named queue tables `Queue:<name>`, log tables "
+        "`Log:<name>`, and their settings tables. Custom queue tables and "
+        "database sharing with other applications are not supported. "
+        "Found unsupported table: CustomQueue. "
         "See the migration guide: https://github.com/litements/litequeue/blob/"
         "main/docs/migrate_single_queue.md"
     )
@@ -452,7 +547,7 @@ def test_database_with_queue_and_another_table_is_rejected(tmp_path: Path) -> No
         LiteQueue(filename=database_path)
 
     error_message = str(error.value)
-    assert "single `Queue` table" in error_message
+    assert "named queue tables `Queue:<name>`" in error_message
     assert "database sharing with other applications" in error_message
     assert "Found unsupported table: ApplicationData" in error_message
     assert (
@@ -717,6 +812,161 @@ def test_list_locked(single_queue):
     assert len(list(q.list_locked(threshold_seconds=0.1))) == 0
 
 
+def test_bulk_listings_return_raw_rows(single_queue: LiteQueue) -> None:
+    q = single_queue
+    q.put("locked", partition_key="a", topic="mail")
+    q.put("failed")
+    locked = q.pop()
+    failed = q.pop()
+    assert locked is not None and failed is not None
+    q.mark_failed(failed.message_id)
+
+    [failed_row] = q.list_failed(raw=True)
+    [locked_row] = q.list_locked(threshold_seconds=-1, raw=True)
+
+    stored_failed = q.get(failed.message_id)
+    assert stored_failed is not None
+    assert failed_row == astuple(stored_failed)
+    assert failed_row[2] == MessageStatus.FAILED.value
+    assert type(failed_row[2]) is int
+    assert locked_row == astuple(locked)
+    assert list(q.list_failed()) == [stored_failed]
+
+
+def test_sharded_bulk_listings_return_raw_rows(tmp_path: Path) -> None:
+    queue = make_sharded_queue(tmp_path, shard_count=2)
+    for index in range(4):
+        queue.put(f"message {index}")
+    for _ in range(4):
+        message = queue.pop()
+        assert message is not None
+        queue.mark_failed(message.message_id)
+
+    rows = sorted(queue.list_failed(raw=True))
+    messages = sorted(queue.list_failed(), key=lambda message: message.data)
+
+    assert rows == sorted(astuple(message) for message in messages)
+    assert len(list(queue.list_locked(threshold_seconds=-1, raw=True))) == 0
+    queue.close()
+
+
+def test_message_batch_holds_columns(single_queue: LiteQueue, monkeypatch) -> None:
+    q = single_queue
+    clock = iter(range(1_000, 100_000, 1_000))
+    monkeypatch.setattr(litequeue, "time_ns", lambda: next(clock))
+    first = q.put("first")
+    second = q.put("second")
+    q.put("waiting")
+    q.pop()
+    q.pop()
+    q.done(first.message_id)
+    q.mark_failed(second.message_id)
+
+    batch = q.message_batch()
+    done = q.message_batch(MessageStatus.DONE)
+
+    assert len(batch) == 3
+    assert batch.data == ["first", "second", "waiting"]
+    assert batch.message_ids[0] == first.message_id
+    assert batch.status.typecode == "q"
+    assert list(batch.status) == [
+        MessageStatus.DONE.value,
+        MessageStatus.FAILED.value,
+        MessageStatus.READY.value,
+    ]
+    assert list(batch.lock_time) == [4_000, 5_000, MessageBatch.MISSING]
+    assert list(batch.attempts) == [1, 1, 0]
+    assert list(batch.durations()) == [5_000, 5_000]
+    assert list(batch.durations("in_time", "lock_time")) == [3_000, 3_000]
+    assert done.data == ["first"]
+    assert MessageBatch.from_rows(q.list_failed(raw=True)) == q.message_batch(
+        MessageStatus.FAILED
+    )
+    with pytest.raises(ValueError, match="unknown time column 'data'"):
+        batch.durations("data")
+
+
+def test_stats_summarize_messages_finished_in_window(
+    single_queue: LiteQueue, monkeypatch
+) -> None:
+    q = single_queue
+    second = 1_000_000_000
+    now = 0
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now)
+    old, fast, slow, broken = (q.put(f"message {index}") for index in range(4))
+
+    for message, lock_time, finish_time in (
+        (old, 1, 2),
+        (fast, 45, 50),
+        (slow, 60, 90),
+        (broken, 95, 96),
+    ):
+        now = lock_time * second
+        assert q.pop() is not None
+        now = finish_time * second
+        if message is broken:
+            q.mark_failed(message.message_id)
+        else:
+            q.done(message.message_id)
+
+    now = 100 * second
+    stats = q.stats(window=60, interval=20)
+
+    assert stats.done == 2
+    assert stats.failed == 1
+    assert stats.failure_rate == pytest.approx(1 / 3)
+    assert stats.messages_per_second == pytest.approx(2 / 60)
+    assert stats.throughput == [1, 0, 1]
+    assert stats.wait_time == {
+        50: 45 * second,
+        90: 60 * second,
+        95: 60 * second,
+        99: 60 * second,
+    }
+    assert stats.processing_time == {
+        50: 5 * second,
+        90: 30 * second,
+        95: 30 * second,
+        99: 30 * second,
+    }
+
+
+def test_stats_of_idle_queue(single_queue: LiteQueue) -> None:
+    stats = single_queue.stats(window=10, interval=3)
+
+    assert (stats.done, stats.failed, stats.failure_rate) == (0, 0, 0.0)
+    assert stats.wait_time == stats.processing_time == {}
+    assert stats.throughput == [0, 0, 0, 0]
+
+
+@pytest.mark.parametrize(
+    ("arguments", "error"),
+    (
+        ({"window": 0}, ValueError),
+        ({"interval": 0}, ValueError),
+        ({"window": -1}, ValueError),
+        ({"interval": "1"}, TypeError),
+    ),
+)
+def test_stats_rejects_invalid_periods(
+    single_queue: LiteQueue, arguments: dict[str, Any], error: type[Exception]
+) -> None:
+    with pytest.raises(error):
+        single_queue.stats(**arguments)
+
+
+def test_sharded_message_batch_combines_shards(tmp_path: Path) -> None:
+    queue = make_sharded_queue(tmp_path, shard_count=2)
+    for index in range(4):
+        queue.put(f"message {index}")
+
+    batch = queue.message_batch(MessageStatus.READY)
+
+    assert sorted(batch.data) == [f"message {index}" for index in range(4)]
+    assert len(queue.message_batch(MessageStatus.DONE)) == 0
+    queue.close()
+
+
 def test_retry_failed(single_queue):
     q = single_queue
     q.put("foo")
@@ -792,10 +1042,7 @@ def test_queue_gets_fixed_indexes(tmp_path: Path) -> None:
     """The single Queue table receives the fixed unique and FIFO indexes."""
     queue = LiteQueue(filename=tmp_path / "queue.sqlite3")
 
-    assert get_queue_indexes(queue, "Queue") == {
-        "Queue_message_id_unique_idx": (True, ["message_id"]),
-        "Queue_status_message_id_idx": (False, ["status", "message_id"]),
-    }
+    assert get_queue_indexes(queue, "Queue") == EXPECTED_QUEUE_INDEXES
 
 
 def test_duplicate_message_ids_are_rejected_by_sqlite(tmp_path: Path) -> None:
@@ -900,3 +1147,1324 @@ def test_unknown_stored_status_raises_useful_error(single_queue) -> None:
 
     with pytest.raises(ValueError, match="Unknown message status: 99"):
         q.get(message.message_id)
+
+
+def test_delayed_message_is_invisible_until_due(single_queue, monkeypatch) -> None:
+    """Delayed messages are neither peeked nor popped before their due time."""
+    q = single_queue
+    now = time.time_ns()
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now)
+
+    delayed = q.put("later", delay_seconds=30)
+
+    assert delayed.status == MessageStatus.DELAYED
+    assert delayed.available_at == now + 30_000_000_000
+    assert q.get(delayed.message_id) == delayed
+    assert q.peek() is None
+    assert q.pop() is None
+    assert q.empty()
+    assert q.qsize() == 1
+    assert q.next_due_time() == delayed.available_at
+
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now + 30_000_000_000)
+
+    assert q.peek() == delayed
+    popped = q.pop()
+    assert popped is not None
+    assert popped.message_id == delayed.message_id
+    assert popped.status == MessageStatus.LOCKED
+    assert q.next_due_time() is None
+
+
+def test_due_delayed_message_keeps_fifo_position(single_queue, monkeypatch) -> None:
+    """A due delayed message is claimed by message ID like any ready message."""
+    q = single_queue
+    now = time.time_ns()
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now)
+    delayed = q.put("first", delay_seconds=1)
+    ready = q.put("second")
+
+    assert q.pop().message_id == ready.message_id
+
+    q.retry(ready.message_id)
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now + 1_000_000_000)
+
+    assert q.pop().message_id == delayed.message_id
+    assert q.pop().message_id == ready.message_id
+
+
+def test_retry_with_delay_postpones_message(single_queue, monkeypatch) -> None:
+    q = single_queue
+    now = time.time_ns()
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now)
+    message = q.put("work")
+    q.pop()
+
+    assert q.retry(message.message_id, delay_seconds=0.5) is True
+
+    stored = q.get(message.message_id)
+    assert stored.status == MessageStatus.DELAYED
+    assert stored.available_at == now + 500_000_000
+    assert q.pop() is None
+
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now + 500_000_000)
+
+    assert q.pop().message_id == message.message_id
+
+
+@pytest.mark.parametrize(
+    ("delay_seconds", "error_type"),
+    ((-1, ValueError), (float("inf"), ValueError), ("1", TypeError), (True, TypeError)),
+)
+def test_invalid_delay_is_rejected(single_queue, delay_seconds, error_type) -> None:
+    with pytest.raises(error_type, match="delay_seconds"):
+        single_queue.put("message", delay_seconds=delay_seconds)
+
+    assert single_queue.qsize() == 0
+
+
+def test_queue_created_by_older_version_is_upgraded(tmp_path: Path) -> None:
+    """Reopening a six-column queue adds the columns newer versions need."""
+    database_path = tmp_path / "queue.sqlite3"
+    connection = sqlite3.connect(database_path)
+    connection.execute(
+        """
+        CREATE TABLE "Queue"
+        (
+          data       TEXT NOT NULL
+          , message_id TEXT NOT NULL
+          , status     INTEGER NOT NULL
+          , in_time    INTEGER NOT NULL
+          , lock_time  INTEGER
+          , done_time  INTEGER
+        )
+        """
+    )
+    connection.execute(
+        'INSERT INTO "Queue" VALUES (:data, :message_id, 0, 1, NULL, NULL)',
+        {"data": "old", "message_id": "063e95f1-3d9e-7bbc-8000-a6a18a5f65d1"},
+    )
+    connection.commit()
+    connection.close()
+
+    queue = LiteQueue(filename=database_path)
+    popped = queue.pop()
+
+    assert popped is not None
+    assert popped.data == "old"
+    assert popped.available_at is None
+    assert get_queue_indexes(queue, "Queue") == EXPECTED_QUEUE_INDEXES
+
+
+@pytest.mark.parametrize("pop_method", ("_pop_returning", "_pop_transaction"))
+def test_pop_increments_persisted_attempts(tmp_path: Path, pop_method: str) -> None:
+    """Each claim counts as one attempt, including after reopening the queue."""
+    if pop_method == "_pop_returning" and sqlite3.sqlite_version_info < (3, 35, 0):
+        pytest.skip("SQLite RETURNING requires SQLite 3.35 or newer")
+
+    database_path = tmp_path / "queue.sqlite3"
+    queue = LiteQueue(filename=database_path)
+    message = queue.put("work")
+    first_claim = getattr(queue, pop_method)()
+    queue.retry(message.message_id)
+    queue.close()
+
+    reopened_queue = LiteQueue(filename=database_path)
+    second_claim = getattr(reopened_queue, pop_method)()
+
+    assert message.attempts == 0
+    assert first_claim.attempts == 1
+    assert second_claim.attempts == 2
+    assert reopened_queue.get(message.message_id) == second_claim
+
+
+def test_retry_moves_exhausted_message_to_failed(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", max_attempts=2)
+    message = queue.put("poison")
+
+    queue.pop()
+    assert queue.retry(message.message_id) is True
+    retried = queue.get(message.message_id)
+    assert retried is not None
+    assert retried.status == MessageStatus.READY
+
+    queue.pop()
+    assert queue.retry(message.message_id, delay_seconds=10) is True
+
+    failed = queue.get(message.message_id)
+    assert failed is not None
+    assert failed.status == MessageStatus.FAILED
+    assert failed.attempts == 2
+    assert failed.done_time is not None
+    assert [item.message_id for item in queue.list_failed()] == [message.message_id]
+    assert queue.pop() is None
+
+
+def test_retry_of_failed_message_resets_attempts(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", max_attempts=1)
+    message = queue.put("poison")
+    queue.pop()
+    queue.retry(message.message_id)
+
+    assert queue.retry(message.message_id) is True
+
+    retried = queue.get(message.message_id)
+    assert retried is not None
+    assert retried.status == MessageStatus.READY
+    assert retried.attempts == 0
+    assert retried.done_time is None
+
+
+def test_max_attempts_persists_and_rejects_conflicts(tmp_path: Path) -> None:
+    database_path = tmp_path / "queue.sqlite3"
+    LiteQueue(filename=database_path, max_attempts=3).close()
+
+    assert LiteQueue(filename=database_path).max_attempts == 3
+    assert LiteQueue(filename=database_path, max_attempts=3).max_attempts == 3
+    with pytest.raises(ValueError, match="conflicts with stored max_attempts 3"):
+        LiteQueue(filename=database_path, max_attempts=4)
+
+
+def test_queue_without_max_attempts_adopts_it_once(tmp_path: Path) -> None:
+    database_path = tmp_path / "queue.sqlite3"
+    LiteQueue(filename=database_path).close()
+
+    assert LiteQueue(filename=database_path, max_attempts=3).max_attempts == 3
+    assert LiteQueue(filename=database_path).max_attempts == 3
+    with pytest.raises(ValueError, match="conflicts with stored max_attempts 3"):
+        LiteQueue(filename=database_path, max_attempts=4)
+
+
+@pytest.mark.parametrize(
+    ("max_attempts", "error_type"),
+    ((0, ValueError), (-1, ValueError), (True, TypeError), (1.5, TypeError)),
+)
+def test_invalid_max_attempts_is_rejected_before_schema_changes(
+    tmp_path: Path,
+    max_attempts,
+    error_type,
+) -> None:
+    database_path = tmp_path / "queue.sqlite3"
+
+    with pytest.raises(error_type, match="max_attempts must be"):
+        LiteQueue(filename=database_path, max_attempts=max_attempts)
+
+    assert not database_path.exists()
+
+
+@pytest.mark.parametrize(
+    ("read_pool_size", "error_type"),
+    ((0, ValueError), (-1, ValueError), (True, TypeError), (1.5, TypeError)),
+)
+def test_invalid_read_pool_size_is_rejected(
+    tmp_path: Path,
+    read_pool_size,
+    error_type,
+) -> None:
+    database_path = tmp_path / "queue.sqlite3"
+
+    with pytest.raises(error_type, match="read_pool_size must be"):
+        LiteQueue(filename=database_path, read_pool_size=read_pool_size)
+
+    assert not database_path.exists()
+
+
+def test_put_with_dedup_key_returns_existing_message(single_queue) -> None:
+    q = single_queue
+    original = q.put("charge order 7", dedup_key="order-7")
+
+    duplicate = q.put("charge order 7 again", dedup_key="order-7")
+
+    assert duplicate == original
+    assert q.qsize() == 1
+    assert q.put("other", dedup_key="order-8").message_id != original.message_id
+
+
+def test_dedup_key_applies_to_processed_messages_until_pruned(single_queue) -> None:
+    q = single_queue
+    original = q.put("send receipt", dedup_key="receipt-1")
+    q.done(q.pop().message_id)
+
+    duplicate = q.put("send receipt", dedup_key="receipt-1")
+    assert duplicate.message_id == original.message_id
+    assert duplicate.status == MessageStatus.DONE
+
+    q.prune()
+    fresh = q.put("send receipt", dedup_key="receipt-1")
+    assert fresh.message_id != original.message_id
+    assert fresh.status == MessageStatus.READY
+
+
+def test_keyed_put_uses_a_single_statement(single_queue) -> None:
+    """Deduplication needs no lookup before the insert."""
+    q = single_queue
+    q.put("first", dedup_key="key")
+    statements: list[str] = []
+    q.conn.set_trace_callback(statements.append)
+
+    q.put("second", dedup_key="other-key")
+
+    assert len(statements) == 1
+    assert "ON CONFLICT (dedup_key)" in statements[0]
+
+
+def test_put_many_inserts_in_order_and_deduplicates(single_queue) -> None:
+    q = single_queue
+    existing = q.put("existing", dedup_key="a")
+
+    messages = q.put_many(
+        ["first", "duplicate of existing", "second", "duplicate in batch"],
+        dedup_keys=[None, "a", "b", "b"],
+    )
+
+    assert [message.data for message in messages] == [
+        "first",
+        "existing",
+        "second",
+        "second",
+    ]
+    assert messages[1] == existing
+    assert messages[3] == messages[2]
+    assert q.qsize() == 3
+    assert [q.pop().data for _ in range(3)] == ["existing", "first", "second"]
+
+
+def test_put_many_rolls_back_on_failure(tmp_path: Path) -> None:
+    q = LiteQueue(filename=tmp_path / "queue.sqlite3", maxsize=2)
+
+    with pytest.raises(sqlite3.IntegrityError, match="Max queue length reached"):
+        q.put_many(["first", "second", "third"])
+
+    assert q.qsize() == 0
+
+
+def test_put_many_requires_one_dedup_key_per_message(single_queue) -> None:
+    with pytest.raises(ValueError, match="one key per message"):
+        single_queue.put_many(["first", "second"], dedup_keys=["a"])
+
+
+def test_coalesce_key_updates_pending_message_in_place(single_queue) -> None:
+    q = single_queue
+    first = q.put("reindex v1", coalesce_key="product-1")
+    other = q.put("reindex other", coalesce_key="product-2")
+
+    latest = q.put("reindex v3", coalesce_key="product-1")
+
+    assert latest.message_id == first.message_id
+    assert latest.data == "reindex v3"
+    assert q.get(first.message_id) == latest
+    assert q.qsize() == 2
+    assert [q.pop().message_id for _ in range(2)] == [
+        first.message_id,
+        other.message_id,
+    ]
+
+
+def test_coalesce_key_does_not_touch_locked_messages(single_queue) -> None:
+    q = single_queue
+    locked = q.put("reindex v1", coalesce_key="product-1")
+    q.pop()
+
+    pending = q.put("reindex v2", coalesce_key="product-1")
+
+    assert pending.message_id != locked.message_id
+    assert q.get(locked.message_id).data == "reindex v1"
+    assert q.get(locked.message_id).status == MessageStatus.LOCKED
+
+    assert q.retry(locked.message_id) is True
+    retried = q.get(locked.message_id)
+    assert retried.status == MessageStatus.READY
+    assert retried.coalesce_key is None
+    assert q.put("reindex v3", coalesce_key="product-1").message_id == (
+        pending.message_id
+    )
+
+
+def test_coalesce_keeps_earliest_delivery_time(single_queue, monkeypatch) -> None:
+    q = single_queue
+    now = time.time_ns()
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now)
+    delayed = q.put("v1", delay_seconds=60, coalesce_key="key")
+
+    immediate = q.put("v2", coalesce_key="key")
+    still_immediate = q.put("v3", delay_seconds=60, coalesce_key="key")
+
+    assert immediate.message_id == delayed.message_id
+    assert immediate.status == MessageStatus.READY
+    assert immediate.available_at == now
+    assert still_immediate.status == MessageStatus.READY
+    assert still_immediate.data == "v3"
+
+
+def test_dedup_and_coalesce_keys_are_exclusive(single_queue) -> None:
+    with pytest.raises(ValueError, match="cannot be used together"):
+        single_queue.put("data", dedup_key="a", coalesce_key="b")
+
+
+def test_partition_allows_one_locked_message_per_key(single_queue) -> None:
+    q = single_queue
+    a1 = q.put("a1", partition_key="customer-a")
+    a2 = q.put("a2", partition_key="customer-a")
+    b1 = q.put("b1", partition_key="customer-b")
+    free = q.put("free")
+
+    claimed = [q.pop(), q.pop(), q.pop()]
+
+    assert [message.message_id for message in claimed] == [
+        a1.message_id,
+        b1.message_id,
+        free.message_id,
+    ]
+    assert q.peek() is None
+    assert q.pop() is None
+
+    q.done(a1.message_id)
+
+    peeked = q.peek()
+    assert peeked is not None
+    assert peeked.message_id == a2.message_id
+    claimed_again = q.pop()
+    assert claimed_again is not None
+    assert claimed_again.message_id == a2.message_id
+
+
+def test_retried_partition_message_is_delivered_before_later_ones(
+    single_queue,
+) -> None:
+    q = single_queue
+    first = q.put("first", partition_key="customer")
+    q.put("second", partition_key="customer")
+
+    q.pop()
+    q.retry(first.message_id)
+
+    retried = q.pop()
+    assert retried is not None
+    assert retried.message_id == first.message_id
+
+
+def test_delayed_retry_holds_back_its_partition(single_queue, monkeypatch) -> None:
+    q = single_queue
+    first = q.put("first", partition_key="customer")
+    second = q.put("second", partition_key="customer")
+    other = q.put("other", partition_key="other-customer")
+
+    q.pop()
+    q.retry(first.message_id, delay_seconds=10)
+
+    assert q.peek() == other
+    claimed = q.pop()
+    assert claimed is not None
+    assert claimed.message_id == other.message_id
+    assert q.pop() is None
+
+    now = litequeue.time_ns()
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now + 11_000_000_000)
+    assert [message.message_id for message in q.pop_many(10)] == [first.message_id]
+    q.done(first.message_id)
+    assert [message.message_id for message in q.pop_many(10)] == [second.message_id]
+
+
+def test_delayed_put_holds_back_later_partition_messages(
+    single_queue, monkeypatch
+) -> None:
+    q = single_queue
+    first = q.put("first", partition_key="customer", delay_seconds=10)
+    q.put("second", partition_key="customer")
+
+    assert q.pop() is None
+
+    now = litequeue.time_ns()
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now + 11_000_000_000)
+    claimed = q.pop()
+    assert claimed is not None
+    assert claimed.message_id == first.message_id
+
+
+def test_topic_filter_does_not_skip_older_partition_messages(single_queue) -> None:
+    q = single_queue
+    first = q.put("first", partition_key="file", topic="upload")
+    second = q.put("second", partition_key="file", topic="scan")
+
+    assert q.pop(topics=["scan"]) is None
+    claimed = q.pop(topics=["upload"])
+    assert claimed is not None
+    assert claimed.message_id == first.message_id
+    q.done(first.message_id)
+
+    claimed = q.pop(topics=["scan"])
+    assert claimed is not None
+    assert claimed.message_id == second.message_id
+
+
+@pytest.mark.skipif(
+    sqlite3.sqlite_version_info < (3, 35, 0),
+    reason="SQLite RETURNING requires SQLite 3.35 or newer",
+)
+def test_partition_claim_checks_siblings_through_index(single_queue) -> None:
+    q = single_queue
+    statements: list[str] = []
+    q.conn.set_trace_callback(statements.append)
+    q.pop()
+    q.conn.set_trace_callback(None)
+    claim_statement = next(
+        statement for statement in statements if "RETURNING" in statement
+    )
+
+    plan_rows = q.conn.execute(
+        f"EXPLAIN QUERY PLAN {claim_statement}",
+        {"now": time.time_ns()},
+    ).fetchall()
+    plan = "\n".join(row["detail"] for row in plan_rows)
+
+    assert "Queue_partition_key_status_message_id_idx" in plan
+    assert "USE TEMP B-TREE" not in plan
+
+
+@pytest.mark.parametrize("pop_method", ("_pop_returning", "_pop_transaction"))
+def test_pop_claims_only_requested_topics(tmp_path: Path, pop_method: str) -> None:
+    if pop_method == "_pop_returning" and sqlite3.sqlite_version_info < (3, 35, 0):
+        pytest.skip("SQLite RETURNING requires SQLite 3.35 or newer")
+
+    q = LiteQueue(filename=tmp_path / "queue.sqlite3")
+    pop = getattr(q, pop_method)
+    resize = q.put("resize", topic="images")
+    email = q.put("email", topic="email")
+    webhook = q.put("webhook", topic="webhooks")
+    untagged = q.put("untagged")
+
+    assert pop(topics=["webhooks", "email"]).message_id == email.message_id
+    assert pop(topics=("webhooks", "email")).message_id == webhook.message_id
+    assert pop(topics=["email"]) is None
+    assert pop().message_id == resize.message_id
+    assert pop().message_id == untagged.message_id
+    stored_email = q.get(email.message_id)
+    assert stored_email is not None
+    assert stored_email.topic == "email"
+
+
+def test_topic_claim_reads_topic_heads_through_index(single_queue) -> None:
+    q = single_queue
+    candidate_sql = q._claim_candidate_sql(topic_count=2)
+
+    plan_rows = q.conn.execute(
+        f"EXPLAIN QUERY PLAN {candidate_sql}",
+        {"topic_0": "email", "topic_1": "images"},
+    ).fetchall()
+    plan = "\n".join(row["detail"] for row in plan_rows)
+
+    assert "Queue_topic_status_message_id_idx (topic=? AND status=?)" in plan
+    assert "Queue_status_message_id_idx" not in plan
+
+
+@pytest.mark.parametrize(
+    ("topics", "error_type"),
+    (("email", TypeError), ([], ValueError)),
+)
+def test_invalid_topic_filter_is_rejected(single_queue, topics, error_type) -> None:
+    single_queue.put("message", topic="email")
+
+    with pytest.raises(error_type, match="topics must"):
+        single_queue.pop(topics=topics)
+
+    assert single_queue.qsize() == 1
+
+
+def test_named_queues_share_connections_and_keep_messages_apart(
+    tmp_path: Path,
+) -> None:
+    queue = LiteQueue(filename=tmp_path / "queues.sqlite3")
+    emails = queue.named_queue("emails")
+    images = queue.named_queue("images", maxsize=1)
+
+    queue.put("default")
+    email = emails.put("send welcome email")
+    images.put("resize photo")
+
+    assert emails.conn is queue.conn
+    assert images._connections is queue._connections
+    assert emails.table == '"Queue:emails"'
+    assert queue.qsize() == emails.qsize() == images.qsize() == 1
+    assert images.full()
+    assert queue.get(email.message_id) is None
+    claimed_email = emails.pop()
+    assert claimed_email is not None
+    assert claimed_email.message_id == email.message_id
+    assert emails.pop() is None
+    claimed_default = queue.pop()
+    assert claimed_default is not None
+    assert claimed_default.data == "default"
+    assert queue.queue_names() == ["emails", "images"]
+
+
+def test_queue_statements_are_built_once_per_table(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queues.sqlite3")
+    emails = queue.named_queue("emails")
+
+    emails.put("send", topic="mail")
+    assert emails.pop(topics=["mail"]) is not None
+    statement = emails._sql.pop_returning.get(1) or emails._sql.pop_select[1]
+    assert emails.pop(topics=["other"]) is None
+    assert (emails._sql.pop_returning.get(1) or emails._sql.pop_select[1]) is (
+        statement
+    )
+    assert '"Queue:emails"' in emails._sql.insert
+    assert '"Queue:emails"' not in queue._sql.insert
+    queue.close()
+
+
+def test_named_queue_settings_and_indexes_persist(tmp_path: Path) -> None:
+    database_path = tmp_path / "queues.sqlite3"
+    queue = LiteQueue(filename=database_path)
+    queue.named_queue("emails", maxsize=5, max_attempts=2).put("message")
+    queue.close()
+
+    reopened_queue = LiteQueue(filename=database_path)
+    emails = reopened_queue.named_queue("emails")
+
+    assert reopened_queue.maxsize is None
+    assert reopened_queue.max_attempts is None
+    assert emails.maxsize == 5
+    assert emails.max_attempts == 2
+    assert emails.qsize() == 1
+    assert get_queue_indexes(emails, "Queue:emails") == {
+        name.replace("Queue_", "Queue:emails_", 1): index
+        for name, index in EXPECTED_QUEUE_INDEXES.items()
+    }
+    with pytest.raises(ValueError, match="for queue 'Queue:emails'"):
+        reopened_queue.named_queue("emails", maxsize=6)
+
+
+def test_transaction_spans_named_queues(tmp_path: Path) -> None:
+    """Named queues share the write connection, so one transaction covers both."""
+    queue = LiteQueue(filename=tmp_path / "queues.sqlite3")
+    incoming = queue.named_queue("incoming")
+    outgoing = queue.named_queue("outgoing")
+    message = incoming.put("order")
+
+    with queue.transaction(mode="IMMEDIATE"):
+        claimed = incoming.pop()
+        assert claimed is not None
+        outgoing.put(claimed.data)
+        incoming.done(claimed.message_id)
+
+    finished = incoming.get(message.message_id)
+    assert finished is not None
+    assert finished.status == MessageStatus.DONE
+    forwarded = outgoing.peek()
+    assert forwarded is not None
+    assert forwarded.data == "order"
+
+
+def test_closing_a_named_queue_closes_the_database(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queues.sqlite3")
+    emails = queue.named_queue("emails")
+
+    emails.close()
+
+    with pytest.raises(sqlite3.ProgrammingError, match="closed database"):
+        queue.qsize()
+
+
+@pytest.mark.parametrize(
+    ("name", "error_type"),
+    (("", ValueError), ('bad"name', ValueError), ("a:b", ValueError), (1, TypeError)),
+)
+def test_invalid_named_queue_names_are_rejected(
+    single_queue,
+    name,
+    error_type,
+) -> None:
+    with pytest.raises(error_type, match="name must"):
+        single_queue.named_queue(name)
+
+    assert single_queue.queue_names() == []
+
+
+def test_readonly_queue_reads_without_write_connection(tmp_path: Path) -> None:
+    database_path = tmp_path / "queue.sqlite3"
+    writer = LiteQueue(filename=database_path, maxsize=10, max_attempts=1)
+    writer.put("first")
+    failed = writer.pop()
+    assert failed is not None
+    writer.retry(failed.message_id)
+    writer.put("second")
+    writer.named_queue("emails").put("email")
+
+    reader = LiteQueue.open_readonly(database_path)
+
+    assert reader._connections.write_connection is None
+    assert (reader.maxsize, reader.max_attempts) == (10, 1)
+    assert reader.qsize() == 1
+    peeked = reader.peek()
+    assert peeked is not None
+    assert peeked.data == "second"
+    assert [message.data for message in reader.list_failed()] == ["first"]
+    assert reader.named_queue("emails").qsize() == 1
+    with pytest.raises(sqlite3.OperationalError, match="readonly database"):
+        reader.put("third")
+    with pytest.raises(sqlite3.OperationalError, match="readonly database"):
+        reader.pop()
+    with pytest.raises(ValueError, match="cannot be set on a read-only queue"):
+        reader.named_queue("emails", maxsize=1)
+    assert writer.qsize() == 1
+    reader.close()
+    writer.close()
+
+
+def test_readonly_queue_opens_during_write_transaction(tmp_path: Path) -> None:
+    """Opening and reading take no lock, so an active writer does not block."""
+    database_path = tmp_path / "queue.sqlite3"
+    writer = LiteQueue(filename=database_path)
+    writer.put("committed")
+
+    with writer.transaction():
+        writer.put("uncommitted")
+        reader = LiteQueue.open_readonly(database_path, timeout=0)
+        assert reader.qsize() == 1
+        copied = pickle.loads(pickle.dumps(reader))
+        assert copied._connections.read_only
+        assert copied.qsize() == 1
+
+    assert reader.qsize() == 2
+    copied.close()
+    reader.close()
+    writer.close()
+
+
+def test_readonly_open_requires_existing_queue(tmp_path: Path) -> None:
+    with pytest.raises(sqlite3.OperationalError, match="unable to open"):
+        LiteQueue.open_readonly(tmp_path / "missing.sqlite3")
+    assert not (tmp_path / "missing.sqlite3").exists()
+
+    LiteQueue(filename=tmp_path / "queue.sqlite3").close()
+    reader = LiteQueue.open_readonly(tmp_path / "queue.sqlite3")
+    with pytest.raises(ValueError, match="queue 'Queue:emails' does not exist"):
+        reader.named_queue("emails")
+    reader.close()
+
+
+def make_sharded_queue(tmp_path: Path, shard_count: int = 3) -> ShardedLiteQueue:
+    return ShardedLiteQueue(
+        [tmp_path / f"shard{index}.sqlite3" for index in range(shard_count)]
+    )
+
+
+def test_sharded_queue_spreads_messages_and_routes_acks(tmp_path: Path) -> None:
+    queue = make_sharded_queue(tmp_path)
+    messages = [queue.put(f"message {index}") for index in range(6)]
+
+    assert [shard.qsize() for shard in queue.shards] == [2, 2, 2]
+    assert queue.qsize() == 6
+    for shard_index, message in enumerate(messages):
+        assert queue.shards[shard_index % 3].get(message.message_id) == message
+
+    popped = [queue.pop() for _ in range(6)]
+    assert queue.pop() is None
+    assert queue.empty()
+    assert sorted(message.data for message in popped if message) == sorted(
+        message.data for message in messages
+    )
+
+    first, second, third = popped[:3]
+    assert first is not None and second is not None and third is not None
+    assert queue.done(first.message_id)
+    assert queue.mark_failed(second.message_id)
+    assert queue.retry(third.message_id)
+    finished = queue.get(first.message_id)
+    assert finished is not None
+    assert finished.status == MessageStatus.DONE
+    assert [message.message_id for message in queue.list_failed()] == [
+        second.message_id
+    ]
+    assert queue.qsize() == 4
+    queue.close()
+
+
+def test_sharded_queue_keeps_fifo_order_within_a_shard(tmp_path: Path) -> None:
+    queue = make_sharded_queue(tmp_path, shard_count=2)
+    for index in range(6):
+        queue.put(f"message {index}")
+
+    popped = [queue.pop() for _ in range(6)]
+    for shard_index in range(2):
+        shard_messages = [
+            message.data
+            for message in popped
+            if message is not None
+            and queue.shards[shard_index].get(message.message_id) is not None
+        ]
+        assert shard_messages == [
+            f"message {index}" for index in range(shard_index, 6, 2)
+        ]
+    queue.close()
+
+
+def test_sharded_queue_routes_keyed_messages_to_one_shard(tmp_path: Path) -> None:
+    queue = make_sharded_queue(tmp_path)
+    first = queue.put("first", dedup_key="invoice-1")
+    duplicate = queue.put("second", dedup_key="invoice-1")
+    ordered = [
+        queue.put(f"step {index}", partition_key="order-7") for index in range(3)
+    ]
+
+    assert duplicate == first
+    shards_with_order = [
+        shard
+        for shard in queue.shards
+        if all(shard.get(message.message_id) for message in ordered)
+    ]
+    assert len(shards_with_order) == 1
+    queue.close()
+
+
+def test_sharded_queue_routes_partitions_before_dedup_keys(tmp_path: Path) -> None:
+    queue = make_sharded_queue(tmp_path, shard_count=4)
+    messages = [
+        queue.put(f"invoice {index}", partition_key="customer", dedup_key=str(index))
+        for index in range(6)
+    ]
+
+    assert [len(queue.pop_many(10)) for _ in range(2)] == [1, 0]
+    assert sum(shard.qsize() > 0 for shard in queue.shards) == 1
+    duplicate = queue.put("again", partition_key="customer", dedup_key="5")
+    assert duplicate == messages[5]
+    queue.close()
+
+
+def test_sharded_queue_deduplicates_empty_keys(tmp_path: Path) -> None:
+    queue = make_sharded_queue(tmp_path)
+    message = queue.put("first", dedup_key="")
+
+    assert [queue.put("again", dedup_key="") for _ in range(3)] == [message] * 3
+    assert queue.qsize() == 1
+    queue.close()
+
+
+def test_sharded_queue_ignores_unknown_message_ids(tmp_path: Path) -> None:
+    queue = make_sharded_queue(tmp_path, shard_count=2)
+    message = queue.put("hello")
+    foreign_id = str(uuid.UUID(int=(uuid.UUID(message.message_id).int | 0xFFFF)))
+
+    assert queue.get("not a uuid") is None
+    assert not queue.done("not a uuid")
+    assert queue.get(foreign_id) is None
+    assert not queue.retry(foreign_id)
+    queue.close()
+
+
+@pytest.mark.parametrize(
+    ("filenames", "error_type"),
+    (("queue.sqlite3", TypeError), ([], ValueError)),
+)
+def test_invalid_shard_filenames_are_rejected(filenames, error_type) -> None:
+    with pytest.raises(error_type):
+        ShardedLiteQueue(filenames)
+
+
+def test_log_groups_read_the_same_entries_independently(single_queue) -> None:
+    log = single_queue.log("events")
+    entries = log.append_many(["created", "paid", "shipped"])
+
+    assert [entry.offset for entry in entries] == [1, 2, 3]
+    assert log.read("billing") == entries
+    assert log.read("emails", limit=2) == entries[:2]
+
+    log.commit("billing", entries[1].offset)
+    assert log.read("billing") == entries[2:]
+    assert log.read("emails") == entries
+
+    log.commit("billing", entries[0].offset)
+    assert log.groups() == {"billing": 2}
+    assert single_queue.log_names() == ["events"]
+    assert single_queue.qsize() == 0
+
+
+def test_log_retention_follows_the_slowest_group(single_queue) -> None:
+    log = single_queue.log("events")
+    log.append_many(f"event {index}" for index in range(5))
+    assert log.retain() == 0
+
+    log.commit("fast", 4)
+    log.commit("slow", 0)
+    assert log.retain() == 0
+
+    log.commit("slow", 2)
+    assert log.retain() == 2
+    assert [entry.data for entry in log.read("new")] == [
+        "event 2",
+        "event 3",
+        "event 4",
+    ]
+
+    assert log.remove_group("slow")
+    assert log.retain() == 2
+    assert log.read("fast") == [log.read("new")[0]]
+
+    log.commit("fast", 5)
+    assert log.retain() == 1
+    assert log.append("after retention").offset == 6
+    assert log.last_offset() == 6
+
+
+def test_log_read_is_a_range_scan(single_queue) -> None:
+    log = single_queue.log("events")
+    plan_rows = single_queue.conn.execute(
+        f"""
+        EXPLAIN QUERY PLAN
+        SELECT log_offset, data, in_time FROM {log.table}
+        WHERE log_offset > COALESCE(
+            (
+              SELECT committed_offset FROM "LogOffsets"
+              WHERE log_table = :log_table AND group_name = :group
+            ),
+            0
+        )
+        ORDER BY log_offset
+        LIMIT 100
+        """,
+        {"log_table": log.table_name, "group": "billing"},
+    ).fetchall()
+    plan = "\n".join(row["detail"] for row in plan_rows)
+
+    assert "USING INTEGER PRIMARY KEY (rowid>?)" in plan
+    assert "USE TEMP B-TREE" not in plan
+
+
+def test_log_survives_reopen(tmp_path: Path) -> None:
+    database_path = tmp_path / "queue.sqlite3"
+    queue = LiteQueue(filename=database_path)
+    log = queue.log("events")
+    log.append_many(["created", "paid"])
+    log.commit("billing", 1)
+    queue.close()
+
+    reopened = LiteQueue(filename=database_path)
+    assert [entry.data for entry in reopened.log("events").read("billing")] == ["paid"]
+    reopened.close()
+
+
+@pytest.mark.parametrize(
+    ("arguments", "error_type"),
+    (
+        (("", 0), ValueError),
+        ((None, 0), TypeError),
+        (("billing", -1), ValueError),
+        (("billing", "1"), TypeError),
+        (("billing", 3), ValueError),
+    ),
+)
+def test_invalid_log_commits_are_rejected(single_queue, arguments, error_type) -> None:
+    log = single_queue.log("events")
+    log.append("created")
+
+    with pytest.raises(error_type):
+        log.commit(*arguments)
+
+
+@pytest.mark.parametrize("pop_method", ("_pop_returning", "_pop_transaction"))
+def test_pop_many_claims_a_fifo_batch(tmp_path: Path, pop_method: str) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3")
+    queue.pop = getattr(queue, pop_method)
+    queue.put("a", topic="x")
+    queue.put("b", topic="y")
+    queue.put("c", topic="x")
+    queue.put("d", partition_key="order")
+    queue.put("e", partition_key="order")
+
+    assert [message.data for message in queue.pop_many(2, topics=["x"])] == ["a", "c"]
+    batch = queue.pop_many(10)
+    assert [message.data for message in batch] == ["b", "d"]
+    assert {message.status for message in batch} == {MessageStatus.LOCKED}
+    assert {message.attempts for message in batch} == {1}
+    assert queue.pop_many(10) == []
+    queue.close()
+
+
+def test_release_returns_message_without_counting_an_attempt(single_queue) -> None:
+    message = single_queue.put("hello")
+    assert not single_queue.release(message.message_id)
+
+    claimed = single_queue.pop()
+    assert claimed is not None
+    assert single_queue.release(claimed.message_id)
+
+    released = single_queue.get(message.message_id)
+    assert released is not None
+    assert released.status == MessageStatus.READY
+    assert released.lock_time is None
+    assert released.attempts == 0
+    reclaimed = single_queue.pop()
+    assert reclaimed is not None
+    assert (reclaimed.message_id, reclaimed.attempts) == (claimed.message_id, 1)
+    assert not single_queue.release("missing")
+
+
+def test_prefetching_consumer_hands_out_and_releases_messages(single_queue) -> None:
+    for index in range(10):
+        single_queue.put(f"message {index}")
+
+    consumer = PrefetchingConsumer(single_queue, window=4, low_water=2)
+    first = consumer.get(timeout=5)
+    second = consumer.get(timeout=5)
+    assert first is not None and second is not None
+    assert [first.data, second.data] == ["message 0", "message 1"]
+    single_queue.done(first.message_id)
+    single_queue.done(second.message_id)
+    consumer.close()
+
+    assert consumer.get(timeout=0) is None
+    assert list(single_queue.list_locked(threshold_seconds=0)) == []
+    assert single_queue.qsize() == 8
+    remaining = single_queue.pop_many(10)
+    assert [message.data for message in remaining] == [
+        f"message {index}" for index in range(2, 10)
+    ]
+    assert {message.attempts for message in remaining} == {1}
+
+
+def test_prefetching_consumer_waits_for_new_messages(single_queue) -> None:
+    with PrefetchingConsumer(single_queue, window=2, poll_interval=0.01) as consumer:
+        assert consumer.get(timeout=0.05) is None
+        single_queue.put("late")
+        message = consumer.get(timeout=5)
+        assert message is not None
+        assert message.data == "late"
+
+
+@pytest.mark.parametrize(
+    ("options", "error_type"),
+    (
+        ({"window": 0}, ValueError),
+        ({"window": 2, "low_water": 3}, ValueError),
+        ({"low_water": 1.5}, TypeError),
+        ({"topics": "email"}, TypeError),
+        ({"poll_interval": 0}, ValueError),
+        ({"poll_interval": -1}, ValueError),
+        ({"poll_interval": math.inf}, ValueError),
+        ({"poll_interval": "1"}, TypeError),
+    ),
+)
+def test_invalid_prefetch_options_are_rejected(
+    single_queue, options, error_type
+) -> None:
+    with pytest.raises(error_type):
+        PrefetchingConsumer(single_queue, **options)
+
+
+def test_consume_runs_handlers_and_acknowledges_results(single_queue) -> None:
+    for index in range(20):
+        single_queue.put(str(index))
+    handled: list[str] = []
+    handled_lock = threading.Lock()
+
+    def handler(message: Message) -> None:
+        with handled_lock:
+            handled.append(message.data)
+        if int(message.data) % 5 == 0 and message.attempts == 1:
+            raise RuntimeError("try again")
+
+    stats = single_queue.consume(handler, workers=4, batch_size=3, idle_timeout=0)
+
+    assert stats.processed == 20
+    assert stats.failed == 4
+    assert stats.released == 0
+    assert stats.messages_per_second > 0
+    assert sorted(handled, key=int) == sorted(
+        [str(index) for index in range(20)] + ["0", "5", "10", "15"], key=int
+    )
+    assert single_queue.qsize() == 0
+    assert {message.attempts for message in single_queue.list_failed()} == set()
+
+
+def test_consume_stops_after_max_messages(single_queue) -> None:
+    for index in range(10):
+        single_queue.put(str(index))
+
+    stats = single_queue.consume(lambda message: None, workers=2, max_messages=4)
+
+    assert stats.processed == 4
+    assert single_queue.qsize() == 6
+    assert list(single_queue.list_locked(threshold_seconds=0)) == []
+
+
+def test_consume_drains_on_stop(single_queue) -> None:
+    for index in range(10):
+        single_queue.put(str(index))
+    stop = threading.Event()
+    started = threading.Barrier(2)
+
+    def handler(message: Message) -> None:
+        if not stop.is_set():
+            started.wait(timeout=5)
+            stop.set()
+
+    stats = single_queue.consume(handler, workers=2, batch_size=2, stop=stop)
+
+    # Two messages were running when the stop was requested. Messages that
+    # were claimed but not started are released instead of processed.
+    assert 2 <= stats.processed + stats.released <= 4
+    assert stats.processed >= 2
+    assert single_queue.qsize() == 10 - stats.processed
+    assert list(single_queue.list_locked(threshold_seconds=0)) == []
+    assert {message.attempts for message in single_queue.pop_many(10)} == {1}
+
+
+def test_consume_waits_for_delayed_messages(single_queue) -> None:
+    single_queue.put("later", delay_seconds=0.1)
+    handled: list[str] = []
+
+    stats = single_queue.consume(
+        lambda message: handled.append(message.data), idle_timeout=0.2
+    )
+
+    assert handled == ["later"]
+    assert stats.processed == 1
+    assert stats.elapsed_seconds < 0.2 + 0.1 + 0.2
+
+
+@pytest.mark.parametrize(
+    ("options", "error_type"),
+    (
+        ({"workers": 0}, ValueError),
+        ({"batch_size": 1.0}, TypeError),
+        ({"idle_timeout": -1}, ValueError),
+        ({"retry_delay_seconds": "1"}, TypeError),
+    ),
+)
+def test_invalid_consume_options_are_rejected(
+    single_queue, options, error_type
+) -> None:
+    with pytest.raises(error_type):
+        single_queue.consume(lambda message: None, **options)
+
+
+def test_delayed_messages_count_against_maxsize(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", maxsize=1)
+    queue.put("later", delay_seconds=60)
+
+    assert queue.full()
+    with pytest.raises(sqlite3.IntegrityError, match="Max queue length reached"):
+        queue.put("now", delay_seconds=0.01)
+    assert queue.qsize() == 1
+    queue.close()
+
+
+def test_reopen_replaces_maxsize_trigger_of_older_versions(tmp_path: Path) -> None:
+    database_path = tmp_path / "queue.sqlite3"
+    LiteQueue(filename=database_path, maxsize=1).close()
+    connection = sqlite3.connect(database_path)
+    with connection:
+        connection.execute('DROP TRIGGER "maxsize_control_Queue"')
+        connection.execute(
+            """
+            CREATE TRIGGER "maxsize_control_Queue" BEFORE INSERT ON "Queue"
+            WHEN (SELECT COUNT(*) FROM "Queue" WHERE status = 0) >= 1
+            BEGIN SELECT RAISE (ABORT,'Max queue length reached: 1'); END;
+            """
+        )
+    connection.close()
+
+    queue = LiteQueue(filename=database_path)
+    queue.put("later", delay_seconds=60)
+
+    assert queue.maxsize == 1
+    with pytest.raises(sqlite3.IntegrityError, match="Max queue length reached"):
+        queue.put("again", delay_seconds=60)
+    queue.close()
+
+
+def test_duplicate_put_on_full_queue_returns_stored_message(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", maxsize=1)
+    message = queue.put("charge", dedup_key="invoice-1")
+
+    assert queue.put("charge again", dedup_key="invoice-1") == message
+    with pytest.raises(sqlite3.IntegrityError, match="Max queue length reached"):
+        queue.put("other", dedup_key="invoice-2")
+    queue.close()
+
+
+def test_coalescing_put_on_full_queue_updates_in_place(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", maxsize=1)
+    queue.put("v1", coalesce_key="product-1")
+
+    assert queue.put("v2", coalesce_key="product-1").data == "v2"
+    with pytest.raises(sqlite3.IntegrityError, match="Max queue length reached"):
+        queue.put("v1", coalesce_key="product-2")
+    assert queue.qsize() == 1
+    queue.close()
+
+
+@pytest.mark.parametrize("routing", ({"topic": "search"}, {"partition_key": "catalog"}))
+def test_coalescing_put_rejects_different_routing(single_queue, routing) -> None:
+    message = single_queue.put("v1", coalesce_key="product-1")
+
+    with pytest.raises(ValueError, match="belongs to a pending message"):
+        single_queue.put("v2", coalesce_key="product-1", **routing)
+    assert single_queue.get(message.message_id) == message
+
+
+def test_reclaim_locked_retries_stale_messages(tmp_path: Path, monkeypatch) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", max_attempts=2)
+    stale = queue.put("stale")
+    exhausted = queue.put("exhausted")
+    queue.pop()
+    queue.pop()
+    queue.retry(exhausted.message_id)
+    queue.pop()
+
+    assert queue.reclaim_locked(60) == 0
+    now = litequeue.time_ns()
+    monkeypatch.setattr(litequeue, "time_ns", lambda: now + 61_000_000_000)
+    assert queue.reclaim_locked(60) == 2
+
+    reclaimed = queue.get(stale.message_id)
+    failed = queue.get(exhausted.message_id)
+    assert reclaimed is not None and failed is not None
+    assert (reclaimed.status, reclaimed.attempts) == (MessageStatus.READY, 1)
+    assert (failed.status, failed.attempts) == (MessageStatus.FAILED, 2)
+    queue.close()
+
+
+def test_metrics_record_operations_and_waits(tmp_path: Path) -> None:
+    events: list[tuple[str, float]] = []
+    metrics = QueueMetrics(
+        callback=lambda name, seconds: events.append((name, seconds))
+    )
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", metrics=metrics)
+    emails = queue.named_queue("emails")
+    # Forget the timings of opening the queues.
+    metrics.reset()
+    events.clear()
+
+    message = queue.put("hello")
+    emails.put("welcome")
+    queue.get(message.message_id)
+    queue.pop()
+    with pytest.raises(RuntimeError):
+        with queue.transaction():
+            queue.put("rolled back")
+            raise RuntimeError
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["put"]["count"] == 3
+    assert snapshot["get"]["count"] == 1
+    assert snapshot["pop"]["count"] == 1
+    assert snapshot["rollback"]["count"] == 1
+    assert snapshot["write_lock_wait"]["count"] >= 3
+    assert snapshot["read_connection_wait"]["count"] == 1
+    for timing in snapshot.values():
+        assert sum(timing["histogram"]) == timing["count"]
+        assert len(timing["histogram"]) == len(QueueMetrics.HISTOGRAM_BOUNDS) + 1
+        assert 0 <= timing["max_seconds"] <= timing["total_seconds"]
+    assert len(events) == sum(timing["count"] for timing in snapshot.values())
+
+    metrics.reset()
+    assert metrics.snapshot() == {}
+    queue.close()
+
+
+def test_metrics_time_committed_transactions(tmp_path: Path) -> None:
+    metrics = QueueMetrics()
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", metrics=metrics)
+    metrics.reset()
+
+    queue.put_many(["first", "second"])
+
+    snapshot = metrics.snapshot()
+    assert snapshot["put_many"]["count"] == 1
+    assert snapshot["transaction"]["count"] == 1
+    assert "rollback" not in snapshot
+    queue.close()
+
+
+def test_metrics_stay_in_process(tmp_path: Path) -> None:
+    metrics = QueueMetrics()
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", metrics=metrics)
+    sharded = ShardedLiteQueue(
+        [tmp_path / "shard0.sqlite3", tmp_path / "shard1.sqlite3"], metrics=metrics
+    )
+
+    queue_copy = pickle.loads(pickle.dumps(queue))
+    sharded_copy = pickle.loads(pickle.dumps(sharded))
+
+    assert queue_copy._connections.metrics is None
+    assert all(shard._connections.metrics is None for shard in sharded_copy.shards)
+    assert all(shard._connections.metrics is metrics for shard in sharded.shards)
+    for closable in (queue, queue_copy, sharded, sharded_copy):
+        closable.close()
+
+
+def test_metrics_must_be_queue_metrics(tmp_path: Path) -> None:
+    with pytest.raises(TypeError, match="metrics must be a QueueMetrics"):
+        LiteQueue(filename=tmp_path / "queue.sqlite3", metrics={})  # type: ignore[arg-type]
+
+
+def test_profiler_aggregates_statements_of_all_connections(tmp_path: Path) -> None:
+    profiler = SQLProfiler()
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", profiler=profiler)
+    profiler.reset()
+
+    messages = [queue.put(f"message {index}") for index in range(3)]
+    for message in messages:
+        assert queue.get(message.message_id) == message
+
+    snapshot = profiler.snapshot()
+    inserts = [entry for sql, entry in snapshot.items() if sql.startswith("INSERT")]
+    get_sql = (
+        f'SELECT {litequeue._MESSAGE_COLUMN_SQL} FROM "Queue" WHERE message_id = ?'
+    )
+
+    assert [entry["count"] for entry in inserts] == [3]
+    assert snapshot[get_sql]["count"] == 3
+    assert all(sql.count("'") == 0 for sql in snapshot)
+    assert all(entry["total_seconds"] >= entry["max_seconds"] >= 0 for entry in inserts)
+    report = profiler.report(limit=1).splitlines()
+    assert report[0].split()[-2:] == ["slow", "statement"]
+    assert len(report) == 2
+    queue.close()
+
+
+def test_profiler_flags_slow_statements(tmp_path: Path) -> None:
+    slow: list[tuple[str, float]] = []
+    profiler = SQLProfiler(
+        slow_threshold=0,
+        on_slow=lambda sql, seconds: slow.append((sql, seconds)),
+        progress_steps=1,
+    )
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", profiler=profiler)
+    profiler.reset()
+    slow.clear()
+
+    queue.put("hello")
+
+    (sql, seconds), *_ = slow
+    assert "'hello'" in sql
+    assert list(profiler.slow_statements) == slow
+    assert any(entry["slow_count"] for entry in profiler.snapshot().values())
+    queue.close()
+
+
+def test_profiler_normalizes_literals_but_keeps_identifiers() -> None:
+    sql = (
+        "SELECT * FROM \"Queue:2024\"\n  WHERE data = 'it''s' AND status IN (0, 4)"
+        " AND available_at <= -1.5e3 AND blob = x'0aff' AND topic IS NULL"
+    )
+
+    assert litequeue._normalize_sql(sql) == (
+        'SELECT * FROM "Queue:2024" WHERE data = ? AND status IN (?, ?)'
+        " AND available_at <= ? AND blob = ? AND topic IS NULL"
+    )
+
+
+def test_profiler_stays_in_process(tmp_path: Path) -> None:
+    profiler = SQLProfiler()
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", profiler=profiler)
+    copied = pickle.loads(pickle.dumps(queue))
+
+    assert copied._connections.profiler is None
+    with pytest.raises(TypeError, match="profiler must be a SQLProfiler"):
+        LiteQueue(filename=tmp_path / "other.sqlite3", profiler=object())  # type: ignore[arg-type]
+    copied.close()
+    queue.close()
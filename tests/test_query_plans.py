@@ -0,0 +1,191 @@
+"""
+Query plans of the statements LiteQueue runs.
+
+The SQLite version matrix in test_sqlite_versions.py runs this module with
+every supported release, so a planner change that turns an index lookup into
+a scan fails there.
+"""
+
+import re
+import sqlite3
+from collections.abc import Mapping
+from dataclasses import fields
+from pathlib import Path
+
+import pytest
+
+import litequeue
+from litequeue import LiteQueue
+from litequeue import MessageStatus
+
+# The index that each frequent statement must search. Statements that are not
+# listed must still avoid scanning the queue table.
+EXPECTED_INDEXES = {
+    "select_by_dedup_key": "Queue_dedup_key_unique_idx",
+    "select_pending_by_coalesce_key": "Queue_coalesce_key_unique_idx",
+    "promote_due_messages": "Queue_status_available_at_idx",
+    "lock_selected_message": "Queue_message_id_unique_idx",
+    "release": "Queue_message_id_unique_idx",
+    "peek": "Queue_status_message_id_idx",
+    "get": "Queue_message_id_unique_idx",
+    "done": "Queue_message_id_unique_idx",
+    "mark_failed": "Queue_message_id_unique_idx",
+    "list_locked": "Queue_status_lock_time_idx",
+    "retry": "Queue_message_id_unique_idx",
+    "next_due_time": "Queue_status_available_at_idx",
+    "stats_counts": "Queue_done_time_status_idx",
+    "stats_throughput": "Queue_done_time_status_idx",
+    "stats_percentiles": "Queue_done_time_status_idx",
+    "pop_returning[0]": "Queue_status_message_id_idx",
+    "pop_returning[1]": "Queue_topic_status_message_id_idx",
+    "pop_returning[2]": "Queue_topic_status_message_id_idx",
+    "pop_select[0]": "Queue_status_message_id_idx",
+    "pop_select[1]": "Queue_topic_status_message_id_idx",
+    "pop_select[2]": "Queue_topic_status_message_id_idx",
+}
+
+# `message_batch()` without a status reads every message by design.
+FULL_SCAN_STATEMENTS = {"batch"}
+
+# Matches "SCAN Queue" and, before SQLite 3.36, "SCAN TABLE Queue", with or
+# without a covering index. Subqueries and pragma functions are not tables.
+SCAN_PATTERN = re.compile(r"SCAN (?:TABLE )?(?!SUBQUERY|CONSTANT ROW|\()(\S+)")
+
+# SQLite tables without indexes. They hold one row per table or log.
+SCANNABLE_TABLES = {"sqlite_schema", "sqlite_master", "sqlite_sequence"}
+
+
+def get_query_plan(
+    connection: sqlite3.Connection,
+    sql: str,
+    parameters: Mapping[str, object] | None = None,
+) -> list[str]:
+    """Return the detail column of EXPLAIN QUERY PLAN for `sql`."""
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or {})
+    return [row[3] for row in rows]
+
+
+def get_table_scans(plan: list[str]) -> list[str]:
+    return [
+        detail
+        for detail in plan
+        if (match := SCAN_PATTERN.match(detail)) is not None
+        and "VIRTUAL TABLE" not in detail
+        and match[1] not in SCANNABLE_TABLES
+    ]
+
+
+def get_queue_statements(queue: LiteQueue) -> dict[str, str]:
+    """Return every statement built for the queue, by name."""
+    returning_options = [False]
+    if queue.get_sqlite_version() >= (3, 35, 0):
+        returning_options.append(True)
+
+    for returning in returning_options:
+        for topic_count in range(3):
+            queue._pop_statement(returning, topic_count)
+
+    statements = {
+        statement_field.name: getattr(queue._sql, statement_field.name)
+        for statement_field in fields(queue._sql)
+        if isinstance(getattr(queue._sql, statement_field.name), str)
+    }
+    for name in ("pop_returning", "pop_select"):
+        for topic_count, sql in getattr(queue._sql, name).items():
+            statements[f"{name}[{topic_count}]"] = sql
+    return statements
+
+
+@pytest.fixture
+def queue(tmp_path: Path) -> LiteQueue:
+    return LiteQueue(filename=tmp_path / "queue.sqlite3", maxsize=100)
+
+
+def test_expected_indexes_name_existing_statements(queue: LiteQueue) -> None:
+    statements = get_queue_statements(queue)
+
+    assert set(EXPECTED_INDEXES) - set(statements) <= {
+        name for name in EXPECTED_INDEXES if name.startswith("pop_returning")
+    }
+
+
+def test_queue_statements_search_their_indexes(queue: LiteQueue) -> None:
+    failures = []
+    for name, sql in get_queue_statements(queue).items():
+        parameters = {parameter: 1 for parameter in re.findall(r":(\w+)", sql)}
+        plan = get_query_plan(queue.conn, sql, parameters)
+        expected_index = EXPECTED_INDEXES.get(name)
+
+        if name not in FULL_SCAN_STATEMENTS and get_table_scans(plan):
+            failures.append(f"{name} scans the queue: {plan}")
+        if expected_index is not None and not any(
+            f"INDEX {expected_index}" in detail for detail in plan
+        ):
+            failures.append(f"{name} does not use {expected_index}: {plan}")
+
+    assert not failures, "\n".join(failures)
+
+
+def test_api_statements_do_not_scan_queue_tables(tmp_path: Path, monkeypatch) -> None:
+    """Every statement issued by the public API reads through an index."""
+    database_path = tmp_path / "queue.sqlite3"
+    connect = sqlite3.connect
+    statements: list[str] = []
+
+    def tracing_connect(*args, **kwargs):
+        connection = connect(*args, **kwargs)
+        connection.set_trace_callback(statements.append)
+        return connection
+
+    monkeypatch.setattr(litequeue.sqlite3, "connect", tracing_connect)
+
+    queue = LiteQueue(filename=database_path, maxsize=100, max_attempts=2)
+    emails = queue.named_queue("emails")
+    log = queue.log("events")
+    first = queue.put("first", partition_key="orders", topic="billing")
+    queue.put("deduplicated", dedup_key="key")
+    queue.put("coalesced", coalesce_key="key")
+    queue.put("coalesced again", coalesce_key="key")
+    queue.put("later", delay_seconds=60)
+    queue.put_many(["many", "more"], dedup_keys=["many", None])
+    emails.put("welcome")
+    queue.peek()
+    queue.pop(topics=["billing"])
+    queue.pop(topics=["billing", "search"])
+    claimed = queue.pop_many(2)
+    queue.release(claimed[0].message_id)
+    queue.get(first.message_id)
+    queue.done(first.message_id)
+    queue.mark_failed(claimed[1].message_id)
+    queue.retry(claimed[1].message_id, delay_seconds=1)
+    queue.list_locked(0)
+    queue.reclaim_locked(0)
+    list(queue.list_failed())
+    queue.message_batch(MessageStatus.DONE)
+    queue.stats()
+    queue.next_due_time()
+    queue.qsize()
+    queue.empty()
+    queue.full()
+    queue.queue_names()
+    log.append("event")
+    log.read("workers")
+    log.commit("workers", 1)
+    log.groups()
+    log.retain()
+    queue.prune()
+    queue.prune(include_failed=False)
+    queue.close()
+    LiteQueue(filename=database_path).close()
+
+    inspector = connect(database_path)
+    failures = []
+    for sql in dict.fromkeys(statements):
+        if sql.startswith(("--", "PRAGMA", "CREATE", "BEGIN", "COMMIT")):
+            continue
+        scans = get_table_scans(get_query_plan(inspector, sql))
+        if scans:
+            failures.append(f"{scans}: {sql}")
+    inspector.close()
+
+    assert not failures, "\n".join(failures)
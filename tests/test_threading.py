@@ -1,5 +1,10 @@
+import multiprocessing
+import os
+import pickle
 import sqlite3
 import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import ExitStack
 from pathlib import Path
@@ -10,6 +15,7 @@ import litequeue
 from litequeue import LiteQueue
 from litequeue import Message
 from litequeue import MessageStatus
+from litequeue import ShardedLiteQueue
 
 
 def require_message(message: Message | None) -> Message:
@@ -42,7 +48,7 @@ def test_file_queue_uses_shared_connection_options(
     tmp_path: Path,
     monkeypatch,
 ) -> None:
-    """File queues enable cross-thread use and disable statement caching."""
+    """Only pooled readers, used by one thread at a time, cache statements."""
     connect = sqlite3.connect
     received_options: list[dict[str, object]] = []
 
@@ -53,11 +59,39 @@ def test_file_queue_uses_shared_connection_options(
     monkeypatch.setattr(litequeue.sqlite3, "connect", recording_connect)
 
     queue = LiteQueue(filename=tmp_path / "queue.sqlite3")
+    queue.qsize()
     queue.close()
 
-    assert len(received_options) == 11
+    assert len(received_options) == 2
     assert all(options["check_same_thread"] is False for options in received_options)
-    assert all(options["cached_statements"] == 0 for options in received_options)
+    write_options, read_options = received_options
+    assert write_options["cached_statements"] == 0
+    assert read_options["cached_statements"] == litequeue._READ_STATEMENT_CACHE_SIZE
+
+
+def test_read_pool_opens_connections_on_demand(tmp_path: Path, monkeypatch) -> None:
+    """Opening and writing use one connection; readers open on first read."""
+    connect = sqlite3.connect
+    connection_count = 0
+
+    def counting_connect(*args, **kwargs):
+        nonlocal connection_count
+        connection_count += 1
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(litequeue.sqlite3, "connect", counting_connect)
+
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3")
+    queue.put("written without a reader")
+    assert connection_count == 1
+
+    queue.qsize()
+    queue.qsize()
+    assert connection_count == 2
+
+    with queue._read_connection(), queue._read_connection():
+        assert connection_count == 3
+    queue.close()
 
 
 def test_read_pool_contains_ten_distinct_query_only_connections(
@@ -81,6 +115,46 @@ def test_read_pool_contains_ten_distinct_query_only_connections(
             connections[0].execute(f"DELETE FROM {queue.table}")
 
 
+def test_read_pool_size_limits_open_read_connections(tmp_path: Path) -> None:
+    """A third reader waits when the pool holds two connections."""
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", read_pool_size=2)
+    read_started = threading.Event()
+
+    def read_size() -> int:
+        read_started.set()
+        return queue.qsize()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with queue._read_connection() as first, queue._read_connection() as second:
+            assert first is not second
+            result = executor.submit(read_size)
+            assert read_started.wait(timeout=5)
+            assert not result.done()
+
+        assert result.result(timeout=5) == 0
+
+    assert queue._connections.open_read_count == 2
+    queue.close()
+
+
+def test_idle_read_connections_are_closed(tmp_path: Path, monkeypatch) -> None:
+    """Returning a connection closes others that have been idle too long."""
+    monkeypatch.setattr(litequeue, "_READ_CONNECTION_IDLE_SECONDS", -1.0)
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3")
+
+    with queue._read_connection() as first:
+        with queue._read_connection():
+            pass
+        assert queue._connections.open_read_count == 2
+
+    assert queue._connections.open_read_count == 1
+    assert [
+        connection for connection, _ in queue._connections.idle_read_connections
+    ] == [first]
+    assert queue.qsize() == 0
+    queue.close()
+
+
 def test_read_connection_is_returned_to_pool(tmp_path: Path) -> None:
     """The eleventh reader waits until one of ten checked-out slots returns."""
     queue = LiteQueue(filename=tmp_path / "queue.sqlite3")
@@ -314,3 +388,136 @@ def test_close_waits_for_checked_out_read_connection(tmp_path: Path) -> None:
         allow_read_to_finish.set()
         read_result.result()
         close_result.result()
+
+
+def test_concurrent_consumers_keep_one_message_in_flight_per_partition(
+    shared_queue: LiteQueue,
+) -> None:
+    """Consumers claim partitions in order and never overlap inside one."""
+    queue = shared_queue
+    partition_count = 8
+    messages_per_partition = 16
+    for index in range(messages_per_partition):
+        for partition in range(partition_count):
+            queue.put(f"{partition}:{index}", partition_key=str(partition))
+
+    state_lock = threading.Lock()
+    in_flight: set[str] = set()
+    processed: dict[str, list[int]] = {str(key): [] for key in range(partition_count)}
+    overlaps: list[str] = []
+
+    def consume() -> None:
+        while True:
+            message = queue.pop()
+            if message is None:
+                with state_lock:
+                    total = sum(len(items) for items in processed.values())
+                if total == partition_count * messages_per_partition:
+                    return
+                time.sleep(0.001)
+                continue
+
+            partition, index = message.data.split(":")
+            with state_lock:
+                if partition in in_flight:
+                    overlaps.append(partition)
+                in_flight.add(partition)
+                processed[partition].append(int(index))
+            # Simulated work keeps the partition marked long enough for a
+            # second claim of it to be recorded as an overlap.
+            time.sleep(0.001)
+            # done() runs under the state lock, so a consumer that claims the
+            # partition right after it cannot record it before the discard.
+            with state_lock:
+                queue.done(message.message_id)
+                in_flight.discard(partition)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = [executor.submit(consume) for _ in range(8)]
+        for result in results:
+            result.result(timeout=30)
+
+    assert overlaps == []
+    expected_order = list(range(messages_per_partition))
+    assert all(indexes == expected_order for indexes in processed.values())
+
+
+def put_from_process(queue: LiteQueue, data: str) -> str:
+    """Put a message with a queue that was pickled into this process."""
+    try:
+        return queue.put(data).message_id
+    finally:
+        queue.close()
+
+
+def test_queues_pickle_as_database_and_options(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3", maxsize=10, timeout=2.0)
+    named = queue.named_queue("emails")
+    log = queue.log("events")
+    sharded = ShardedLiteQueue(
+        [tmp_path / "shard-0.sqlite3", tmp_path / "shard-1.sqlite3"], maxsize=5
+    )
+    queue.put("default")
+    named.put("email")
+    log.append("event")
+    sharded.put("job", partition_key="a")
+
+    queue_copy = pickle.loads(pickle.dumps(queue))
+    named_copy = pickle.loads(pickle.dumps(named))
+    log_copy = pickle.loads(pickle.dumps(log))
+    sharded_copy = pickle.loads(pickle.dumps(sharded))
+    try:
+        assert queue_copy.conn is not queue.conn
+        assert queue_copy.maxsize == 10
+        assert require_message(queue_copy.pop()).data == "default"
+        assert named_copy.name == "emails"
+        assert require_message(named_copy.pop()).data == "email"
+        assert [entry.data for entry in log_copy.read("group")] == ["event"]
+        assert require_message(sharded_copy.pop()).data == "job"
+    finally:
+        for copied in (queue_copy, log_copy._queue, sharded_copy):
+            copied.close()
+        queue.close()
+        sharded.close()
+
+
+def test_queue_can_be_passed_to_spawned_processes(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3")
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+        message_ids = list(
+            executor.map(put_from_process, [queue, queue], ["first", "second"])
+        )
+
+    messages = [queue.get(message_id) for message_id in message_ids]
+    assert sorted(require_message(message).data for message in messages) == [
+        "first",
+        "second",
+    ]
+    queue.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="os.fork() is not available")
+def test_forked_child_reopens_queue_connections(tmp_path: Path) -> None:
+    queue = LiteQueue(filename=tmp_path / "queue.sqlite3")
+    queue.put("before fork")
+    parent_connection = queue.conn
+
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 1
+        try:
+            if queue.conn is not parent_connection and queue.qsize() == 1:
+                queue.put("from child")
+                exit_code = 0
+            queue.close()
+        finally:
+            os._exit(exit_code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert queue.conn is parent_connection
+    assert queue.qsize() == 2
+    assert require_message(queue.pop()).data == "before fork"
+    assert require_message(queue.pop()).data == "from child"
+    queue.close()